@@ -28,3 +28,14 @@ class FFAirport(Document):
             if not (-180 <= self.lon <= 180):
                 frappe.throw("Longitude must be between -180 and 180")
 
+    def on_update(self):
+        """Rebuild routing transfers between cities and airports"""
+        from freight_forwarding.utils.rate.routing import invalidate_transfers
+
+        invalidate_transfers()
+
+    def on_trash(self):
+        """Rebuild routing transfers between cities and airports"""
+        from freight_forwarding.utils.rate.routing import invalidate_transfers
+
+        invalidate_transfers()
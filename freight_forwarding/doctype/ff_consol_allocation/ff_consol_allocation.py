@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, PT Kurhanz Trans and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class FFConsolAllocation(Document):
+    """FF Consol Allocation DocType (ledger maintained by utils.consol.ledger)"""
+
+    pass
+
+
+def on_doctype_update():
+    """One entry per (source, charge, project); lookups by consol"""
+    frappe.db.add_unique(
+        "FF Consol Allocation", ["source", "charge", "project"], constraint_name="allocation_key"
+    )
+    frappe.db.add_index("FF Consol Allocation", ["consol_shipment", "source"], index_name="consol_source_index")
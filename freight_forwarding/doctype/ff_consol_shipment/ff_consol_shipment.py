@@ -4,6 +4,9 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import flt
+
+from freight_forwarding.utils.consol.allocation import get_rule_percentages
 
 
 class FFConsolShipment(Document):
@@ -59,9 +62,11 @@ class FFConsolShipment(Document):
                     )
 
     def validate_allocation_rules(self):
-        """Validate allocation rules"""
+        """Validate allocation rules and manual percentages"""
         if not self.allocation_rules or len(self.allocation_rules) == 0:
             # Allocation rules are optional
+            if self.get("allocation_percentages"):
+                frappe.throw("Manual Allocation Percentages need a manual_pct Allocation Rule.")
             return
 
         # Validate allocation methods
@@ -72,7 +77,50 @@ class FFConsolShipment(Document):
                     f"Invalid allocation method '{rule.method}'. Valid methods are: {', '.join(valid_methods)}"
                 )
 
-            if rule.method == "manual_pct":
-                if not rule.manual_percentage:
-                    frappe.throw("Manual percentage is required when allocation method is 'manual_pct'.")
+        self.validate_allocation_percentages()
+
+    def validate_allocation_percentages(self):
+        """Each manual_pct rule needs member percentages summing to 100"""
+        percentages = {}
+        for row in self.get("allocation_percentages") or []:
+            percentages.setdefault(row.charge, {})
+            if row.project in percentages[row.charge]:
+                frappe.throw(f"Duplicate manual percentage for project {row.project} and charge {row.charge}.")
+            percentages[row.charge][row.project] = flt(row.percentage)
+
+        members = {m.project for m in self.consol_members if m.project}
+        manual_charges = set()
+
+        for rule in self.allocation_rules:
+            if rule.method != "manual_pct":
+                continue
+
+            charges = [c for c in (rule.item, rule.charge_code) if c]
+            if not charges:
+                frappe.throw("A manual_pct allocation rule needs a Charge Code or Item.")
+            manual_charges.update(charges)
+
+            if rule.item and rule.charge_code and percentages.get(rule.item) and percentages.get(rule.charge_code):
+                frappe.throw(
+                    f"Manual percentages of the manual_pct rule for {rule.item} are entered for both its item "
+                    f"and its charge code {rule.charge_code}. Enter them for one of them only."
+                )
+
+            rule_percentages = get_rule_percentages(rule, percentages)
+            if not rule_percentages:
+                frappe.throw(
+                    f"Manual percentages per member are required for the manual_pct rule of {charges[0]}."
+                )
+
+            total = sum(rule_percentages.values())
+            if abs(total - 100) > 0.01:
+                frappe.throw(
+                    f"Manual percentages for {charges[0]} add up to {total:g}%, they must add up to 100%."
+                )
 
+        for charge, rows in percentages.items():
+            if charge not in manual_charges:
+                frappe.throw(f"Manual percentages for {charge} have no manual_pct Allocation Rule.")
+            for project in rows:
+                if project not in members:
+                    frappe.throw(f"Project {project} in Manual Allocation Percentages is not a Consol Member.")
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, PT Kurhanz Trans and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+from freight_forwarding.utils.rate.adjustments import invalidate_adjustments
+
+
+class FFFuelIndex(Document):
+    """FF Fuel Index DocType"""
+
+    def validate(self):
+        """Validate fuel index"""
+        self.validate_unique_effective_date()
+
+    def validate_unique_effective_date(self):
+        """Validate one entry per mode and effective date"""
+        duplicate = frappe.db.exists(
+            "FF Fuel Index",
+            {
+                "mode": self.mode,
+                "effective_date": self.effective_date,
+                "name": ["!=", self.name],
+            }
+        )
+        if duplicate:
+            frappe.throw(
+                f"Fuel Index {duplicate} already exists for {self.mode} on {self.effective_date}."
+            )
+
+    def on_update(self):
+        """Invalidate cached fuel adjustments"""
+        invalidate_adjustments()
+
+    def on_trash(self):
+        """Invalidate cached fuel adjustments"""
+        invalidate_adjustments()
@@ -5,6 +5,8 @@
 import frappe
 from frappe.model.document import Document
 
+from freight_forwarding.utils.rate.pricing_rules import invalidate_pricing_rules
+
 
 class FFPricingRule(Document):
     """FF Pricing Rule DocType"""
@@ -14,6 +16,14 @@ class FFPricingRule(Document):
         self.validate_validity_dates()
         self.validate_markup_discount()
 
+    def on_update(self):
+        """Invalidate the cached pricing rule matcher"""
+        invalidate_pricing_rules()
+
+    def on_trash(self):
+        """Invalidate the cached pricing rule matcher"""
+        invalidate_pricing_rules()
+
     def validate_validity_dates(self):
         """Validate validity_from < validity_to"""
         if self.validity_from and self.validity_to:
@@ -5,6 +5,10 @@
 import frappe
 from frappe.model.document import Document
 
+from freight_forwarding.utils.rate.base_rates import BaseRateTable, format_weight_break
+from freight_forwarding.utils.rate.contract_versions import record_contract_version
+from freight_forwarding.utils.rate.rate_index import refresh_contract
+
 
 class FFRateContract(Document):
     """FF Rate Contract DocType"""
@@ -13,6 +17,7 @@ class FFRateContract(Document):
         """Validate rate contract"""
         self.validate_validity_dates()
         self.validate_mode_lanes()
+        self.validate_weight_breaks()
 
     def validate_validity_dates(self):
         """Validate validity_from < validity_to"""
@@ -47,3 +52,30 @@ class FFRateContract(Document):
                         f"Rate Lane {lane.idx}: Origin and Destination are required for Land mode."
                     )
 
+    def validate_weight_breaks(self):
+        """Validate that weight breaks of a lane/container type do not overlap"""
+        table = BaseRateTable(self.rate_bases or [])
+        lane_idx = {lane.name: lane.idx for lane in self.rate_lanes}
+
+        for (rate_lane, container_type), breaks in table.breaks.items():
+            for first, second in breaks.overlaps():
+                frappe.throw(
+                    f"Rate Lane {lane_idx.get(rate_lane, rate_lane)}"
+                    f"{' (' + container_type + ')' if container_type else ''}: "
+                    f"weight break {format_weight_break(*first)} overlaps {format_weight_break(*second)}."
+                )
+
+    def on_update(self):
+        """Record a contract version and reindex the lanes it changed"""
+        delta = record_contract_version(self)
+        refresh_contract(self.name, delta=delta)
+
+    def on_trash(self):
+        """Drop this contract and its versions from the compiled rate index"""
+        frappe.db.delete("FF Rate Contract Version", {"rate_contract": self.name})
+        refresh_contract(self.name, deleted=True)
+
+    def after_rename(self, old_name, new_name, merge=False):
+        """Move this contract to its new name in the compiled rate index"""
+        refresh_contract(old_name, deleted=True)
+        refresh_contract(new_name)
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, PT Kurhanz Trans and contributors
+# For license information, please see license.txt
+
+from frappe.model.document import Document
+
+
+class FFRateContractVersion(Document):
+    """FF Rate Contract Version DocType (recorded by utils.rate.contract_versions)"""
+
+    pass
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, PT Kurhanz Trans and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class FFRateCube(Document):
+    """FF Rate Cube DocType (generated by utils.rate.rate_cube)"""
+
+    pass
+
+
+def on_doctype_update():
+    """Composite indexes for lane lookups and per-contract refreshes"""
+    frappe.db.add_index(
+        "FF Rate Cube",
+        ["mode", "lane_type", "origin", "destination", "validity_from"],
+        index_name="lane_lookup_index",
+    )
+    frappe.db.add_index("FF Rate Cube", ["rate_contract"], index_name="rate_contract_index")
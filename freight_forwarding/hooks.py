@@ -85,6 +85,8 @@ doctype_js = {
 # before_install = "freight_forwarding.install.before_install"
 # after_install = "freight_forwarding.install.after_install"
 
+after_migrate = ["freight_forwarding.utils.rate.warmup.after_migrate"]
+
 # Uninstallation
 # ------------
 
@@ -166,28 +168,27 @@ doc_events = {
         "on_update": "freight_forwarding.server_scripts.crm_workflow.create_project_from_quotation",
         "validate": "freight_forwarding.server_scripts.crm_workflow.validate_quotation_items",
     },
+    "Currency Exchange": {
+        "on_update": "freight_forwarding.utils.rate.adjustments.invalidate_adjustments",
+        "on_trash": "freight_forwarding.utils.rate.adjustments.invalidate_adjustments",
+    },
+    "Item Group": {
+        "on_update": "freight_forwarding.utils.item_groups.invalidate_item_groups",
+        "on_trash": "freight_forwarding.utils.item_groups.invalidate_item_groups",
+    },
 }
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-#   "all": [
-#     "freight_forwarding.tasks.all"
-#   ],
-#   "daily": [
-#     "freight_forwarding.tasks.daily"
-#   ],
-#   "hourly": [
-#     "freight_forwarding.tasks.hourly"
-#   ],
-#   "weekly": [
-#     "freight_forwarding.tasks.weekly"
-#   ],
-#   "monthly": [
-#     "freight_forwarding.tasks.monthly"
-#   ]
-# }
+scheduler_events = {
+    "hourly": [
+        "freight_forwarding.utils.rate.rate_cube.enqueue_rate_cube_build",
+    ],
+    "daily": [
+        "freight_forwarding.utils.rate.rate_index.expire_rate_contracts",
+    ],
+}
 
 # Testing
 # -------
@@ -200,11 +201,25 @@ doc_events = {
 override_whitelisted_methods = {
     "freight_forwarding.project.api.list_by_project": "freight_forwarding.project.api.list_by_project",
     "freight_forwarding.project.api.find_rates": "freight_forwarding.project.api.find_rates",
+    "freight_forwarding.project.api.find_rates_page": "freight_forwarding.project.api.find_rates_page",
+    "freight_forwarding.project.api.find_rates_batch": "freight_forwarding.project.api.find_rates_batch",
+    "freight_forwarding.project.api.get_rate_timeline": "freight_forwarding.project.api.get_rate_timeline",
+    "freight_forwarding.project.api.get_quote_cache_stats": "freight_forwarding.project.api.get_quote_cache_stats",
+    "freight_forwarding.project.api.get_rate_metrics": "freight_forwarding.project.api.get_rate_metrics",
+    "freight_forwarding.project.api.reset_rate_metrics": "freight_forwarding.project.api.reset_rate_metrics",
+    "freight_forwarding.project.api.find_routes": "freight_forwarding.project.api.find_routes",
+    "freight_forwarding.project.api.get_rate_cube_state": "freight_forwarding.project.api.get_rate_cube_state",
+    "freight_forwarding.project.api.get_rate_index_stats": "freight_forwarding.project.api.get_rate_index_stats",
+    "freight_forwarding.project.api.get_warmup_report": "freight_forwarding.project.api.get_warmup_report",
+    "freight_forwarding.project.api.rebuild_rate_cube": "freight_forwarding.project.api.rebuild_rate_cube",
+    "freight_forwarding.project.api.simulate_repricing": "freight_forwarding.project.api.simulate_repricing",
     "freight_forwarding.utils.import_data.import_ports_bootstrap": "freight_forwarding.utils.import_data.import_ports_bootstrap",
     "freight_forwarding.utils.import_data.import_airports_bootstrap": "freight_forwarding.utils.import_data.import_airports_bootstrap",
+    "freight_forwarding.utils.rate.rate_sheet_import.enqueue_rate_sheet_import": "freight_forwarding.utils.rate.rate_sheet_import.enqueue_rate_sheet_import",
     "freight_forwarding.utils.consol.allocation.split_purchase_invoice": "freight_forwarding.utils.consol.allocation.split_purchase_invoice",
     "freight_forwarding.utils.consol.allocation.split_expense_claim": "freight_forwarding.utils.consol.allocation.split_expense_claim",
     "freight_forwarding.utils.consol.si_generation.create_si_per_member": "freight_forwarding.utils.consol.si_generation.create_si_per_member",
+    "freight_forwarding.utils.consol.jobs.enqueue_consol_job": "freight_forwarding.utils.consol.jobs.enqueue_consol_job",
     "freight_forwarding.utils.backfill.data_backfill.backfill_division": "freight_forwarding.utils.backfill.data_backfill.backfill_division",
     "freight_forwarding.utils.backfill.data_backfill.backfill_project_links": "freight_forwarding.utils.backfill.data_backfill.backfill_project_links",
     "freight_forwarding.utils.backfill.data_backfill.backfill_expense_claim_project": "freight_forwarding.utils.backfill.data_backfill.backfill_expense_claim_project",
@@ -241,7 +256,7 @@ override_doctype_dashboards = {
 
 # Request Events
 # ----------------
-# before_request = ["freight_forwarding.utils.before_request"]
+before_request = ["freight_forwarding.utils.rate.warmup.warm_up_worker"]
 # after_request = ["freight_forwarding.utils.after_request"]
 
 # Job Events
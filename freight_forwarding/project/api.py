@@ -6,6 +6,9 @@ Project API endpoints
 import frappe
 from frappe import _
 
+# Maximum lanes accepted by find_rates_batch in one call
+MAX_BATCH_REQUESTS = 1000
+
 
 @frappe.whitelist()
 def list_by_project(doctype, project, fields=None, limit=20):
@@ -69,7 +72,9 @@ def list_by_project(doctype, project, fields=None, limit=20):
 
 
 @frappe.whitelist()
-def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None, container_type=None):
+def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None, container_type=None,
+               division=None, customer=None, commodity=None, limit=None, dwell_days=None, detention_days=None,
+               containers=None, debug=0):
     """
     Find rates for a given lane.
     
@@ -82,13 +87,79 @@ def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=No
         weight: Weight in kg (optional)
         cbm: Volume in CBM (optional)
         container_type: Container type for Sea (optional)
+        division: Division for pricing rule matching (optional)
+        customer: Customer for pricing rule matching (optional)
+        commodity: Commodity for pricing rule matching (optional)
+        limit: Return only the best `limit` options (optional)
+        dwell_days: Projected days at the destination port; adds expected
+            D&D (dd_cost, landed_cost) and ranks by landed cost; contracts
+            without free-time terms for the port rank last, flagged
+            dd_unknown (optional)
+        detention_days: Projected days out of the terminal (optional)
+        containers: Number of containers for D&D (default: 1)
+        debug: Profile the call and return {"options", "profile"} with
+            per-stage timings and query counts (default: 0)
     
     Returns:
         list: Ranked rate options with buy/sell prices
     """
+    from frappe.utils import cint
+    
+    from freight_forwarding.utils.rate.profiling import rate_profile
     from freight_forwarding.utils.rate.rate_engine import find_rates as engine_find_rates
     
-    return engine_find_rates(
+    with rate_profile("find_rates", force=cint(debug)) as profile:
+        options = engine_find_rates(
+            lane_type=lane_type,
+            origin=origin,
+            destination=destination,
+            mode=mode,
+            date_filter=date_filter,
+            weight=weight,
+            cbm=cbm,
+            container_type=container_type,
+            division=division,
+            customer=customer,
+            commodity=commodity,
+            limit=limit,
+            dwell_days=dwell_days,
+            detention_days=detention_days,
+            containers=containers
+        )
+    
+    if cint(debug):
+        return {"options": options, "profile": profile.as_dict()}
+    
+    return options
+
+
+@frappe.whitelist()
+def find_rates_page(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None,
+                    container_type=None, division=None, customer=None, commodity=None, page_length=20, cursor=None):
+    """
+    One page of the full ranked option list for a lane.
+    
+    Args:
+        lane_type: "Sea", "Air", or "Land"
+        origin: POL (for Sea), AOO (for Air), or origin city (for Land)
+        destination: POD (for Sea), AOD (for Air), or destination city (for Land)
+        mode: "Sea", "Air", or "Land"
+        date_filter: Date to check validity (default: today)
+        weight: Weight in kg (optional)
+        cbm: Volume in CBM (optional)
+        container_type: Container type for Sea (optional)
+        division: Division for pricing rule matching (optional)
+        customer: Customer for pricing rule matching (optional)
+        commodity: Commodity for pricing rule matching (optional)
+        page_length: Options per page (default: 20)
+        cursor: `next_cursor` returned by the previous page (optional)
+    
+    Returns:
+        dict: {"options": list, "next_cursor": str or None}
+    """
+    from freight_forwarding.utils.rate.rate_engine import find_rates_page as engine_find_rates_page
+    
+    return engine_find_rates_page(
         lane_type=lane_type,
         origin=origin,
         destination=destination,
@@ -96,5 +167,295 @@ def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=No
         date_filter=date_filter,
         weight=weight,
         cbm=cbm,
-        container_type=container_type
+        container_type=container_type,
+        division=division,
+        customer=customer,
+        commodity=commodity,
+        page_length=page_length,
+        cursor=cursor
+    )
+
+
+@frappe.whitelist()
+def find_rates_batch(requests, date_filter=None, division=None, customer=None, commodity=None, debug=0):
+    """
+    Find rates for many lanes in one call (multi-leg quotations, tenders).
+    
+    All requests are resolved against one shared snapshot of rate contracts
+    and pricing rules.
+    
+    Args:
+        requests: JSON list of {key, lane_type, origin, destination, mode,
+            date_filter, weight, cbm, container_type, division, customer, commodity,
+            limit, dwell_days, detention_days, containers}
+        date_filter: Default date for all requests (default: today)
+        division: Default division for pricing rule matching
+        customer: Default customer for pricing rule matching
+        commodity: Default commodity for pricing rule matching
+        debug: Add "profile" (per-stage timings and query counts) to the
+            response (default: 0)
+    
+    Returns:
+        dict: {"results": {key: options}, "errors": {key: message}}
+    """
+    from frappe.utils import cint
+    
+    from freight_forwarding.utils.rate.profiling import rate_profile
+    from freight_forwarding.utils.rate.rate_engine import find_rates_batch as engine_find_rates_batch
+    
+    requests = frappe.parse_json(requests) or []
+    
+    if not isinstance(requests, list):
+        frappe.throw(_("Requests must be a list of lanes."))
+    
+    if len(requests) > MAX_BATCH_REQUESTS:
+        frappe.throw(_("A batch can contain at most {0} lanes.").format(MAX_BATCH_REQUESTS))
+    
+    with rate_profile("find_rates_batch", force=cint(debug)) as profile:
+        response = engine_find_rates_batch(
+            requests,
+            date_filter=date_filter,
+            division=division,
+            customer=customer,
+            commodity=commodity
+        )
+    
+    if cint(debug):
+        response["profile"] = profile.as_dict()
+    
+    return response
+
+
+@frappe.whitelist()
+def get_rate_timeline(lane_type, origin, destination, mode, from_date, to_date, weight=None, cbm=None,
+                      container_type=None, division=None, customer=None, commodity=None):
+    """
+    Historical rate timeline for a lane.
+    
+    Args:
+        lane_type: "Sea", "Air", or "Land"
+        origin: POL (for Sea), AOO (for Air), or origin city (for Land)
+        destination: POD (for Sea), AOD (for Air), or destination city (for Land)
+        mode: "Sea", "Air", or "Land"
+        from_date: First date of the range
+        to_date: Last date of the range
+        weight: Weight in kg (optional)
+        cbm: Volume in CBM (optional)
+        container_type: Container type for Sea (optional)
+        division: Division for pricing rule matching (optional)
+        customer: Customer for pricing rule matching (optional)
+        commodity: Commodity for pricing rule matching (optional)
+    
+    Returns:
+        list: Periods as {from_date, to_date, best, options}, one per
+            change in valid contracts or pricing rules
+    """
+    from freight_forwarding.utils.rate.rate_engine import get_rate_timeline as engine_get_rate_timeline
+    
+    return engine_get_rate_timeline(
+        lane_type=lane_type,
+        origin=origin,
+        destination=destination,
+        mode=mode,
+        from_date=from_date,
+        to_date=to_date,
+        weight=weight,
+        cbm=cbm,
+        container_type=container_type,
+        division=division,
+        customer=customer,
+        commodity=commodity
+    )
+
+
+@frappe.whitelist()
+def find_routes(origin, destination, date_filter=None, weight=None, cbm=None, container_type=None,
+                k=3, metric="cost", max_legs=3, division=None, customer=None, commodity=None):
+    """
+    Find the best multi-leg itineraries (e.g. Land pickup, Sea POL to POD,
+    Land delivery) between two locations.
+    
+    Args:
+        origin: Port/airport code or origin city
+        destination: Port/airport code or destination city
+        date_filter: Date to check validity (default: today)
+        weight: Weight in kg (optional)
+        cbm: Volume in CBM (optional)
+        container_type: Container type for Sea legs (optional)
+        k: Number of itineraries (default: 3)
+        metric: "cost" or "transit" (default: "cost")
+        max_legs: Maximum legs per itinerary (default: 3)
+        division: Division for pricing rule matching (optional)
+        customer: Customer for pricing rule matching (optional)
+        commodity: Commodity for pricing rule matching (optional)
+    
+    Returns:
+        list: Itineraries as {legs, total_buy_rate, total_sell_rate,
+            total_transit_days, currency}
+    """
+    from freight_forwarding.utils.rate.routing import find_routes as engine_find_routes
+    
+    return engine_find_routes(
+        origin=origin,
+        destination=destination,
+        date_filter=date_filter,
+        weight=weight,
+        cbm=cbm,
+        container_type=container_type,
+        k=k,
+        metric=metric,
+        max_legs=max_legs,
+        division=division,
+        customer=customer,
+        commodity=commodity
     )
+
+
+@frappe.whitelist()
+def get_quote_cache_stats():
+    """
+    Quote cache counters of the worker serving this request.
+    
+    Returns:
+        dict: size, max_size, ttl, hits, misses, stale, evictions, hit_ratio
+    """
+    from freight_forwarding.utils.rate.quote_cache import get_quote_cache
+    
+    return get_quote_cache().stats()
+
+
+@frappe.whitelist()
+def get_rate_metrics():
+    """
+    Rate engine latency histograms aggregated over all workers.
+    
+    Returns:
+        dict: {operation: {series: {count, sum_ms, avg_ms, p50_ms, p95_ms, buckets}}}
+    """
+    from freight_forwarding.utils.rate.profiling import get_rate_metrics as engine_get_rate_metrics
+    
+    return engine_get_rate_metrics()
+
+
+@frappe.whitelist()
+def reset_rate_metrics():
+    """
+    Clear the rate engine latency histograms (FF-ADMIN only).
+    """
+    from freight_forwarding.utils.rate.profiling import reset_rate_metrics as engine_reset_rate_metrics
+    
+    frappe.only_for("FF-ADMIN")
+    engine_reset_rate_metrics()
+    
+    return {"reset": True}
+
+
+@frappe.whitelist()
+def get_rate_index_stats():
+    """
+    Size and memory estimate of the rate index in the worker serving this request.
+    
+    Returns:
+        dict: contracts, lanes, lane_keys, memory_mb, memory_budget_mb, within_budget
+    """
+    from freight_forwarding.utils.rate.rate_index import get_rate_index
+    
+    return get_rate_index().stats()
+
+
+@frappe.whitelist()
+def get_warmup_report():
+    """
+    Rate cache warmup report of every worker since the last migrate.
+    
+    Returns:
+        dict: {worker: {site, started_at, seconds, memory_mb, rss_mb,
+            memory_budget_mb, within_budget, steps}}
+    """
+    from freight_forwarding.utils.rate.warmup import get_warmup_report as engine_get_warmup_report
+    
+    return engine_get_warmup_report()
+
+
+@frappe.whitelist()
+def get_rate_cube_state():
+    """
+    Build state of the rate cube.
+    
+    Returns:
+        dict: index_version, built_at, contracts, fresh
+    """
+    from freight_forwarding.utils.rate.rate_cube import get_rate_cube_state as engine_get_rate_cube_state
+    
+    return engine_get_rate_cube_state()
+
+
+@frappe.whitelist()
+def rebuild_rate_cube():
+    """
+    Rebuild the rate cube in the background (FF-ADMIN only).
+    """
+    from freight_forwarding.utils.rate.rate_cube import enqueue_rate_cube_build
+    
+    frappe.only_for("FF-ADMIN")
+    enqueue_rate_cube_build(force=True)
+    
+    return {"queued": True}
+
+
+@frappe.whitelist()
+def simulate_repricing(contracts, projects=None, from_date=None, to_date=None, margin_basis="repriced",
+                       ignore_validity=1, include_details=0, dwell_days=None, detention_days=None, containers=None):
+    """
+    What-if repricing of historical Projects on a set of rate contracts,
+    run in the background (FF-MANAGER, FF-ADMIN).
+    
+    The result is sent to the user as the realtime event
+    "ff_repricing_simulation".
+    
+    Args:
+        contracts: JSON list of FF Rate Contract names
+        projects: JSON list of Project names (optional)
+        from_date: First ETD of the range (required without projects)
+        to_date: Last ETD of the range (required without projects)
+        margin_basis: "repriced" (sell - buy) or "billed" (billed - buy)
+        ignore_validity: Apply contracts outside their validity window (default: 1)
+        include_details: Include per-project results (default: 0)
+        dwell_days: Projected days at the destination port; adds expected
+            D&D to each shipment's simulated cost (optional)
+        detention_days: Projected days out of the terminal (optional)
+        containers: Containers per shipment for D&D (default: 1)
+    
+    Returns:
+        dict: {"queued": True}
+    """
+    from frappe.utils import cint
+    
+    frappe.only_for(("FF-MANAGER", "FF-ADMIN"))
+    
+    contracts = frappe.parse_json(contracts) or []
+    projects = frappe.parse_json(projects) if projects else None
+    
+    if not contracts:
+        frappe.throw(_("Select at least one Rate Contract."))
+    if not projects and not (from_date and to_date):
+        frappe.throw(_("Select projects or a date range."))
+    
+    frappe.enqueue(
+        "freight_forwarding.utils.rate.simulator.run_simulation",
+        queue="long",
+        timeout=3600,
+        user=frappe.session.user,
+        contracts=contracts,
+        projects=projects,
+        from_date=from_date,
+        to_date=to_date,
+        margin_basis=margin_basis,
+        ignore_validity=cint(ignore_validity),
+        include_details=cint(include_details),
+        dwell_days=dwell_days,
+        detention_days=detention_days,
+        containers=containers,
+    )
+    
+    return {"queued": True}
@@ -1,12 +1,101 @@
 // -*- coding: utf-8 -*-
 /**
  * Client Script for FF Consol Shipment
+ *
+ * Splits and Sales Invoice creation run as background jobs; their progress
+ * arrives as realtime events and is shown on the form dashboard.
  */
 
+const CONSOL_JOB_TITLES = {
+    split_purchase_invoice: __("Splitting Purchase Invoice"),
+    split_expense_claim: __("Splitting Expense Claim"),
+    create_si_per_member: __("Creating Sales Invoices"),
+    resplit_consol_shipment: __("Updating splits")
+};
+
+const CONSOL_JOB_RESULTS = {
+    split_purchase_invoice: __("Purchase Invoice split successfully. Created {0} Purchase Invoices."),
+    split_expense_claim: __("Expense Claim split successfully. Created {0} Expense Claims."),
+    create_si_per_member: __("Created {0} Sales Invoices."),
+    resplit_consol_shipment: __("Splits updated. Created {0} documents.")
+};
+
+function enqueue_consol_job(frm, operation, source) {
+    frappe.call({
+        method: "freight_forwarding.utils.consol.jobs.enqueue_consol_job",
+        args: {
+            consol_shipment: frm.doc.name,
+            operation: operation,
+            source: source
+        },
+        callback: function(r) {
+            if (!r.message) {
+                return;
+            }
+            if (r.message.queued) {
+                frappe.show_alert({
+                    message: __("{0} in the background", [CONSOL_JOB_TITLES[operation]]),
+                    indicator: "blue"
+                });
+            } else {
+                frappe.show_alert({
+                    message: __("{0} is already running", [CONSOL_JOB_TITLES[operation]]),
+                    indicator: "orange"
+                });
+            }
+        }
+    });
+}
+
 frappe.ui.form.on("FF Consol Shipment", {
+    setup: function(frm) {
+        // Manual percentages are given per consol member's project
+        frm.set_query("project", "allocation_percentages", function() {
+            return {
+                filters: {
+                    name: ["in", (frm.doc.consol_members || []).map(m => m.project).filter(Boolean)]
+                }
+            };
+        });
+
+        frappe.realtime.on("ff_consol_job_progress", function(data) {
+            if (data.consol_shipment !== frm.doc.name) {
+                return;
+            }
+            frm.dashboard.show_progress(
+                CONSOL_JOB_TITLES[data.operation],
+                data.percent,
+                data.total ? __("{0} of {1} projects", [data.done, data.total]) : __("Starting")
+            );
+        });
+
+        frappe.realtime.on("ff_consol_job", function(data) {
+            if (data.consol_shipment !== frm.doc.name) {
+                return;
+            }
+            frm.dashboard.hide_progress(CONSOL_JOB_TITLES[data.operation]);
+            if (data.error) {
+                frappe.msgprint({
+                    title: __("Failed"),
+                    message: __("{0} failed. Run it again to resume; see the Error Log for details.",
+                        [CONSOL_JOB_TITLES[data.operation]]),
+                    indicator: "red"
+                });
+                return;
+            }
+            frappe.msgprint({
+                title: __("Success"),
+                message: __(CONSOL_JOB_RESULTS[data.operation], [data.created.length]),
+                indicator: "green"
+            });
+            frm.reload_doc();
+        });
+    },
+
     refresh: function(frm) {
-        // Add button to split Purchase Invoice
-        if (frm.doc.docstatus === 1 && !frm.is_new()) {
+        // FF Consol Shipment is not submittable: offer the actions once saved
+        if (!frm.is_new()) {
+            // Add button to split Purchase Invoice
             frm.add_custom_button(__("Split Purchase Invoice"), function() {
                 frappe.prompt({
                     fieldtype: "Link",
@@ -19,23 +108,7 @@ frappe.ui.form.on("FF Consol Shipment", {
                         docstatus: 1
                     }
                 }, function(data) {
-                    frappe.call({
-                        method: "freight_forwarding.utils.consol.allocation.split_purchase_invoice",
-                        args: {
-                            consol_shipment: frm.doc.name,
-                            purchase_invoice_name: data.purchase_invoice
-                        },
-                        callback: function(r) {
-                            if (r.message) {
-                                frappe.msgprint({
-                                    title: __("Success"),
-                                    message: __("Purchase Invoice split successfully. Created {0} Purchase Invoices.", [r.message.length]),
-                                    indicator: "green"
-                                });
-                                frm.reload_doc();
-                            }
-                        }
-                    });
+                    enqueue_consol_job(frm, "split_purchase_invoice", data.purchase_invoice);
                 });
             }, __("Actions"));
 
@@ -52,51 +125,24 @@ frappe.ui.form.on("FF Consol Shipment", {
                         docstatus: 1
                     }
                 }, function(data) {
-                    frappe.call({
-                        method: "freight_forwarding.utils.consol.allocation.split_expense_claim",
-                        args: {
-                            consol_shipment: frm.doc.name,
-                            expense_claim_name: data.expense_claim
-                        },
-                        callback: function(r) {
-                            if (r.message) {
-                                frappe.msgprint({
-                                    title: __("Success"),
-                                    message: __("Expense Claim split successfully. Created {0} Expense Claims.", [r.message.length]),
-                                    indicator: "green"
-                                });
-                                frm.reload_doc();
-                            }
-                        }
-                    });
+                    enqueue_consol_job(frm, "split_expense_claim", data.expense_claim);
                 });
             }, __("Actions"));
 
+            // Add button to re-split after members' weights or volumes changed
+            frm.add_custom_button(__("Update Splits"), function() {
+                enqueue_consol_job(frm, "resplit_consol_shipment");
+            }, __("Actions"));
+
             // Add button to create Sales Invoices
             frm.add_custom_button(__("Create Sales Invoices"), function() {
                 frappe.confirm(
                     __("This will create Sales Invoice for each consol member. Continue?"),
                     function() {
-                        frappe.call({
-                            method: "freight_forwarding.utils.consol.si_generation.create_si_per_member",
-                            args: {
-                                consol_shipment: frm.doc.name
-                            },
-                            callback: function(r) {
-                                if (r.message) {
-                                    frappe.msgprint({
-                                        title: __("Success"),
-                                        message: __("Created {0} Sales Invoices.", [r.message.length]),
-                                        indicator: "green"
-                                    });
-                                    frm.reload_doc();
-                                }
-                            }
-                        });
+                        enqueue_consol_job(frm, "create_si_per_member");
                     }
                 );
             }, __("Actions"));
         }
     }
 });
-
@@ -116,7 +116,10 @@ function find_rates_for_quotation(frm) {
             origin: origin,
             destination: destination,
             mode: mode,
-            date_filter: frm.doc.valid_till || null
+            date_filter: frm.doc.valid_till || null,
+            division: frm.doc.division || null,
+            customer: frm.doc.quotation_to === 'Customer' ? frm.doc.party_name : null,
+            limit: 10
         },
         callback: function(r) {
             if (r.message && r.message.length > 0) {
@@ -7,6 +7,8 @@ Auto-create Project from Opportunity/Quotation Won
 import frappe
 from frappe import _
 
+from freight_forwarding.utils.item_groups import get_freight_service_groups
+
 
 def create_project_from_opportunity(doc, method=None):
     """
@@ -107,14 +109,7 @@ def validate_quotation_items(doc, method=None):
     if not doc.items:
         return
     
-    freight_services_groups = frappe.db.sql("""
-        SELECT name
-        FROM `tabItem Group`
-        WHERE parent_item_group = 'Freight Services'
-           OR name = 'Freight Services'
-    """, as_dict=True)
-    
-    valid_groups = [g.name for g in freight_services_groups]
+    valid_groups = get_freight_service_groups()
     
     for item in doc.items:
         if item.item_code:
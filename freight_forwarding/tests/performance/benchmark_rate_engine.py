@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Rate engine benchmarks.
+
+Quotes random lanes of synthetic rate data (see synthetic_data) at several
+scales and reports quote latency (p50/p95/p99), queries per quote, index
+build time and resident memory as JSON, optionally compared against a
+baseline file to catch regressions before release.
+
+Two modes:
+- detached (default): the rate index and pricing rules are built in
+  memory and quoted without the quote cache; measures the engine alone.
+- site: the data is bulk inserted into the current site and quoted
+  through `find_rates` (rate index sync, quote cache, pricing rules) with
+  the quote cache cleared before each quote, then once more warm. Use a
+  test site; the synthetic records are removed afterwards.
+
+Usage:
+    bench --site test_site execute \\
+        freight_forwarding.tests.performance.benchmark_rate_engine.run \\
+        --kwargs "{'scales': [100, 10000], 'output': 'rate_engine_benchmark.json'}"
+"""
+
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from datetime import date
+
+import frappe
+from frappe import _
+from frappe.utils import now
+
+from freight_forwarding.tests.performance.synthetic_data import SyntheticRateData, delete_synthetic_data
+from freight_forwarding.utils.rate.profiling import rate_profile
+from freight_forwarding.utils.rate.quote_cache import get_quote_cache
+from freight_forwarding.utils.rate.rate_engine import RateSnapshot, find_rates
+from freight_forwarding.utils.rate.rate_index import RateIndex, get_rate_index
+
+SCALES = (100, 10000, 100000)
+DEFAULT_QUOTES = 1000
+
+# Relative slowdown (or growth) against the baseline reported as a regression
+REGRESSION_TOLERANCE = 0.2
+
+# Metrics compared against the baseline, as paths into a scale's results
+REGRESSION_METRICS = (
+    ("latency_ms", "p50"),
+    ("latency_ms", "p95"),
+    ("queries_per_quote", "mean"),
+    ("memory_mb",),
+)
+
+
+def run(scales=None, quotes=DEFAULT_QUOTES, site=False, seed=42, output=None, baseline=None,
+        tolerance=REGRESSION_TOLERANCE, fail_on_regression=False):
+    """
+    Run the benchmarks.
+
+    Args:
+        scales: Lane counts (default: 100, 10k, 100k)
+        quotes: Quotes per scale
+        site: Benchmark through the current site instead of detached
+        seed: Random seed of the synthetic data and quotes
+        output: Path of the JSON results file (optional)
+        baseline: Path of a previous results file to compare against (optional)
+        tolerance: Relative change against the baseline counted as a regression
+        fail_on_regression: Raise when a regression is found
+
+    Returns:
+        dict: Results, with "regressions" when a baseline is given
+    """
+    scales = [int(s) for s in (scales or SCALES)]
+    benchmark = benchmark_site if site else benchmark_detached
+
+    results = {
+        "generated_at": now(),
+        "mode": "site" if site else "detached",
+        "quotes": quotes,
+        "seed": seed,
+        "python": platform.python_version(),
+        "scales": {str(lanes): benchmark(lanes, quotes, seed) for lanes in scales},
+    }
+
+    if baseline:
+        with open(baseline) as f:
+            results["regressions"] = check_regressions(results, json.load(f), tolerance)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True, default=str)
+
+    if fail_on_regression and results.get("regressions"):
+        frappe.throw(_("Rate engine regressions: {0}").format("; ".join(results["regressions"])))
+
+    return results
+
+
+def benchmark_detached(lanes, quotes, seed=42):
+    """Benchmark the rate index and pricing on detached synthetic data"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    data = SyntheticRateData(lanes, seed=seed)
+    index = RateIndex()
+    for contract in data.compiled_contracts():
+        index.add_contract(contract)
+    matcher = data.pricing_rule_matcher()
+
+    build_seconds = time.perf_counter() - started
+    requests = [request + (data.division(),) for request in data.quote_requests(quotes)]
+    counts = data_counts(data)
+
+    # What stays resident is the index (rows are shared with the generator)
+    del data
+    gc.collect()
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    snapshot = RateSnapshot(index, matcher, None, "USD")
+    quote_date = date.today()
+
+    def quote(request):
+        mode, origin, destination, weight, cbm, container_type, division = request
+        return snapshot.compute_rates(
+            mode, origin, destination, mode, quote_date, weight, cbm, container_type, division, None, None
+        )
+
+    result = measure_quotes(requests, quote)
+    result.update(counts)
+    result.update({
+        "build_seconds": round(build_seconds, 3),
+        "memory_mb": round(memory / 2**20, 2),
+        "memory_peak_mb": round(peak / 2**20, 2),
+    })
+    return result
+
+
+def benchmark_site(lanes, quotes, seed=42):
+    """Benchmark `find_rates` on synthetic data inserted into the current site"""
+    data = SyntheticRateData(lanes, seed=seed)
+    requests = [request + (data.division(),) for request in data.quote_requests(quotes)]
+    counts = data_counts(data)
+
+    delete_synthetic_data()
+    data.insert()
+    del data
+
+    try:
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        get_rate_index()
+        build_seconds = time.perf_counter() - started
+        memory, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        quote_cache = get_quote_cache()
+
+        def quote(request, warm=False):
+            mode, origin, destination, weight, cbm, container_type, division = request
+            if not warm:
+                quote_cache.clear()
+            return find_rates(
+                mode, origin, destination, mode, weight=weight, cbm=cbm,
+                container_type=container_type, division=division
+            )
+
+        result = measure_quotes(requests, quote)
+        result["warm_latency_ms"] = measure_quotes(requests, lambda r: quote(r, warm=True))["latency_ms"]
+        result.update(counts)
+        result.update({
+            "build_seconds": round(build_seconds, 3),
+            "memory_mb": round(memory / 2**20, 2),
+            "memory_peak_mb": round(peak / 2**20, 2),
+        })
+        return result
+    finally:
+        delete_synthetic_data()
+
+
+def measure_quotes(requests, quote):
+    """Latency, queries and options per quote of `quote(request)` over all requests"""
+    latencies = []
+    queries = []
+    options = 0
+
+    for request in requests:
+        with rate_profile("benchmark", force=True) as profile:
+            started = time.perf_counter()
+            options += len(quote(request))
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(profile.queries)
+
+    return {
+        "latency_ms": summarize(latencies),
+        "queries_per_quote": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else 0,
+            "max": max(queries, default=0),
+        },
+        "options_per_quote": round(options / len(requests), 2) if requests else 0,
+    }
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {
+        "mean": round(sum(ordered) / len(ordered), 4) if ordered else None,
+        "p50": round(percentile(ordered, 50), 4),
+        "p95": round(percentile(ordered, 95), 4),
+        "p99": round(percentile(ordered, 99), 4),
+        "max": round(ordered[-1], 4) if ordered else None,
+    }
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def data_counts(data):
+    return {
+        "lanes": len(data.lanes),
+        "contracts": len(data.contracts),
+        "bases": len(data.bases),
+        "surcharges": len(data.surcharges),
+        "pricing_rules": len(data.pricing_rules),
+    }
+
+
+def check_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare results with a baseline of the same mode.
+
+    Returns:
+        list: One message per metric that grew by more than `tolerance`
+    """
+    if baseline.get("mode") != results.get("mode"):
+        return [_("Baseline mode {0} does not match {1}").format(baseline.get("mode"), results.get("mode"))]
+
+    regressions = []
+    for scale, current in results["scales"].items():
+        previous = baseline.get("scales", {}).get(scale)
+        if not previous:
+            continue
+        for path in REGRESSION_METRICS:
+            new, old = lookup(current, path), lookup(previous, path)
+            if new is None or old is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > 1e-3:
+                regressions.append(f"{scale} lanes {'.'.join(path)}: {old} -> {new}")
+    return regressions
+
+
+def lookup(values, path):
+    for key in path:
+        if not isinstance(values, dict):
+            return None
+        values = values.get(key)
+    return values
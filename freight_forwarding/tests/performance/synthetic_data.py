@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic rate data for benchmarks.
+
+Generates FF Rate Contracts (lanes, bases, surcharges) and FF Pricing
+Rules at a given lane count, deterministically from a seed. The data can
+be used detached (CompiledContract / PricingRuleMatcher, no database) or
+bulk inserted into a test site and removed again.
+
+Lane keys are drawn from a pool of about `lanes / COMPETITORS_PER_LANE`
+(origin, destination) pairs split over the modes, so each quoted lane is
+served by several competing contracts, as on a real tariff book.
+"""
+
+import random
+
+import frappe
+from frappe.utils import add_days, now, today
+
+from freight_forwarding.utils.rate.pricing_rules import PricingRuleMatcher
+from freight_forwarding.utils.rate.rate_index import CompiledContract
+
+# Name prefix of every synthetic record (used for cleanup)
+PREFIX = "BENCH"
+
+MODES = ("Sea", "Air", "Land")
+CONTAINER_TYPES = ("20GP", "40GP", "40HC")
+AIR_BREAKS = ((0, 45), (45, 100), (100, 300), (300, 1000), (1000, 100000))
+DIVISIONS = ("Export", "Import", "Domestic", "Project")
+
+LANES_PER_CONTRACT = 50
+COMPETITORS_PER_LANE = 5
+LANES_PER_PRICING_RULE = 1000
+
+BULK_CHUNK_SIZE = 1000
+
+
+class SyntheticRateData:
+    """
+    Deterministic synthetic contracts and pricing rules.
+
+    Args:
+        lanes: Total number of FF Rate Lane rows
+        seed: Random seed
+        lanes_per_contract: Lanes per FF Rate Contract (default: up to
+            LANES_PER_CONTRACT, fewer on small scales so every mode gets
+            several contracts)
+    """
+
+    def __init__(self, lanes, seed=42, lanes_per_contract=None):
+        self.lane_count = lanes
+        self.random = random.Random(seed)
+        self.valid_from = add_days(today(), -30)
+        self.valid_to = add_days(today(), 335)
+
+        pairs = max(lanes // COMPETITORS_PER_LANE // len(MODES), 1)
+        self.lane_keys = {
+            mode: [(f"{PREFIX}-{mode[0]}{i:05d}-O", f"{PREFIX}-{mode[0]}{i:05d}-D") for i in range(pairs)]
+            for mode in MODES
+        }
+
+        lanes_per_contract = lanes_per_contract or min(
+            LANES_PER_CONTRACT, max(lanes // (len(MODES) * COMPETITORS_PER_LANE), 1)
+        )
+
+        self.contracts = []
+        self.lanes = []
+        self.bases = []
+        self.surcharges = []
+        self.pricing_rules = []
+
+        for start in range(0, lanes, lanes_per_contract):
+            self.make_contract(len(self.contracts), min(lanes_per_contract, lanes - start))
+
+        for i in range(max(lanes // LANES_PER_PRICING_RULE, 5)):
+            self.make_pricing_rule(i)
+
+    def make_contract(self, number, lane_count):
+        mode = MODES[number % len(MODES)]
+        name = f"{PREFIX}-RC-{number:06d}"
+        self.contracts.append(frappe._dict(
+            name=name, vendor=f"{PREFIX} Vendor {number % 50}", carrier=None, currency="USD",
+            status="Active", mode=mode, validity_from=self.valid_from, validity_to=self.valid_to,
+            modified=now(),
+        ))
+
+        origin_field, destination_field = {"Sea": ("pol", "pod"), "Air": ("aoo", "aod")}.get(
+            mode, ("origin", "destination")
+        )
+        for _i in range(lane_count):
+            origin, destination = self.random.choice(self.lane_keys[mode])
+            lane = frappe._dict(
+                name=f"{name}-L{len(self.lanes):07d}", parent=name, lane_type=mode,
+                transit=self.random.randint(1, 40), chargeable_rule="Weight or Volume",
+            )
+            lane[origin_field] = origin
+            lane[destination_field] = destination
+            if mode == "Land" and self.random.random() < 0.3:
+                lane.update(basis="per_km", distance=self.random.randint(20, 800))
+            self.lanes.append(lane)
+            self.make_bases(lane, mode)
+
+        for code, calc_type, amount in (
+            ("DOC", "flat", 25), ("BAF", "per_cntr" if mode == "Sea" else "per_kg", 0.4), ("CAF", "percent", 3),
+        ):
+            self.surcharges.append(frappe._dict(
+                parent=name, surcharge_code=code, calc_type=calc_type, amount=amount * self.random.uniform(0.5, 1.5),
+            ))
+
+    def make_bases(self, lane, mode):
+        if mode == "Sea":
+            for container_type in CONTAINER_TYPES:
+                self.add_base(lane, self.random.uniform(300, 3000), container_type=container_type)
+        elif mode == "Air":
+            rate = self.random.uniform(3, 8)
+            for weight_break_from, weight_break_to in AIR_BREAKS:
+                self.add_base(lane, rate, weight_break_from=weight_break_from, weight_break_to=weight_break_to)
+                rate *= 0.85
+        else:
+            self.add_base(lane, self.random.uniform(1, 3) if lane.basis == "per_km" else self.random.uniform(100, 900))
+
+    def add_base(self, lane, base_rate, container_type=None, weight_break_from=0, weight_break_to=0):
+        self.bases.append(frappe._dict(
+            parent=lane.parent, rate_lane=lane.name, container_type=container_type,
+            weight_break_from=weight_break_from, weight_break_to=weight_break_to, base_rate=base_rate,
+        ))
+
+    def make_pricing_rule(self, number):
+        specific = number % 3
+        self.pricing_rules.append(frappe._dict(
+            name=f"{PREFIX}-PR-{number:05d}", rule_name=f"{PREFIX} Rule {number}", status="Active",
+            division=DIVISIONS[number % len(DIVISIONS)] if specific else None,
+            mode=MODES[number % len(MODES)] if specific != 2 else None,
+            customer=None, commodity=None, priority=number % 10 + 1,
+            validity_from=None, validity_to=None,
+            markup_type="Percentage", markup_value=self.random.uniform(5, 25),
+            discount_type=None, discount_value=0, modified=now(),
+        ))
+
+    def compiled_contracts(self):
+        """Contracts as CompiledContract objects, without touching the database"""
+        children = {}
+        tables = (("rate_lanes", self.lanes), ("rate_bases", self.bases), ("rate_surcharges", self.surcharges))
+        for table, rows in tables:
+            for row in rows:
+                children.setdefault((row.parent, table), []).append(row)
+
+        return [
+            CompiledContract(
+                header,
+                rate_lanes=children.get((header.name, "rate_lanes")),
+                rate_bases=children.get((header.name, "rate_bases")),
+                rate_surcharges=children.get((header.name, "rate_surcharges")),
+            )
+            for header in self.contracts
+        ]
+
+    def pricing_rule_matcher(self):
+        return PricingRuleMatcher(self.pricing_rules)
+
+    def quote_requests(self, count):
+        """Random quotes over the generated lanes: (mode, origin, destination, weight, cbm, container_type)"""
+        requests = []
+        for _i in range(count):
+            mode = self.random.choice(MODES)
+            origin, destination = self.random.choice(self.lane_keys[mode])
+            requests.append((
+                mode, origin, destination,
+                round(self.random.uniform(10, 5000), 1),
+                round(self.random.uniform(0.1, 30), 2),
+                self.random.choice(CONTAINER_TYPES) if mode == "Sea" else None,
+            ))
+        return requests
+
+    def division(self):
+        return self.random.choice(DIVISIONS)
+
+    def insert(self):
+        """Bulk insert contracts and pricing rules into the current site"""
+        timestamp = now()
+        user = frappe.session.user
+        standard = ["name", "creation", "modified", "owner", "modified_by", "docstatus"]
+
+        def insert_rows(doctype, rows, fields, child_of=None):
+            columns = list(standard)
+            if child_of:
+                columns += ["parent", "parenttype", "parentfield", "idx"]
+            frappe.db.bulk_insert(
+                doctype,
+                columns + fields,
+                [
+                    [
+                        row.get("name") or f"{PREFIX}-{frappe.generate_hash(length=10)}",
+                        timestamp, timestamp, user, user, 0,
+                    ]
+                    + ([row.parent, "FF Rate Contract", child_of, idx + 1] if child_of else [])
+                    + [row.get(f) for f in fields]
+                    for idx, row in enumerate(rows)
+                ],
+                chunk_size=BULK_CHUNK_SIZE,
+            )
+
+        insert_rows("FF Rate Contract", self.contracts,
+                    ["vendor", "carrier", "currency", "status", "mode", "validity_from", "validity_to"])
+        insert_rows("FF Rate Lane", self.lanes,
+                    ["lane_type", "pol", "pod", "aoo", "aod", "origin", "destination", "transit",
+                     "chargeable_rule", "basis", "distance"], child_of="rate_lanes")
+        insert_rows("FF Rate Base", self.bases,
+                    ["rate_lane", "container_type", "weight_break_from", "weight_break_to", "base_rate"],
+                    child_of="rate_bases")
+        insert_rows("FF Rate Surcharge", self.surcharges, ["surcharge_code", "calc_type", "amount"],
+                    child_of="rate_surcharges")
+        insert_rows("FF Pricing Rule", self.pricing_rules,
+                    ["rule_name", "status", "division", "mode", "customer", "commodity", "priority",
+                     "markup_type", "markup_value", "discount_type", "discount_value"])
+        frappe.db.commit()
+        bump_rate_versions()
+
+
+def delete_synthetic_data():
+    """Remove every synthetic record from the current site"""
+    contracts = frappe.get_all("FF Rate Contract", filters={"name": ["like", f"{PREFIX}-%"]}, pluck="name")
+    for start in range(0, len(contracts), BULK_CHUNK_SIZE):
+        chunk = contracts[start:start + BULK_CHUNK_SIZE]
+        for doctype in ("FF Rate Lane", "FF Rate Base", "FF Rate Surcharge"):
+            frappe.db.delete(doctype, {"parenttype": "FF Rate Contract", "parent": ["in", chunk]})
+        frappe.db.delete("FF Rate Contract", {"name": ["in", chunk]})
+    frappe.db.delete("FF Pricing Rule", {"name": ["like", f"{PREFIX}-%"]})
+    frappe.db.commit()
+    bump_rate_versions()
+
+
+def bump_rate_versions():
+    """Make every worker reload rate contracts and pricing rules"""
+    from freight_forwarding.utils.rate import pricing_rules, rate_index
+
+    rate_index.bump_shared_version()
+    pricing_rules.bump_shared_version()
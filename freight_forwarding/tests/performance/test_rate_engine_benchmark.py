@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Smoke benchmark of the rate engine on detached synthetic data.
+
+The full suite (10k and 100k lanes, site mode) runs through
+benchmark_rate_engine.run; this test keeps the smallest scale in the
+regular test run. It asserts on query and option counts only; latency
+limits are left to `check_regressions` in the benchmark runner, as wall
+clock times vary with the load of the machine.
+"""
+
+import unittest
+
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.tests.performance.benchmark_rate_engine import benchmark_detached, check_regressions
+from freight_forwarding.tests.performance.synthetic_data import SyntheticRateData
+
+
+class TestRateEngineBenchmark(FrappeTestCase):
+    def test_synthetic_data_scale(self):
+        """Test that the generator produces the requested lanes with competing contracts"""
+        data = SyntheticRateData(300, seed=1)
+
+        self.assertEqual(len(data.lanes), 300)
+        self.assertEqual({c.mode for c in data.contracts}, {"Sea", "Air", "Land"})
+        self.assertEqual(SyntheticRateData(300, seed=1).quote_requests(5), data.quote_requests(5))
+
+    def test_detached_benchmark(self):
+        """Test a 100-lane benchmark: quotes find competing options without queries"""
+        result = benchmark_detached(100, quotes=200)
+
+        self.assertEqual(result["lanes"], 100)
+        self.assertGreater(result["options_per_quote"], 1)
+        self.assertEqual(result["queries_per_quote"]["max"], 0)
+
+    def test_regressions(self):
+        """Test that metrics growing past the tolerance are reported"""
+        baseline = {"mode": "detached", "scales": {"100": {"latency_ms": {"p50": 1.0, "p95": 2.0}}}}
+        results = {"mode": "detached", "scales": {"100": {"latency_ms": {"p50": 1.1, "p95": 3.0}}}}
+
+        regressions = check_regressions(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("latency_ms.p95", regressions[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Chargeable Weight
+"""
+
+import math
+import unittest
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.chargeable_weight import (
+    chargeable_weight,
+    lane_chargeable_weight,
+)
+from freight_forwarding.utils.consol.allocation import by_chargeable_allocation
+
+
+class TestChargeableWeight(FrappeTestCase):
+    """Test volumetric divisors and chargeable rules"""
+
+    def test_mode_divisors(self):
+        """Test air 6000, sea W/M and land divisors"""
+        self.assertAlmostEqual(chargeable_weight(100, 1, "Air"), 166.67, places=2)
+        self.assertEqual(chargeable_weight(100, 1, "Sea"), 1000)
+        self.assertAlmostEqual(chargeable_weight(100, 1, "Land"), 333.33, places=2)
+
+    def test_rules(self):
+        """Test Weight, Volume and Weight or Volume rules"""
+        self.assertEqual(chargeable_weight(500, 1, "Sea", "Weight"), 500)
+        self.assertEqual(chargeable_weight(500, 1, "Sea", "Volume"), 1000)
+        self.assertEqual(chargeable_weight(1500, 1, "Sea", "Weight or Volume"), 1500)
+
+    def test_vectorized(self):
+        """Test that arrays match scalar results"""
+        weights = [100, 300, 50]
+        cbms = [1, 1, 0]
+        result = chargeable_weight(weights, cbms, "Air")
+        self.assertEqual(list(result), [chargeable_weight(w, c, "Air") for w, c in zip(weights, cbms)])
+
+    def test_lane_falls_back_to_given_measure(self):
+        """Test that a Volume lane without CBM uses weight"""
+        lane = frappe._dict(lane_type="Air", chargeable_rule="Volume")
+        self.assertEqual(lane_chargeable_weight(lane, weight=120), 120)
+        self.assertIsNone(lane_chargeable_weight(lane))
+
+    def test_lane_vectorized(self):
+        """Test that lane chargeable weight over arrays matches scalar results"""
+        lane = frappe._dict(lane_type="Air", chargeable_rule="Weight or Volume")
+        weights = [100, 300, 0, 120, 0]
+        cbms = [1, 1, 1.2, 0, 0]
+        result = lane_chargeable_weight(lane, weights, cbms)
+
+        expected = [lane_chargeable_weight(lane, w, c) for w, c in zip(weights, cbms)]
+        self.assertEqual([round(r, 6) for r in result[:4]], [round(e, 6) for e in expected[:4]])
+        self.assertIsNone(expected[4])
+        self.assertTrue(math.isnan(result[4]))
+
+    def test_allocation_uses_mode_divisor(self):
+        """Test that by_chargeable allocation uses the consol mode and member rule"""
+        consol = frappe._dict(
+            mode="Air",
+            consol_members=[
+                frappe._dict(project="PRJ-1", weight=100, cbm=1.2, chargeable="Weight or Volume"),
+                frappe._dict(project="PRJ-2", weight=200, cbm=1.2, chargeable="Weight"),
+            ],
+        )
+        allocation = by_chargeable_allocation(consol, 400)
+
+        # PRJ-1: 200 kg volumetric, PRJ-2: 200 kg gross
+        self.assertAlmostEqual(allocation["PRJ-1"], 200)
+        self.assertAlmostEqual(allocation["PRJ-2"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Consol Allocation
+"""
+
+import random
+import unittest
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.doctype.ff_consol_shipment.ff_consol_shipment import FFConsolShipment
+from freight_forwarding.utils.consol.allocation import (
+    allocate_charges,
+    allocation_matrix,
+    calculate_allocation,
+    get_rule_lookup,
+    get_rule_percentages,
+)
+from freight_forwarding.utils.consol.jobs import ConsolJobProgress
+from freight_forwarding.utils.consol.ledger import (
+    LEDGER_FIELDS,
+    STANDARD_FIELDS,
+    diff_allocation,
+    split_consol_document,
+)
+
+
+def make_consol(members=3):
+    return frappe._dict(
+        name="CONSOL-1",
+        mode="Sea",
+        consol_members=[
+            frappe._dict(project=f"PRJ-{i}", weight=100 * i, cbm=i, chargeable="Weight or Volume")
+            for i in range(1, members + 1)
+        ],
+        allocation_rules=[
+            frappe._dict(item="OCEAN", charge_code=None, method="by_cbm"),
+            frappe._dict(item=None, charge_code="THC", method="equal"),
+            frappe._dict(item="THC", charge_code=None, method="by_weight"),
+        ],
+    )
+
+
+class FakeDoc(frappe._dict):
+    """In-memory document recording inserts and saves"""
+
+    def append(self, table, values):
+        self.setdefault(table, [])
+        child = frappe._dict(values, name=f"{self.name}-{len(self[table]) + 1}")
+        self[table].append(child)
+        return child
+
+    def remove(self, child):
+        self[self.table].remove(child)
+
+    def is_new(self):
+        return not self.saved
+
+    def insert(self, **kwargs):
+        self.saved = True
+        self.writes = (self.writes or []) + ["insert"]
+
+    def save(self):
+        self.writes = (self.writes or []) + ["save"]
+
+
+class ConsolSite:
+    """Documents and ledger of a consol split, in memory"""
+
+    def __init__(self, consol):
+        self.consol = consol
+        self.docs = {}
+        self.ledger = {}
+        # docstatus of project documents other than drafts
+        self.status = {}
+        self.source = FakeDoc(
+            doctype="Purchase Invoice", name="PI-CONSOL", supplier="SUP", posting_date="2025-01-01",
+            due_date="2025-01-31", company="CO", currency="USD", docstatus=0, table="items",
+            items=[
+                frappe._dict(name=f"ROW-{code}", item_code=code, item_name=code, qty=1, rate=amount,
+                             base_amount=amount, uom="Nos", item_group="Freight Services")
+                for code, amount in (("OCEAN", 1000), ("THC", 400), ("DOC", 80))
+            ],
+        )
+
+    def get_doc(self, *args):
+        if isinstance(args[0], dict):
+            values = args[0]
+            name = f"PI-{values['project']}"
+            if name in self.docs:
+                name = f"{name}-{len(self.docs)}"
+            doc = FakeDoc(values, name=name, table="items")
+            self.docs[doc.name] = doc
+            return doc
+        return self.docs[args[1]]
+
+    def delete(self, doctype, filters):
+        for name in filters["name"][1]:
+            del self.ledger[name]
+        self.deleted.update(filters["name"][1])
+
+    def bulk_insert(self, doctype, fields, values, **kwargs):
+        for row in values:
+            entry = frappe._dict(zip(fields, row))
+            self.ledger[entry.name] = entry
+            self.updated += entry.name in self.deleted
+
+    def split(self, progress=None):
+        """
+        Split the consol PI.
+
+        Returns:
+            tuple: (created documents, ledger entries updated, ledger write statements)
+        """
+        for doc in self.docs.values():
+            doc.writes = []
+        ledger = {(entry.charge, entry.project): entry for entry in self.ledger.values()}
+        self.deleted = set()
+        self.updated = 0
+
+        with patch("frappe.get_doc", side_effect=self.get_doc), \
+                patch("frappe.get_all", return_value=[]), \
+                patch("frappe.db.exists", side_effect=lambda doctype, name: name in self.docs), \
+                patch("frappe.db.delete", side_effect=self.delete) as delete, \
+                patch("frappe.db.bulk_insert", side_effect=self.bulk_insert) as bulk_insert, \
+                patch("freight_forwarding.utils.consol.ledger.get_ledger", return_value=ledger), \
+                patch("freight_forwarding.utils.consol.ledger.get_target_status", return_value=self.status):
+            created = split_consol_document(self.consol, self.source, progress)
+
+        return created, self.updated, delete.call_count + bulk_insert.call_count
+
+
+class TestConsolAllocation(FrappeTestCase):
+    """Test the set-based, ledger-driven consol split"""
+
+    def test_rule_lookup_first_match_wins(self):
+        """Test that the first rule matching by item or charge code is used"""
+        consol = make_consol()
+        rules = get_rule_lookup(consol.allocation_rules)
+        self.assertEqual(rules["OCEAN"].method, "by_cbm")
+        self.assertEqual(rules["THC"].method, "equal")
+
+        rules = get_rule_lookup(consol.allocation_rules, fields=("item",))
+        self.assertEqual(rules["THC"].method, "by_weight")
+
+    def test_allocate_charges(self):
+        """Test that every charge is allocated over all projects"""
+        consol = make_consol()
+        rules = get_rule_lookup(consol.allocation_rules)
+        allocations = allocate_charges(consol, [(600, rules["OCEAN"]), (300, None), (120, rules["OCEAN"])])
+
+        self.assertAlmostEqual(allocations[0]["PRJ-3"], 300)
+        self.assertAlmostEqual(allocations[1]["PRJ-1"], 100)
+        self.assertAlmostEqual(allocations[2]["PRJ-2"], 40)
+        for allocation, total in zip(allocations, (600, 300, 120)):
+            self.assertAlmostEqual(sum(allocation.values()), total)
+
+    def test_largest_remainder(self):
+        """Test that leftover cents go to the largest remainders, earlier member on ties"""
+        allocation = calculate_allocation(make_consol(), 100, None, precision=2)
+        self.assertEqual(allocation, {"PRJ-1": 33.34, "PRJ-2": 33.33, "PRJ-3": 33.33})
+
+        # cbm 1:2:3 of 10.00 -> 1.666, 3.333, 5.0
+        allocation = calculate_allocation(make_consol(), 10, frappe._dict(method="by_cbm"), precision=2)
+        self.assertEqual(allocation, {"PRJ-1": 1.67, "PRJ-2": 3.33, "PRJ-3": 5.0})
+
+    def test_large_consol_balances(self):
+        """Test that every charge of a 500-member consol balances to the cent"""
+        rng = random.Random(7)
+        consol = frappe._dict(mode="Air", consol_members=[
+            frappe._dict(project=f"PRJ-{i}", weight=rng.uniform(1, 900), cbm=rng.uniform(0.01, 4),
+                         chargeable=rng.choice(["Weight", "Volume", None]))
+            for i in range(500)
+        ])
+        methods = ["by_cbm", "by_weight", "by_chargeable", "equal", "by_slot"]
+        amounts = [round(rng.uniform(-500, 20000), 2) for _i in range(50)]
+        rules = [frappe._dict(method=methods[i % len(methods)]) for i in range(50)]
+
+        projects, matrix = allocation_matrix(consol, amounts, rules, precision=2)
+
+        self.assertEqual(matrix.shape, (50, 500))
+        for amount, row in zip(amounts, matrix):
+            self.assertEqual(round(sum(round(v * 100) for v in row)), round(amount * 100))
+            self.assertTrue(all(abs(v * 100 - round(v * 100)) < 1e-6 for v in row))
+
+    def test_members_of_one_project_are_summed(self):
+        """Test that two members of the same project get one summed amount"""
+        consol = make_consol()
+        consol.consol_members[2].project = "PRJ-1"
+        allocation = calculate_allocation(consol, 60, frappe._dict(method="by_cbm"))
+        self.assertEqual(allocation, {"PRJ-1": 40.0, "PRJ-2": 20.0})
+
+    def test_manual_percentages(self):
+        """Test per-member percentages of a manual_pct rule, by item or charge code"""
+        consol = make_consol()
+        consol.allocation_rules.append(frappe._dict(item=None, charge_code="CUS", method="manual_pct"))
+        consol.allocation_percentages = [
+            frappe._dict(charge="CUS", project="PRJ-1", percentage=50),
+            frappe._dict(charge="CUS", project="PRJ-3", percentage=50),
+        ]
+        rules = get_rule_lookup(consol.allocation_rules)
+        allocations = allocate_charges(consol, [(99.99, rules["CUS"]), (30, rules["THC"])], precision=2)
+
+        self.assertEqual(allocations[0], {"PRJ-1": 50.0, "PRJ-2": 0.0, "PRJ-3": 49.99})
+        self.assertEqual(allocations[1], {"PRJ-1": 10.0, "PRJ-2": 10.0, "PRJ-3": 10.0})
+
+    def test_manual_percentages_validation(self):
+        """Test that manual percentages must add up to 100 and belong to members"""
+        consol = make_consol()
+        consol.allocation_rules = [frappe._dict(item="CUS", charge_code=None, method="manual_pct")]
+        consol.allocation_percentages = [
+            frappe._dict(charge="CUS", project="PRJ-1", percentage=60),
+            frappe._dict(charge="CUS", project="PRJ-2", percentage=40),
+        ]
+        FFConsolShipment.validate_allocation_percentages(consol)
+
+        consol.allocation_percentages[1].percentage = 30
+        self.assertRaises(Exception, FFConsolShipment.validate_allocation_percentages, consol)
+
+        consol.allocation_percentages[1].update(percentage=40, project="PRJ-9")
+        self.assertRaises(Exception, FFConsolShipment.validate_allocation_percentages, consol)
+
+        consol.allocation_percentages = []
+        self.assertRaises(Exception, FFConsolShipment.validate_allocation_percentages, consol)
+
+    def test_manual_percentages_item_and_charge_code(self):
+        """Test that item percentages win and entering both item and charge code is rejected"""
+        consol = make_consol()
+        rule = frappe._dict(item="CUS", charge_code="CUS-FEE", method="manual_pct")
+        consol.allocation_rules = [rule]
+        consol.allocation_percentages = [
+            frappe._dict(charge="CUS", project="PRJ-1", percentage=100),
+            frappe._dict(charge="CUS-FEE", project="PRJ-2", percentage=100),
+        ]
+        percentages = {"CUS": {"PRJ-1": 100}, "CUS-FEE": {"PRJ-2": 100}}
+        self.assertEqual(get_rule_percentages(rule, percentages), {"PRJ-1": 100})
+        self.assertRaises(Exception, FFConsolShipment.validate_allocation_percentages, consol)
+
+        consol.allocation_percentages = consol.allocation_percentages[1:]
+        FFConsolShipment.validate_allocation_percentages(consol)
+
+    def test_diff_allocation(self):
+        """Test added, changed, unchanged and removed (charge, project) pairs"""
+        rows = [frappe._dict(name="A"), frappe._dict(name="B")]
+        allocations = [{"PRJ-1": 10.001, "PRJ-2": 20}, {"PRJ-1": 5}]
+        ledger = {
+            ("A", "PRJ-1"): frappe._dict(project="PRJ-1", amount=10),
+            ("A", "PRJ-2"): frappe._dict(project="PRJ-2", amount=25),
+            ("A", "PRJ-3"): frappe._dict(project="PRJ-3", amount=7),
+        }
+        changes = diff_allocation(rows, allocations, ledger)
+
+        self.assertEqual(sorted(changes), ["PRJ-1", "PRJ-2", "PRJ-3"])
+        self.assertEqual([c[0] for c in changes["PRJ-1"]], ["add"])
+        self.assertEqual([(c[0], c[2]) for c in changes["PRJ-2"]], [("update", 20)])
+        self.assertEqual([c[0] for c in changes["PRJ-3"]], ["remove"])
+
+    def test_split_one_insert_per_project(self):
+        """Test that each project gets one PI with all items, inserted once"""
+        site = ConsolSite(make_consol(members=4))
+        created, updates, statements = site.split()
+
+        self.assertEqual(created, [f"PI-PRJ-{i}" for i in range(1, 5)])
+        self.assertEqual(len(site.ledger), 12)
+        self.assertEqual((updates, statements), (0, 1))
+        for entry in site.ledger.values():
+            self.assertEqual(sorted(entry), sorted(STANDARD_FIELDS + LEDGER_FIELDS))
+        for doc in site.docs.values():
+            self.assertEqual(doc.writes, ["insert"])
+            self.assertEqual(len(doc["items"]), 3)
+            self.assertEqual(doc["items"][0]["consol_source"], "PI-CONSOL")
+
+    def test_split_again_writes_nothing(self):
+        """Test that splitting an unchanged consol again writes no rows"""
+        site = ConsolSite(make_consol(members=4))
+        site.split()
+        created, updates, statements = site.split()
+
+        self.assertEqual((created, updates, statements), ([], 0, 0))
+        self.assertTrue(all(not doc.writes for doc in site.docs.values()))
+        self.assertEqual(len(site.ledger), 12)
+
+    def test_resplit_updates_changed_rows_only(self):
+        """Test that a corrected cbm updates only the by_cbm rows, in place"""
+        site = ConsolSite(make_consol(members=4))
+        site.split()
+        site.consol.consol_members[0].cbm = 5
+        created, updates, statements = site.split()
+
+        self.assertEqual(created, [])
+        self.assertEqual((updates, statements), (4, 2))
+        self.assertEqual(len(site.ledger), 12)
+        for doc in site.docs.values():
+            self.assertEqual(doc.writes, ["save"])
+            self.assertEqual(len(doc["items"]), 3)
+        self.assertAlmostEqual(sum(doc["items"][0]["amount"] for doc in site.docs.values()), 1000)
+        self.assertAlmostEqual(site.docs["PI-PRJ-1"]["items"][0]["amount"], 357.14)
+
+    def test_resplit_replaces_cancelled_document(self):
+        """Test that a cancelled project PI is replaced and its ledger entries re-pointed"""
+        site = ConsolSite(make_consol(members=4))
+        site.split()
+        site.status["PI-PRJ-2"] = 2
+        created, updates, statements = site.split()
+
+        self.assertEqual(created, ["PI-PRJ-2-4"])
+        self.assertEqual(updates, 3)
+        self.assertEqual(site.docs["PI-PRJ-2-4"].writes, ["insert"])
+        self.assertEqual(len(site.docs["PI-PRJ-2-4"]["items"]), 3)
+        self.assertEqual(len(site.ledger), 12)
+        self.assertEqual(
+            {entry.target for entry in site.ledger.values() if entry.project == "PRJ-2"}, {"PI-PRJ-2-4"}
+        )
+        self.assertTrue(all(not site.docs[f"PI-PRJ-{i}"].writes for i in (1, 3, 4)))
+
+    def test_resplit_refuses_submitted_document(self):
+        """Test that splitting into a submitted project PI asks to cancel it first"""
+        site = ConsolSite(make_consol(members=4))
+        site.split()
+        site.status["PI-PRJ-1"] = 1
+        site.consol.consol_members[0].cbm = 5
+        self.assertRaises(Exception, site.split)
+
+    def test_progress_commits_in_chunks(self):
+        """Test that a background split flushes the ledger and commits every chunk and at the end"""
+        progress = ConsolJobProgress("CONSOL-1", "split_purchase_invoice", chunk_size=2)
+        with patch("frappe.db.commit") as commit, patch("frappe.publish_realtime") as publish:
+            created, updates, statements = ConsolSite(make_consol(members=5)).split(progress)
+
+        self.assertEqual(commit.call_count, 3)
+        self.assertEqual(statements, 3)
+        self.assertEqual([c[0][1]["done"] for c in publish.call_args_list], [2, 4, 5])
+        self.assertEqual(publish.call_args_list[-1][0][1]["percent"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
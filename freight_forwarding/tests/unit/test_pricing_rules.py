@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Pricing Rule Matcher
+"""
+
+import unittest
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.rate.pricing_rules import PricingRuleMatcher
+
+
+def make_rule(name, priority=10, **kwargs):
+    """Build an FF Pricing Rule row without touching the database"""
+    rule = frappe._dict(
+        name=name,
+        priority=priority,
+        division=None,
+        mode="Sea",
+        customer=None,
+        commodity=None,
+        validity_from=None,
+        validity_to=None,
+        markup_type="Percentage",
+        markup_value=10,
+        discount_type=None,
+        discount_value=0,
+    )
+    rule.update(kwargs)
+    return rule
+
+
+class TestPricingRuleMatcher(FrappeTestCase):
+    """Test compiled pricing rule matching"""
+
+    def test_priority_order(self):
+        """Test that the lowest priority number wins"""
+        matcher = PricingRuleMatcher([
+            make_rule("PR-LOW", priority=20),
+            make_rule("PR-HIGH", priority=5),
+        ])
+        self.assertEqual(matcher.match("Sea", "2025-06-01").name, "PR-HIGH")
+
+    def test_customer_and_division_conditions(self):
+        """Test that conditioned rules only match their own quote context"""
+        matcher = PricingRuleMatcher([
+            make_rule("PR-CUST", priority=1, customer="CUST-001"),
+            make_rule("PR-EXP", priority=2, division="Export"),
+            make_rule("PR-ANY", priority=3),
+        ])
+        self.assertEqual(matcher.match("Sea", "2025-06-01", customer="CUST-001").name, "PR-CUST")
+        self.assertEqual(matcher.match("Sea", "2025-06-01", division="Export").name, "PR-EXP")
+        self.assertEqual(matcher.match("Sea", "2025-06-01", division="Import").name, "PR-ANY")
+        self.assertIsNone(matcher.match("Air", "2025-06-01"))
+
+    def test_validity_window(self):
+        """Test that expired rules are skipped"""
+        matcher = PricingRuleMatcher([
+            make_rule("PR-2024", priority=1, validity_from="2024-01-01", validity_to="2024-12-31"),
+        ])
+        self.assertIsNotNone(matcher.match("Sea", "2024-06-01"))
+        self.assertIsNone(matcher.match("Sea", "2025-06-01"))
+
+    def test_apply_markup_and_discount(self):
+        """Test markup and discount adjustments"""
+        matcher = PricingRuleMatcher([
+            make_rule("PR-MARKUP", priority=1, markup_type="Fixed Amount", markup_value=50),
+        ])
+        self.assertEqual(matcher.match("Sea", "2025-06-01").apply(100), 150)
+
+        matcher = PricingRuleMatcher([
+            make_rule("PR-DISC", priority=1, markup_value=0, discount_type="Percentage", discount_value=10),
+        ])
+        self.assertAlmostEqual(matcher.match("Sea", "2025-06-01").apply(100), 90)
+
+
+    def test_mode_fingerprints_are_stable(self):
+        """Test that fingerprints are digests of rule names and modified, not per-process hashes"""
+        rules = [make_rule("PR-A", modified="2025-01-01 00:00:00"), make_rule("PR-B", mode="Air")]
+        fingerprint = PricingRuleMatcher(rules).mode_fingerprints["Sea"]
+
+        self.assertEqual(PricingRuleMatcher(rules).mode_fingerprints["Sea"], fingerprint)
+        self.assertRegex(fingerprint, "^[0-9a-f]{40}$")
+        self.assertNotEqual(PricingRuleMatcher(rules).mode_fingerprints["Air"], fingerprint)
+
+        rules[0].modified = "2025-02-01 00:00:00"
+        self.assertNotEqual(PricingRuleMatcher(rules).mode_fingerprints["Sea"], fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
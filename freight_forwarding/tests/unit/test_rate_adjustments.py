@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Rate Adjustments (FX and Fuel Index)
+"""
+
+import sys
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.rate import adjustments
+from freight_forwarding.utils.rate.adjustments import AdjustmentStore, bump_shared_version, get_adjustment_store
+
+
+def fx(day, from_currency, to_currency, rate):
+    return frappe._dict(date=day, from_currency=from_currency, to_currency=to_currency, exchange_rate=rate)
+
+
+class TestExchangeRates(FrappeTestCase):
+    """Test conversion to the company currency"""
+
+    def setUp(self):
+        """Mock ERPNext's exchange rate lookup"""
+        self.erpnext = MagicMock(return_value=16000)
+        modules = {
+            "erpnext": SimpleNamespace(),
+            "erpnext.setup": SimpleNamespace(),
+            "erpnext.setup.utils": SimpleNamespace(get_exchange_rate=self.erpnext),
+        }
+        patcher = patch.dict(sys.modules, modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preloaded_conversion(self):
+        """Test direct quotes, inverse quotes filling gaps and rates carried forward"""
+        store = AdjustmentStore()
+        rows = [
+            fx("2025-05-20", "USD", "IDR", 15000),
+            fx("2025-06-03", "USD", "IDR", 15500),
+            fx("2025-05-25", "IDR", "SGD", 0.0001),
+        ]
+        with patch("frappe.get_all", return_value=rows) as get_all:
+            store.preload_fx("2025-06-01", "2025-06-05", ["USD", "SGD", "IDR"], "IDR")
+
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-02"), 15000)
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-04"), 15500)
+            self.assertEqual(store.get_exchange_rate("SGD", "IDR", "2025-06-01"), 10000)
+            self.assertEqual(store.get_exchange_rate("IDR", "IDR", "2025-06-01"), 1.0)
+
+        self.assertEqual(get_all.call_count, 1)
+        self.erpnext.assert_not_called()
+
+    def test_missing_rate_loads_window_once(self):
+        """Test that a miss loads the dates around it with one query and asks ERPNext only without a quote"""
+        store = AdjustmentStore()
+        rows = [fx("2025-06-10", "USD", "IDR", 15200)]
+        with patch("frappe.get_all", return_value=rows) as get_all:
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-12"), 15200)
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-20"), 15200)
+
+            # Before the first Currency Exchange: ERPNext, once per date
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-01"), 16000)
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-06-01"), 16000)
+
+        self.assertEqual(get_all.call_count, 1)
+        self.erpnext.assert_called_once_with("USD", "IDR", date(2025, 6, 1))
+
+    def test_without_fallback(self):
+        """Test that a store shipped to worker processes never queries"""
+        store = AdjustmentStore(fallback=False)
+        with patch("frappe.get_all") as get_all:
+            self.assertIsNone(store.get_exchange_rate("USD", "IDR", "2025-06-01"))
+        get_all.assert_not_called()
+        self.erpnext.assert_not_called()
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used dates are evicted past the bound"""
+        store = AdjustmentStore(max_fx_rates=10)
+        with patch("frappe.get_all", return_value=[fx("2025-01-01", "USD", "IDR", 15000)]):
+            store.preload_fx("2025-06-01", "2025-06-30", ["USD"], "IDR")
+            self.assertEqual(len(store.fx_rates), 10)
+            self.assertEqual(next(iter(store.fx_rates))[2], date(2025, 6, 21))
+
+            self.assertEqual(store.get_exchange_rate("USD", "IDR", "2025-03-01"), 15000)
+        self.assertLessEqual(len(store.fx_rates), 10)
+        self.assertIn(("USD", "IDR", date(2025, 3, 1)), store.fx_rates)
+
+
+class TestFuelIndex(FrappeTestCase):
+    """Test fuel index adjustments by mode and date"""
+
+    def test_adjustment_in_effect(self):
+        """Test that the latest adjustment on or before the date applies, per mode"""
+        store = AdjustmentStore()
+        rows = [
+            frappe._dict(mode="Sea", effective_date="2025-01-01", adjustment_percent=5),
+            frappe._dict(mode="Sea", effective_date="2025-04-01", adjustment_percent=7.5),
+            frappe._dict(mode="Air", effective_date="2025-03-01", adjustment_percent=12),
+        ]
+        with patch("frappe.get_all", return_value=rows) as get_all:
+            self.assertEqual(store.get_fuel_adjustment_percent("Sea", "2024-12-31"), 0)
+            self.assertEqual(store.get_fuel_adjustment_percent("Sea", "2025-03-31"), 5)
+            self.assertEqual(store.get_fuel_adjustment_percent("Sea", "2025-04-01"), 7.5)
+            self.assertEqual(store.get_fuel_adjustment_percent("Air", "2025-06-01"), 12)
+            self.assertEqual(store.get_fuel_adjustment_percent("Land", "2025-06-01"), 0)
+
+        self.assertEqual(get_all.call_count, 1)
+
+
+class TestAdjustmentVersion(FrappeTestCase):
+    """Test that workers drop their store when FX or fuel data changes"""
+
+    def setUp(self):
+        self.saved = adjustments._store
+        adjustments._store = None
+
+    def tearDown(self):
+        adjustments._store = self.saved
+
+    def test_store_reset_on_version_bump(self):
+        """Test that the store is kept until the shared version changes"""
+        store = get_adjustment_store()
+        self.assertIs(get_adjustment_store(), store)
+
+        bump_shared_version()
+        fresh = get_adjustment_store()
+        self.assertIsNot(fresh, store)
+        self.assertEqual(fresh.version, frappe.cache().get_value(adjustments.ADJUSTMENT_VERSION_KEY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,852 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Rate Engine calculations
+"""
+
+import base64
+import json
+import math
+import pickle
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from freight_forwarding.utils.rate.adjustments import AdjustmentStore
+from freight_forwarding.utils.rate.base_rates import BaseRateTable
+from freight_forwarding.utils.rate.freetime import FreetimeTable
+from freight_forwarding.utils.rate.pricing_rules import PricingRuleMatcher
+from freight_forwarding.utils.rate.profiling import histogram_quantile, rate_profile
+from freight_forwarding.utils.rate.quote_cache import QuoteCache
+from freight_forwarding.utils.rate.rate_cube import (
+    CUBE_FIELDS,
+    cube_lane_generation,
+    enqueue_rate_cube_build,
+    flatten_contract,
+    update_cube_contract,
+)
+from freight_forwarding.utils.rate.rate_engine import (
+    RateSnapshot,
+    calculate_buy_rate,
+    calculate_buy_rates,
+    decode_rank_cursor,
+    encode_rank_cursor,
+    find_rates_batch,
+    find_rates_page,
+    get_rate_timeline,
+    make_dwell,
+)
+from freight_forwarding.utils.rate.rate_index import CompiledContract, RateIndex
+from freight_forwarding.utils.rate.routing import RouteFinder
+from freight_forwarding.utils.rate.simulator import (
+    aggregate_margins,
+    load_shipments,
+    price_shipment,
+    price_shipments,
+)
+from freight_forwarding.utils.rate.surcharges import SurchargeVector
+
+
+def make_base(rate_lane, base_rate, container_type=None, weight_break_from=0, weight_break_to=0):
+    """Build an FF Rate Base row without touching the database"""
+    return frappe._dict(
+        rate_lane=rate_lane,
+        container_type=container_type,
+        weight_break_from=weight_break_from,
+        weight_break_to=weight_break_to,
+        base_rate=base_rate,
+    )
+
+
+def make_contract(name, rate_lanes, rate_bases, mode="Sea", rate_surcharges=None, rate_freetimes=None,
+                  status="Active", validity_from=None, validity_to=None):
+    """Build a USD CompiledContract without touching the database"""
+    header = frappe._dict(
+        name=name, vendor="Test Carrier", carrier=None, currency="USD", status=status, mode=mode,
+        validity_from=validity_from, validity_to=validity_to, modified="2025-01-01 00:00:00",
+    )
+    return CompiledContract(
+        header, rate_lanes=rate_lanes, rate_bases=rate_bases, rate_surcharges=rate_surcharges,
+        rate_freetimes=rate_freetimes,
+    )
+
+
+def make_snapshot(*contracts):
+    """Snapshot over an index of the given contracts, without pricing rules, quoting in USD"""
+    index = RateIndex()
+    for contract in contracts:
+        index.add_contract(contract)
+    return RateSnapshot(index, PricingRuleMatcher([]), None, "USD")
+
+
+class TestBaseRateTable(FrappeTestCase):
+    """Test weight break and container type lookup"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.table = BaseRateTable([
+            make_base("LANE-AIR", 5.0, weight_break_from=0, weight_break_to=45),
+            make_base("LANE-AIR", 4.0, weight_break_from=45, weight_break_to=100),
+            make_base("LANE-AIR", 3.0, weight_break_from=100, weight_break_to=1000),
+            make_base("LANE-SEA", 900, container_type="20GP"),
+            make_base("LANE-SEA", 1500, container_type="40HC"),
+        ])
+
+    def test_weight_break_bisection(self):
+        """Test that weight breaks resolve by bisection, boundary to the higher break"""
+        self.assertEqual(self.table.find("LANE-AIR", weight=10), 5.0)
+        self.assertEqual(self.table.find("LANE-AIR", weight=45), 4.0)
+        self.assertEqual(self.table.find("LANE-AIR", weight=500), 3.0)
+
+    def test_container_type(self):
+        """Test container type match"""
+        self.assertEqual(self.table.find("LANE-SEA", container_type="40HC"), 1500)
+
+    def test_miss_is_explicit(self):
+        """Test that a miss returns None instead of another lane's base"""
+        self.assertIsNone(self.table.find("LANE-AIR", weight=5000))
+        self.assertIsNone(self.table.find("LANE-SEA", container_type="45HC"))
+        self.assertIsNone(self.table.find("LANE-UNKNOWN", weight=10))
+
+    def test_overlapping_breaks(self):
+        """Test overlap detection used by FF Rate Contract validation"""
+        table = BaseRateTable([
+            make_base("LANE-AIR", 5.0, weight_break_from=0, weight_break_to=50),
+            make_base("LANE-AIR", 4.0, weight_break_from=45, weight_break_to=100),
+        ])
+        self.assertEqual(len(table.breaks[("LANE-AIR", None)].overlaps()), 1)
+        self.assertEqual(self.table.breaks[("LANE-AIR", None)].overlaps(), [])
+
+    def test_open_ended_break(self):
+        """Test that a break with only weight_break_from applies from there up, not to every weight"""
+        table = BaseRateTable([
+            make_base("LANE-AIR", 5.0, weight_break_from=0, weight_break_to=1000),
+            make_base("LANE-AIR", 2.5, weight_break_from=1000),
+        ])
+        self.assertEqual(table.find("LANE-AIR", weight=500), 5.0)
+        self.assertEqual(table.find("LANE-AIR", weight=25000), 2.5)
+        self.assertIsNone(table.find("LANE-AIR"))
+        self.assertEqual(list(table.find_many("LANE-AIR", 2, weights=[500, 25000])), [5.0, 2.5])
+
+    def test_find_many_matches_find(self):
+        """Test that the vectorized lookup agrees with the scalar one"""
+        weights = [10, 45, 500, 5000]
+        result = self.table.find_many("LANE-AIR", len(weights), weights=weights)
+        self.assertEqual(list(result[:3]), [5.0, 4.0, 3.0])
+        self.assertTrue(result[3] != result[3])  # NaN on miss
+
+
+class TestSurchargeVector(FrappeTestCase):
+    """Test surcharge evaluation per calc_type"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.vector = SurchargeVector([
+            frappe._dict(surcharge_code="DOC", calc_type="flat", amount=25),
+            frappe._dict(surcharge_code="SSC", calc_type="per_kg", amount=0.2),
+            frappe._dict(surcharge_code="THC", calc_type="per_cntr", amount=100),
+            frappe._dict(surcharge_code="BAF", calc_type="percent", amount=10),
+        ])
+
+    def test_percent_applies_to_base(self):
+        """Test that percent surcharges are a percentage of the base rate"""
+        self.assertAlmostEqual(self.vector.total(base_rate=1000), 25 + 100)
+        self.assertAlmostEqual(
+            self.vector.total(base_rate=1000, weight=100, container_type="20GP"), 25 + 20 + 100 + 100
+        )
+
+    def test_vector_matches_scalar(self):
+        """Test that the NumPy pass agrees with the scalar total"""
+        result = self.vector.evaluate([1000, 500], weights=[100, 0], container_types=["20GP", None])
+        self.assertAlmostEqual(result[0], self.vector.total(1000, 100, "20GP"))
+        self.assertAlmostEqual(result[1], self.vector.total(500, 0, None))
+
+
+class TestQuoteCache(FrappeTestCase):
+    """Test quote cache validation and counters"""
+
+    def test_hit_and_stale_stamp(self):
+        """Test that an entry is served only while its stamp is unchanged"""
+        cache = QuoteCache(max_size=10, ttl=600)
+        cache.set("key", (1, "rules"), [{"buy_rate": 100}])
+
+        self.assertEqual(cache.get("key", (1, "rules")), [{"buy_rate": 100}])
+        self.assertIsNone(cache.get("key", (2, "rules")))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stale"]), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = QuoteCache(max_size=2, ttl=600)
+        cache.set("a", 0, [])
+        cache.set("b", 0, [])
+        cache.get("a", 0)
+        cache.set("c", 0, [])
+
+        self.assertIsNone(cache.get("b", 0))
+        self.assertEqual(cache.get("a", 0), [])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class TestFreetimeTable(FrappeTestCase):
+    """Test demurrage/detention/storage beyond free time"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.table = FreetimeTable([
+            frappe._dict(
+                port="IDJKT", free_time_demurrage=4, free_time_detention=7, free_time_storage=3,
+                demurrage_rate=50, detention_rate=20, storage_rate=10, currency="USD",
+            ),
+            frappe._dict(
+                port=None, free_time_demurrage=0, free_time_detention=0, free_time_storage=0,
+                demurrage_rate=100, detention_rate=0, storage_rate=0, currency="USD",
+            ),
+        ])
+
+    def test_charges_beyond_free_days(self):
+        """Test that only days beyond free time are charged"""
+        terms = self.table.find("IDJKT")
+
+        self.assertEqual(terms.total(3), 0)
+        # 2 days demurrage, 3 days storage, 3 days detention
+        self.assertEqual(terms.total(6, 10), 2 * 50 + 3 * 10 + 3 * 20)
+
+    def test_default_port_row(self):
+        """Test that a row without port applies to other ports"""
+        self.assertEqual(self.table.find("SGSIN").total(2), 200)
+
+    def test_vectorized_matches_scalar(self):
+        """Test that the NumPy pass matches per-container pricing"""
+        terms = self.table.find("IDJKT")
+        dwell = [0, 3, 5, 10]
+        detention = [0, 8, 7, 12]
+
+        totals = terms.evaluate(dwell, detention)["total"]
+        self.assertEqual(list(totals), [terms.total(d, t) for d, t in zip(dwell, detention)])
+
+
+class TestLandedCostRanking(FrappeTestCase):
+    """Test ranking by buy rate plus expected D&D"""
+
+    def setUp(self):
+        """Set up three contracts on one lane: cheap without free-time terms, two with terms"""
+        def contract(name, base_rate, freetimes=None):
+            return make_contract(
+                name,
+                rate_lanes=[frappe._dict(name=f"{name}-L", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+                rate_bases=[make_base(f"{name}-L", base_rate)],
+                rate_freetimes=freetimes,
+            )
+
+        def freetime(free_days, rate):
+            return [frappe._dict(
+                port="SGSIN", free_time_demurrage=free_days, free_time_detention=0, free_time_storage=0,
+                demurrage_rate=rate, detention_rate=0, storage_rate=0, currency="USD",
+            )]
+
+        self.snapshot = make_snapshot(
+            contract("RC-NO-TERMS", 500.0),
+            contract("RC-GENEROUS", 800.0, freetime(14, 100)),
+            contract("RC-STRICT", 700.0, freetime(2, 100)),
+        )
+
+    def rank(self, dwell_days=None):
+        options = self.snapshot.compute_rates(
+            "Sea", "IDJKT", "SGSIN", "Sea", date(2025, 6, 1), None, None, None, None, None, None,
+            dwell=make_dwell(dwell_days)
+        )
+        return [(o["rate_contract"], o.get("landed_cost"), o.get("dd_unknown")) for o in options]
+
+    def test_missing_terms_rank_last(self):
+        """Test that a contract without free-time terms ranks after every known landed cost"""
+        ranked = self.rank(dwell_days=7)
+
+        # RC-STRICT: 700 + 5 days x 100; RC-GENEROUS: 800, all days free
+        self.assertEqual(ranked, [
+            ("RC-GENEROUS", 800.0, None),
+            ("RC-STRICT", 1200.0, None),
+            ("RC-NO-TERMS", None, True),
+        ])
+
+    def test_simulator_ranks_on_landed_cost(self):
+        """Test that bulk repricing with a dwell picks the option `compute_rates` ranks first"""
+        shipment = ("PRJ-1", "Sea", "IDJKT", "SGSIN", date(2025, 6, 1), None, None, None, None, 0, 0)
+        for dwell_days, rate_contract in ((1, "RC-STRICT"), (7, "RC-GENEROUS"), (20, "RC-GENEROUS")):
+            best = self.snapshot.compute_rates(
+                "Sea", "IDJKT", "SGSIN", "Sea", date(2025, 6, 1), None, None, None, None, None, None,
+                limit=1, dwell=make_dwell(dwell_days)
+            )[0]
+            result = price_shipment(self.snapshot, shipment, dwell=make_dwell(dwell_days))
+
+            self.assertEqual((result[4], result[2]), (rate_contract, best["landed_cost"]))
+            self.assertEqual(best["rate_contract"], rate_contract)
+
+    def test_buy_rate_without_dwell(self):
+        """Test that without a dwell projection contracts rank by buy rate alone"""
+        ranked = self.rank()
+
+        self.assertEqual([r[0] for r in ranked], ["RC-NO-TERMS", "RC-STRICT", "RC-GENEROUS"])
+
+
+class TestCompanyCurrency(FrappeTestCase):
+    """Test that options are normalized to the company currency"""
+
+    def test_options_in_company_currency(self):
+        """Test that contracts in different currencies rank by their company currency cost"""
+        usd = make_contract(
+            "RC-USD",
+            rate_lanes=[frappe._dict(name="L-USD", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+            rate_bases=[make_base("L-USD", 100.0)],
+        )
+        sgd = make_contract(
+            "RC-SGD",
+            rate_lanes=[frappe._dict(name="L-SGD", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+            rate_bases=[make_base("L-SGD", 120.0)],
+        )
+        sgd.currency = "SGD"
+        snapshot = make_snapshot(usd, sgd)
+
+        snapshot.adjustments, snapshot.company_currency = AdjustmentStore(fallback=False), "IDR"
+        rows = [
+            frappe._dict(date="2025-05-30", from_currency="USD", to_currency="IDR", exchange_rate=16000),
+            frappe._dict(date="2025-05-30", from_currency="SGD", to_currency="IDR", exchange_rate=12000),
+        ]
+        with patch("frappe.get_all", return_value=rows):
+            snapshot.preload("2025-06-01", "2025-06-01")
+        with patch("frappe.get_all", return_value=[]):
+            options = snapshot.compute_rates(
+                "Sea", "IDJKT", "SGSIN", "Sea", date(2025, 6, 1), None, None, None, None, None, None
+            )
+
+        self.assertEqual(
+            [(o["rate_contract"], o["currency"], o["base_buy_rate"]) for o in options],
+            [("RC-SGD", "SGD", 1440000.0), ("RC-USD", "USD", 1600000.0)],
+        )
+        self.assertTrue(all(o["company_currency"] == "IDR" for o in options))
+
+
+class TestFindRatesBatch(FrappeTestCase):
+    """Test quoting many lanes against one snapshot"""
+
+    def setUp(self):
+        """Set up two Sea lanes served by two contracts"""
+        def contract(name, base_rate):
+            return make_contract(
+                name,
+                rate_lanes=[
+                    frappe._dict(name=f"{name}-SIN", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3),
+                    frappe._dict(name=f"{name}-SHA", lane_type="Sea", pol="IDJKT", pod="CNSHA", transit=9),
+                ],
+                rate_bases=[make_base(f"{name}-SIN", base_rate), make_base(f"{name}-SHA", base_rate * 2)],
+            )
+
+        self.snapshot = make_snapshot(contract("RC-BATCH-A", 900.0), contract("RC-BATCH-B", 700.0))
+
+    def run_batch(self, requests, **kwargs):
+        with patch("freight_forwarding.utils.rate.rate_engine.get_rate_snapshot", return_value=self.snapshot) as get, \
+                patch("freight_forwarding.utils.rate.rate_engine.get_quote_cache", return_value=QuoteCache(10, 600)), \
+                patch("freight_forwarding.utils.rate.rate_engine.get_fresh_cube_version", return_value=None), \
+                patch.object(self.snapshot, "preload") as preload:
+            result = find_rates_batch(requests, **kwargs)
+        self.assertEqual(get.call_count, 1)
+        return result, preload
+
+    def lane(self, pod, **values):
+        return dict(lane_type="Sea", origin="IDJKT", destination=pod, mode="Sea", **values)
+
+    def test_error_keys(self):
+        """Test that invalid requests are reported under their own key and do not stop the batch"""
+        result, _preload = self.run_batch([
+            self.lane("SGSIN", key="ok"),
+            dict(key="no-lane", mode="Sea"),
+            dict(lane_type="Sea", origin="IDJKT", mode="Sea"),
+            self.lane("SGSIN", key=7),
+        ], date_filter="2025-06-01")
+
+        self.assertEqual(sorted(result["results"]), ["7", "ok"])
+        self.assertEqual(result["errors"], {
+            "no-lane": "Missing lane_type, origin, destination",
+            "2": "Missing destination",
+        })
+
+    def test_one_snapshot_for_all_requests(self):
+        """Test that every request is priced on the same snapshot, with FX preloaded once for all dates"""
+        with patch.object(RateSnapshot, "find_rates", autospec=True, return_value=[]) as find_rates:
+            self.run_batch([
+                self.lane("SGSIN", date_filter="2025-03-01"),
+                self.lane("CNSHA"),
+                self.lane("SGSIN", date_filter="2025-09-30", division="Import"),
+            ], date_filter="2025-06-01", division="Export")
+
+        self.assertEqual({call[0][0] for call in find_rates.call_args_list}, {self.snapshot})
+        self.assertEqual(
+            [(c[1]["date_filter"], c[1]["division"]) for c in find_rates.call_args_list],
+            [("2025-03-01", "Export"), ("2025-06-01", "Export"), ("2025-09-30", "Import")],
+        )
+
+        result, preload = self.run_batch([
+            self.lane("SGSIN", date_filter="2025-03-01"),
+            self.lane("SGSIN", date_filter="2025-09-30"),
+        ], date_filter="2025-06-01")
+        preload.assert_called_once_with(date(2025, 3, 1), date(2025, 9, 30))
+
+    def test_result_order(self):
+        """Test that results follow request order, each ranked cheapest first"""
+        result, _preload = self.run_batch([
+            self.lane("CNSHA", key="sha"),
+            self.lane("SGSIN", key="sin", limit=1),
+            self.lane("HKHKG", key="hkg"),
+        ], date_filter="2025-06-01")
+
+        results = result["results"]
+        self.assertEqual(list(results), ["sha", "sin", "hkg"])
+        self.assertEqual([o["rate_contract"] for o in results["sha"]], ["RC-BATCH-B", "RC-BATCH-A"])
+        self.assertEqual([o["buy_rate"] for o in results["sha"]], [1400.0, 1800.0])
+        self.assertEqual([o["rate_contract"] for o in results["sin"]], ["RC-BATCH-B"])
+        self.assertEqual(results["hkg"], [])
+        self.assertEqual(result["errors"], {})
+
+
+class TestRatePaging(FrappeTestCase):
+    """Test the bounded heap and cursor pagination over ranked options"""
+
+    def setUp(self):
+        """Set up five contracts on one lane, the dearest without a transit time"""
+        contracts = []
+        for i, base_rate in enumerate([500.0, 300.0, 900.0, 100.0, 700.0]):
+            name = f"RC-PAGE-{i}"
+            contracts.append(make_contract(
+                name,
+                rate_lanes=[frappe._dict(
+                    name=f"{name}-L", lane_type="Sea", pol="IDJKT", pod="SGSIN",
+                    transit=None if base_rate == 900.0 else 3,
+                )],
+                rate_bases=[make_base(f"{name}-L", base_rate)],
+            ))
+        self.snapshot = make_snapshot(*contracts)
+
+    def page(self, cursor=None, page_length=2):
+        with patch("freight_forwarding.utils.rate.rate_engine.get_rate_snapshot", return_value=self.snapshot), \
+                patch("freight_forwarding.utils.rate.rate_engine.get_quote_cache", return_value=QuoteCache(10, 600)), \
+                patch("freight_forwarding.utils.rate.rate_engine.get_fresh_cube_version", return_value=None):
+            return find_rates_page(
+                "Sea", "IDJKT", "SGSIN", "Sea", date_filter="2025-06-01", page_length=page_length, cursor=cursor
+            )
+
+    def test_bounded_heap(self):
+        """Test that only the best `limit` candidates are built into options"""
+        with patch.object(RateSnapshot, "build_option", autospec=True, side_effect=lambda self, c, *a, **k: c[0]) \
+                as build_option:
+            ranked = self.snapshot.compute_rates(
+                "Sea", "IDJKT", "SGSIN", "Sea", date(2025, 6, 1), None, None, None, None, None, None, limit=2
+            )
+
+        self.assertEqual(build_option.call_count, 2)
+        self.assertEqual([key[3] for key in ranked], ["RC-PAGE-3", "RC-PAGE-1"])
+
+    def test_pages_cover_all_options(self):
+        """Test that following next_cursor returns every option once, in rank order"""
+        pages = [self.page()]
+        while pages[-1]["next_cursor"]:
+            pages.append(self.page(pages[-1]["next_cursor"]))
+
+        self.assertEqual(
+            [[o["rate_contract"] for o in page["options"]] for page in pages],
+            [["RC-PAGE-3", "RC-PAGE-1"], ["RC-PAGE-0", "RC-PAGE-4"], ["RC-PAGE-2"]],
+        )
+
+    def test_cursor_without_infinity(self):
+        """Test that an unknown transit is encoded as null and decodes back to infinity"""
+        rank_key = (0, 900.0, float("inf"), "RC-PAGE-2", "RC-PAGE-2-L")
+        cursor = encode_rank_cursor(rank_key)
+
+        self.assertNotIn("Infinity", base64.urlsafe_b64decode(cursor).decode())
+        self.assertEqual(decode_rank_cursor(cursor), rank_key)
+
+    def test_bad_cursor(self):
+        """Test that a malformed or tampered cursor is rejected"""
+        tampered = base64.urlsafe_b64encode(json.dumps([0, 1.0, 3]).encode()).decode()
+        for cursor in ["not-a-cursor", tampered]:
+            with self.assertRaises(Exception):
+                self.page(cursor)
+
+
+class TestRateTimeline(FrappeTestCase):
+    """Test historical rate timelines priced once per period"""
+
+    def test_fuel_index_change_starts_period(self):
+        """Test that a fuel index taking effect mid-range starts a new period with its own buy rate"""
+        snapshot = make_snapshot(make_contract(
+            "RC-TIMELINE",
+            rate_lanes=[frappe._dict(name="L-SEA", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+            rate_bases=[make_base("L-SEA", 500.0)],
+            validity_from="2025-01-01",
+            validity_to="2025-12-31",
+        ))
+        snapshot.adjustments = AdjustmentStore(fallback=False)
+        fuel = [frappe._dict(mode="Sea", effective_date="2025-06-15", adjustment_percent=10)]
+
+        with patch("freight_forwarding.utils.rate.rate_engine.get_rate_snapshot", return_value=snapshot), \
+                patch("freight_forwarding.utils.rate.rate_engine.get_quote_cache", return_value=QuoteCache(10, 600)), \
+                patch("freight_forwarding.utils.rate.rate_engine.get_fresh_cube_version", return_value=None), \
+                patch("frappe.get_all", return_value=fuel):
+            timeline = get_rate_timeline("Sea", "IDJKT", "SGSIN", "Sea", "2025-06-01", "2025-06-30")
+
+        self.assertEqual(
+            [(p["from_date"], p["to_date"], p["best"]["buy_rate"]) for p in timeline],
+            [
+                (date(2025, 6, 1), date(2025, 6, 14), 500.0),
+                (date(2025, 6, 15), date(2025, 6, 30), 550.0),
+            ],
+        )
+
+
+class TestRateCube(FrappeTestCase):
+    """Test that quotes from the rate cube match live pricing"""
+
+    def setUp(self):
+        """Set up a contract with weight breaks, a per_km lane and surcharges"""
+        self.contract = make_contract(
+            "RC-CUBE-001",
+            mode="Air\nLand",
+            validity_from="2025-01-01",
+            validity_to="2025-12-31",
+            rate_lanes=[
+                frappe._dict(name="L-AIR", lane_type="Air", aoo="CGK", aod="SIN", transit=1,
+                             chargeable_rule="Weight or Volume"),
+                frappe._dict(name="L-LAND", lane_type="Land", origin="Jakarta", destination="Bandung",
+                             transit=1, basis="per_km", distance=150),
+            ],
+            rate_bases=[
+                make_base("L-AIR", 5.0, weight_break_from=0, weight_break_to=45),
+                make_base("L-AIR", 4.0, weight_break_from=45, weight_break_to=1000),
+                make_base("L-LAND", 2.0),
+            ],
+            rate_surcharges=[
+                frappe._dict(surcharge_code="FSC", calc_type="per_kg", amount=0.5),
+                frappe._dict(surcharge_code="DOC", calc_type="flat", amount=25),
+            ],
+        )
+        self.snapshot = make_snapshot(self.contract)
+        self.index = self.snapshot.rate_index
+        self.cube_rows = [frappe._dict(zip(CUBE_FIELDS, row)) for row in flatten_contract(self.contract)]
+
+    def quote(self, lane_key, weight=None, cbm=None):
+        mode, origin, destination = lane_key
+        snapshot = self.snapshot
+        live = [c[3] for c in snapshot.iter_candidates(
+            mode, origin, destination, mode, date(2025, 6, 1), weight, cbm, None
+        )]
+
+        rows = [
+            r for r in self.cube_rows
+            if (r.mode, r.origin, r.destination) == lane_key
+        ]
+        with patch("freight_forwarding.utils.rate.rate_engine.query_rate_cube", return_value=rows):
+            cube = [c[3] for c in snapshot.iter_cube_candidates(
+                mode, origin, destination, mode, date(2025, 6, 1), weight, cbm, None
+            )]
+        return live, cube
+
+    def test_weight_break_lane(self):
+        """Test a chargeable-weight air quote"""
+        live, cube = self.quote(("Air", "CGK", "SIN"), weight=30, cbm=0.5)
+        self.assertEqual(live, cube)
+        # 0.5 CBM = 83.33 kg volumetric, 4.0/kg break
+        self.assertAlmostEqual(cube[0], 4.0 + 25 + 0.5 * 500 / 6)
+
+    def test_per_km_lane(self):
+        """Test that per_km base rates are flattened with the lane distance"""
+        live, cube = self.quote(("Land", "Jakarta", "Bandung"))
+        self.assertEqual(live, cube)
+        self.assertEqual(cube[0], 2.0 * 150 + 25)
+
+    def test_contract_save_changes_only_its_lanes(self):
+        """Test that a contract save invalidates cube quotes on the lanes it changed, once committed"""
+        air = ("Air", "Air", "CGK", "SIN")
+        land = ("Land", "Land", "Jakarta", "Bandung")
+        before = cube_lane_generation(*air), cube_lane_generation(*land)
+
+        callbacks = []
+        with patch.object(frappe.db.after_commit, "add", side_effect=callbacks.append), \
+                patch("frappe.db.delete"), patch("frappe.db.bulk_insert"):
+            update_cube_contract(self.contract.name, self.contract, {
+                "previous_modified": "2025-01-01 00:00:00",
+                "changed_keys": [air],
+            })
+        self.assertEqual((cube_lane_generation(*air), cube_lane_generation(*land)), before)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cube_lane_generation(*air), before[0])
+        self.assertEqual(cube_lane_generation(*land), before[1])
+
+        # Another save moving the cube to a new index version keeps the Land stamp
+        self.assertEqual(
+            self.snapshot.quote_stamp("Land", "Jakarta", "Bandung", "Land", cube_version="v2")[0], ("cube", before[1])
+        )
+
+
+    def test_scheduled_build_skipped_while_fresh(self):
+        """Test that the hourly rebuild only runs for a stale cube, and a forced one always"""
+        module = "freight_forwarding.utils.rate.rate_cube"
+        for fresh_version, force, enqueued in (("v1", False, False), (None, False, True), ("v1", True, True)):
+            with patch(f"{module}.get_fresh_cube_version", return_value=fresh_version), \
+                    patch(f"{module}.frappe.enqueue", create=True) as enqueue:
+                enqueue_rate_cube_build(force=force)
+            self.assertEqual(enqueue.called, enqueued)
+
+
+class FakeRouteSnapshot:
+    """Prices every lane from a {(origin, destination): (cost, transit)} table"""
+
+    def __init__(self, prices):
+        self.prices = prices
+
+    def iter_candidates(self, lane_type, origin, destination, mode, date_filter, weight, cbm, container_type):
+        if (origin, destination) in self.prices:
+            cost, transit = self.prices[(origin, destination)]
+            yield (0, cost, transit, "CONTRACT", origin + destination), None, None, cost, 1.0, None
+
+
+class FakeRouteGraph:
+    """Adjacency lists of (from, to, mode, lane_type, origin, destination) edges"""
+
+    def __init__(self, edges):
+        self.edges = {}
+        for edge in edges:
+            self.edges.setdefault(edge[0], set()).add(edge)
+
+    def out_edges(self, node):
+        return self.edges.get(node, ())
+
+
+class TestRouteFinder(FrappeTestCase):
+    """Test k-shortest multi-leg itineraries"""
+
+    def setUp(self):
+        """Set up a graph: A-B direct, A-C-B, and A-C-D-B"""
+        prices = {
+            ("A", "B"): (1000, 30),
+            ("A", "C"): (200, 2),
+            ("C", "B"): (500, 20),
+            ("C", "D"): (100, 5),
+            ("D", "B"): (100, 5),
+        }
+        self.snapshot = FakeRouteSnapshot(prices)
+        self.graph = FakeRouteGraph([(o, d, "Sea", "Sea", o, d) for o, d in prices])
+
+    def route(self, path):
+        return [edge[0] for edge in path] + [path[-1][1]]
+
+    def test_k_shortest_by_cost(self):
+        """Test that itineraries come back cheapest first"""
+        finder = RouteFinder(self.snapshot, self.graph, None, max_legs=3)
+        routes = finder.k_shortest("A", "B", 3)
+
+        self.assertEqual([total for total, _path in routes], [400, 700, 1000])
+        self.assertEqual(self.route(routes[0][1]), ["A", "C", "D", "B"])
+
+    def test_max_legs(self):
+        """Test that itineraries longer than max_legs are skipped"""
+        finder = RouteFinder(self.snapshot, self.graph, None, max_legs=2)
+        routes = finder.k_shortest("A", "B", 3)
+
+        self.assertEqual([total for total, _path in routes], [700, 1000])
+
+    def test_transit_metric(self):
+        """Test ranking by transit days"""
+        finder = RouteFinder(self.snapshot, self.graph, None, metric="transit", max_legs=3)
+        routes = finder.k_shortest("A", "B", 1)
+
+        self.assertEqual(routes[0][0], 12)
+
+
+class TestRepricingSimulator(FrappeTestCase):
+    """Test what-if repricing on a detached snapshot"""
+
+    def setUp(self):
+        """Set up a snapshot with one Sea contract and no pricing rules"""
+        self.snapshot = make_snapshot(make_contract(
+            "RC-SIM-001",
+            status="Draft",
+            rate_lanes=[frappe._dict(name="L-SEA", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+            rate_bases=[make_base("L-SEA", 800.0)],
+        ))
+
+    def shipment(self, project, origin="IDJKT", destination="SGSIN", actual_margin=100, billed=1000):
+        return (project, "Sea", origin, destination, date(2025, 6, 1), None, None, None, "Export",
+                actual_margin, billed)
+
+    def test_snapshot_pickles(self):
+        """Test that a snapshot prices the same after a round trip to a worker process"""
+        shipment = self.shipment("PRJ-1")
+        copied = pickle.loads(pickle.dumps(self.snapshot))
+        self.assertEqual(price_shipment(copied, shipment), price_shipment(self.snapshot, shipment))
+
+    def test_margin_deltas(self):
+        """Test billed-basis margins and unpriced projects"""
+        shipments = [self.shipment("PRJ-1"), self.shipment("PRJ-2", destination="HKHKG")]
+        results = [price_shipment(self.snapshot, s) for s in shipments]
+        summary = aggregate_margins(shipments, results, margin_basis="billed")
+
+        self.assertEqual(summary["unpriced"], ["PRJ-2"])
+        self.assertEqual(summary["totals"]["simulated_margin"], 200)
+        self.assertEqual(summary["totals"]["margin_delta"], 100)
+        self.assertEqual(summary["by_division"]["Export"]["projects"], 1)
+
+    def test_land_legs_left_out(self):
+        """Test that Land legs, without endpoints on the Project, are not simulated"""
+        projects = [
+            frappe._dict(name="PRJ-1", mode="Sea\nLand", pol="IDJKT", pod="SGSIN", etd="2025-06-01"),
+            frappe._dict(name="PRJ-2", mode="Land", etd="2025-06-01"),
+            frappe._dict(name="PRJ-3", mode="Air", aoo="CGK", aod="SIN", etd="2025-06-01"),
+        ]
+        with patch("frappe.get_all", side_effect=[projects, []]):
+            shipments = load_shipments(["PRJ-1", "PRJ-2", "PRJ-3"])
+
+        self.assertEqual([s[:4] for s in shipments], [
+            ("PRJ-1", "Sea", "IDJKT", "SGSIN"),
+            ("PRJ-3", "Air", "CGK", "SIN"),
+        ])
+
+        results = [price_shipment(self.snapshot, s) for s in shipments]
+        summary = aggregate_margins(shipments, results)
+        self.assertEqual(summary["unpriced"], ["PRJ-3"])
+        self.assertEqual(summary["by_mode"]["Sea"]["projects"], 1)
+
+
+class TestBulkRepricing(FrappeTestCase):
+    """Test that vectorized pricing agrees with single-shipment pricing"""
+
+    def setUp(self):
+        """Set up Air and per_km Land lanes, a cheaper Air contract, and a mid-June fuel index change"""
+        self.contract = make_contract(
+            "RC-BULK-001",
+            mode="Air\nLand",
+            rate_lanes=[
+                frappe._dict(name="L-AIR", lane_type="Air", aoo="CGK", aod="SIN", transit=1,
+                             chargeable_rule="Weight or Volume"),
+                frappe._dict(name="L-LAND", lane_type="Land", origin="Jakarta", destination="Bandung",
+                             transit=1, basis="per_km", distance=150),
+            ],
+            rate_bases=[
+                make_base("L-AIR", 5.0, weight_break_from=0, weight_break_to=45),
+                make_base("L-AIR", 4.0, weight_break_from=45, weight_break_to=1000),
+                make_base("L-LAND", 2.0),
+            ],
+            rate_surcharges=[
+                frappe._dict(surcharge_code="FSC", calc_type="per_kg", amount=0.5),
+                frappe._dict(surcharge_code="DOC", calc_type="flat", amount=25),
+                frappe._dict(surcharge_code="SEC", calc_type="percent", amount=10),
+            ],
+        )
+        cheap_heavy = make_contract(
+            "RC-BULK-002",
+            mode="Air",
+            rate_lanes=[frappe._dict(name="L-AIR-2", lane_type="Air", aoo="CGK", aod="SIN", transit=2,
+                                     chargeable_rule="Weight")],
+            rate_bases=[make_base("L-AIR-2", 3.0, weight_break_from=100, weight_break_to=1000)],
+        )
+        self.snapshot = make_snapshot(self.contract, cheap_heavy)
+        self.snapshot.adjustments = AdjustmentStore(fallback=False)
+        fuel = [
+            frappe._dict(mode="Air", effective_date="2025-06-15", adjustment_percent=8),
+            frappe._dict(mode="Land", effective_date="2025-01-01", adjustment_percent=-2),
+        ]
+        with patch("frappe.get_all", return_value=fuel):
+            self.snapshot.adjustments.preload_fuel()
+
+        self.dates = [date(2025, 6, 1), date(2025, 6, 15), date(2025, 6, 30), date(2025, 6, 1), date(2025, 6, 20)]
+        self.weights = [30, 80, None, 5000, 150]
+        self.cbms = [0.5, None, 0.9, 1, 0.1]
+
+    def test_buy_rates_match_scalar(self):
+        """Test chargeable weight, per_km distance and fuel index against `calculate_buy_rate`"""
+        for lane in self.contract.rate_lanes:
+            buy_rates = calculate_buy_rates(
+                self.contract, lane, [flt(w) for w in self.weights], [flt(c) for c in self.cbms],
+                dates=self.dates, adjustments=self.snapshot.adjustments,
+            )
+            expected = [
+                calculate_buy_rate(
+                    self.contract, lane, weight, cbm, date_filter=day, adjustments=self.snapshot.adjustments
+                )
+                for weight, cbm, day in zip(self.weights, self.cbms, self.dates)
+            ]
+            self.assertEqual(
+                [None if math.isnan(rate) else round(rate, 6) for rate in buy_rates],
+                [None if rate is None else round(rate, 6) for rate in expected],
+            )
+
+    def test_simulator_matches_compute_rates(self):
+        """Test that bulk repricing picks the option `compute_rates` ranks first"""
+        shipments = [
+            (f"PRJ-{i}", "Air", "CGK", "SIN", day, weight, cbm, None, "Export", 0, 0)
+            for i, (day, weight, cbm) in enumerate(zip(self.dates, self.weights, self.cbms))
+        ]
+        expected = []
+        for shipment in shipments:
+            options = self.snapshot.compute_rates(
+                "Air", "CGK", "SIN", "Air", shipment[4], shipment[5], shipment[6], None, "Export", None, None,
+                limit=1,
+            )
+            best = options[0] if options else {}
+            expected.append((
+                shipment[0], "Air", best.get("base_buy_rate"), best.get("base_sell_rate"), best.get("rate_contract")
+            ))
+
+        self.assertEqual(price_shipments(self.snapshot, shipments, workers=1), expected)
+        self.assertEqual({e[4] for e in expected}, {"RC-BULK-001", "RC-BULK-002", None})
+
+
+class TestRateProfile(FrappeTestCase):
+    """Test per-stage profiling of rate engine calls"""
+
+    def setUp(self):
+        """Set up a snapshot with one Sea lane and a flat surcharge"""
+        self.snapshot = make_snapshot(make_contract(
+            "RC-PROF-001",
+            rate_lanes=[frappe._dict(name="L-SEA", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=3)],
+            rate_bases=[make_base("L-SEA", 800.0)],
+            rate_surcharges=[frappe._dict(surcharge_code="DOC", calc_type="flat", amount=25)],
+        ))
+
+    def test_stages_and_counts(self):
+        """Test that a profiled call times each stage and counts lanes and options"""
+        with rate_profile("test_quote", force=True) as profile:
+            options = self.snapshot.compute_rates(
+                "Sea", "IDJKT", "SGSIN", "Sea", date(2025, 6, 1), None, None, None, None, None, None
+            )
+        result = profile.as_dict()
+
+        self.assertEqual(len(options), 1)
+        self.assertEqual(set(result["stages"]), {"lane_match", "base_rate", "surcharges", "pricing_rules"})
+        self.assertEqual(result["counts"]["lanes"], 1)
+
+    def test_unprofiled_call(self):
+        """Test that calls outside debug mode and sampling are not profiled"""
+        with rate_profile("test_quote") as profile:
+            self.assertIsNone(profile)
+
+    def test_nested_calls(self):
+        """Test that a nested call shares the outer profile"""
+        with rate_profile("outer", force=True) as outer:
+            with rate_profile("inner") as inner:
+                self.assertIs(inner, outer)
+
+    def test_histogram_quantile(self):
+        """Test percentiles from bucket counts"""
+        buckets = {"1": 50, "10": 45, "100": 5}
+        self.assertEqual(histogram_quantile(buckets, 100, 0.5), 1)
+        self.assertEqual(histogram_quantile(buckets, 100, 0.95), 10)
+        self.assertIsNone(histogram_quantile({}, 0, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Compiled Rate Index
+"""
+
+import pickle
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.rate import rate_index
+from freight_forwarding.utils.rate.contract_versions import diff_fingerprints, index_keys, lane_fingerprints
+from freight_forwarding.utils.rate.rate_index import CompiledContract, RateIndex, refresh_contract
+from freight_forwarding.utils.rate.records import LaneRecord
+
+
+def make_contract(name="RC-TEST-001", mode="Sea", validity_from="2025-01-01", validity_to="2025-12-31", lanes=None,
+                  bases=None, modified="2025-01-01 00:00:00"):
+    """Build a CompiledContract without touching the database"""
+    header = frappe._dict(
+        name=name,
+        vendor="Test Carrier",
+        carrier=None,
+        currency="USD",
+        status="Active",
+        mode=mode,
+        validity_from=validity_from,
+        validity_to=validity_to,
+        modified=modified,
+    )
+    lanes = lanes or [
+        frappe._dict(name=f"{name}-L1", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=2),
+    ]
+    return CompiledContract(header, rate_lanes=lanes, rate_bases=bases)
+
+
+class TestRateIndex(FrappeTestCase):
+    """Test lane lookup in the compiled rate index"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.index = RateIndex()
+        self.index.add_contract(make_contract())
+
+    def test_lookup_matches_lane_key(self):
+        """Test lookup by (mode, lane_type, origin, destination)"""
+        matches = self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0][0].name, "RC-TEST-001")
+
+        self.assertEqual(self.index.lookup("Sea", "Sea", "SGSIN", "IDJKT", "2025-06-01"), [])
+        self.assertEqual(self.index.lookup("Air", "Sea", "IDJKT", "SGSIN", "2025-06-01"), [])
+
+    def test_lookup_respects_validity(self):
+        """Test that contracts outside their validity window are excluded"""
+        self.assertEqual(len(self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-12-31")), 1)
+        self.assertEqual(self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2026-01-01"), [])
+
+    def test_replace_and_remove_contract(self):
+        """Test incremental reindex of a single contract"""
+        updated = make_contract(lanes=[
+            frappe._dict(name="RC-TEST-001-L2", lane_type="Sea", pol="IDJKT", pod="CNSHA", transit=7),
+        ])
+        self.index.add_contract(updated)
+        self.assertEqual(self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01"), [])
+        self.assertEqual(len(self.index.lookup("Sea", "Sea", "IDJKT", "CNSHA", "2025-06-01")), 1)
+
+        self.index.remove_contract("RC-TEST-001")
+        self.assertEqual(self.index.lanes, {})
+
+    def test_validity_changes(self):
+        """Test change points of a lane between two dates"""
+        self.index.add_contract(make_contract("RC-TEST-002", validity_from="2025-07-01", validity_to="2026-06-30"))
+        changes = self.index.validity_changes("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01", "2026-01-31")
+        self.assertEqual(changes, [date(2025, 7, 1), date(2026, 1, 1)])
+
+    def test_refresh_contract_waits_for_commit(self):
+        """Test that a contract save reaches the worker's index only once committed"""
+        updated = make_contract(lanes=[
+            frappe._dict(name="RC-TEST-001-L2", lane_type="Sea", pol="IDJKT", pod="CNSHA", transit=7),
+        ])
+        callbacks = []
+        with patch.object(rate_index, "_rate_index", self.index), \
+                patch.object(frappe.db.after_commit, "add", side_effect=callbacks.append), \
+                patch.object(rate_index, "load_contracts", return_value=[updated]), \
+                patch.object(rate_index, "publish_contract_change"), \
+                patch("freight_forwarding.utils.rate.rate_cube.get_fresh_cube_version", return_value=None):
+            refresh_contract("RC-TEST-001")
+
+            # Until commit (and after a rollback) the index keeps the committed contract
+            self.assertEqual(len(self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01")), 1)
+            self.assertEqual(self.index.lookup("Sea", "Sea", "IDJKT", "CNSHA", "2025-06-01"), [])
+
+            for callback in callbacks:
+                callback()
+            self.assertEqual(self.index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01"), [])
+            self.assertEqual(len(self.index.lookup("Sea", "Sea", "IDJKT", "CNSHA", "2025-06-01")), 1)
+
+
+class TestContractVersions(FrappeTestCase):
+    """Test lane fingerprint deltas and incremental reindex"""
+
+    def make_version(self, rates, modified):
+        """Contract with one lane per (pod, base rate)"""
+        lanes = [
+            frappe._dict(name=f"L-{pod}-{modified}", lane_type="Sea", pol="IDJKT", pod=pod, transit=5)
+            for pod in rates
+        ]
+        bases = [
+            frappe._dict(rate_lane=f"L-{pod}-{modified}", container_type="20GP", base_rate=rate)
+            for pod, rate in rates.items()
+        ]
+        return make_contract("RC-VERSION", lanes=lanes, bases=bases, modified=modified)
+
+    def test_diff_by_content_not_row_name(self):
+        """Test that re-entered rows with the same rates are unchanged"""
+        old = self.make_version({"SGSIN": 900, "CNSHA": 1200}, "2025-01-01 00:00:00")
+        new = self.make_version({"SGSIN": 900, "CNSHA": 1300, "HKHKG": 1000}, "2025-02-01 00:00:00")
+
+        delta = diff_fingerprints(lane_fingerprints(old), lane_fingerprints(new))
+
+        self.assertEqual(len(delta["added"]), 1)
+        self.assertEqual(len(delta["repriced"]), 1)
+        self.assertEqual(delta["removed"], [])
+        self.assertEqual(
+            index_keys(delta["repriced"], ["Sea"]), {("Sea", "Sea", "IDJKT", "CNSHA")}
+        )
+
+    def test_replace_contract_invalidates_changed_lanes_only(self):
+        """Test that only lanes in the delta get a new generation"""
+        old = self.make_version({"SGSIN": 900, "CNSHA": 1200}, "2025-01-01 00:00:00")
+        new = self.make_version({"SGSIN": 900, "CNSHA": 1300}, "2025-02-01 00:00:00")
+
+        index = RateIndex()
+        index.add_contract(old)
+        before = dict(index.lane_generations)
+
+        index.replace_contract(new, {
+            "previous_modified": "2025-01-01 00:00:00",
+            "modified": "2025-02-01 00:00:00",
+            "changed_keys": [("Sea", "Sea", "IDJKT", "CNSHA")],
+        })
+
+        sgsin = ("Sea", "Sea", "IDJKT", "SGSIN")
+        cnsha = ("Sea", "Sea", "IDJKT", "CNSHA")
+        self.assertEqual(index.lane_generations[sgsin], before[sgsin])
+        self.assertNotEqual(index.lane_generations[cnsha], before[cnsha])
+        self.assertIs(index.lookup("Sea", "Sea", "IDJKT", "SGSIN", "2025-06-01")[0][0], new)
+
+
+class TestCompactRecords(FrappeTestCase):
+    """Test compact child records and the index memory estimate"""
+
+    def test_rows_become_records(self):
+        """Test that rows keep only engine fields, with row-style access"""
+        contract = make_contract(lanes=[
+            frappe._dict(name="L1", lane_type="Sea", pol="IDJKT", pod="SGSIN", transit=2, notes="long text"),
+        ])
+        lane = contract.rate_lanes[0]
+
+        self.assertIsInstance(lane, LaneRecord)
+        self.assertEqual(lane.pol, "IDJKT")
+        self.assertEqual(lane.get("pod"), "SGSIN")
+        self.assertIsNone(lane.get("distance"))
+        self.assertIsNone(lane.get("notes"))
+        self.assertFalse(hasattr(lane, "__dict__"))
+
+    def test_records_pickle(self):
+        """Test that compiled contracts survive a round trip to another process"""
+        contract = pickle.loads(pickle.dumps(make_contract()))
+        self.assertEqual(contract.rate_lanes[0].pod, "SGSIN")
+
+    def test_memory_estimate(self):
+        """Test that the index memory estimate follows added and removed contracts"""
+        index = RateIndex()
+        index.add_contract(make_contract(name="RC-A"))
+        index.add_contract(make_contract(name="RC-B"))
+        self.assertGreater(index.memory, 0)
+
+        index.remove_contract("RC-A")
+        index.remove_contract("RC-B")
+        self.assertEqual(index.memory, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Rate Sheet Import
+"""
+
+import unittest
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.rate.rate_sheet_import import RateSheetImporter, clean
+
+
+class TestRateSheetImporter(FrappeTestCase):
+    """Test row validation and lane grouping without writing rows"""
+
+    def setUp(self):
+        """Set up an importer that never reaches its chunk size"""
+        self.importer = RateSheetImporter(
+            "RC-IMPORT-TEST", ["Sea", "Air"], {"IDJKT", "SGSIN"}, {"CGK", "SIN"}, chunk_size=10000
+        )
+
+    def test_rows_of_a_lane_share_one_lane(self):
+        """Test that base rows with the same lane columns link to one FF Rate Lane"""
+        for container_type, rate in (("20GP", 900), ("40HC", 1500)):
+            self.importer.add_row(2, {
+                "lane_type": "Sea", "pol": "idjkt", "pod": "SGSIN", "transit": "2",
+                "container_type": container_type, "base_rate": rate,
+            })
+
+        lanes = self.importer.pending["FF Rate Lane"]
+        bases = self.importer.pending["FF Rate Base"]
+        self.assertEqual(len(lanes), 1)
+        self.assertEqual(lanes[0]["pol"], "IDJKT")
+        self.assertEqual({b["rate_lane"] for b in bases}, {lanes[0]["name"]})
+
+    def test_row_errors(self):
+        """Test that invalid rows are reported and skipped"""
+        self.importer.add_row(2, {"lane_type": "Sea", "pol": "IDJKT", "pod": "XXXXX", "base_rate": 1})
+        self.importer.add_row(3, {"lane_type": "Land", "origin": "Jakarta", "destination": "Bandung", "base_rate": 1})
+        self.importer.add_row(4, {"surcharge_code": "BAF", "calc_type": "per_teu", "amount": 10})
+        self.importer.add_row(5, {"surcharge_code": "BAF", "calc_type": "per_cntr", "amount": 10})
+
+        self.assertEqual([e["row"] for e in self.importer.errors], [2, 3, 4])
+        self.assertEqual(len(self.importer.pending["FF Rate Surcharge"]), 1)
+
+    def test_overlapping_weight_breaks(self):
+        """Test that overlapping weight breaks are reported"""
+        for row_no, (start, end) in enumerate(((0, 45), (45, 100), (90, 500)), start=2):
+            self.importer.add_row(row_no, {
+                "lane_type": "Air", "aoo": "CGK", "aod": "SIN",
+                "weight_break_from": start, "weight_break_to": end, "base_rate": 5,
+            })
+        self.importer.check_weight_breaks()
+
+        self.assertEqual([e["row"] for e in self.importer.errors], [4])
+
+
+    def test_numeric_cells(self):
+        """Test that integral numeric cells become codes without a trailing .0"""
+        self.assertEqual(clean(123.0, "pol"), "123")
+        self.assertEqual(clean(12.5, "service"), "12.5")
+        self.assertEqual(clean(" sgsin ", "pod"), "SGSIN")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests for Rate Cache Warmup
+"""
+
+import unittest
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from freight_forwarding.utils.rate import adjustments, rate_index, routing
+from freight_forwarding.utils.rate.warmup import warm_up
+
+
+class TestWarmup(FrappeTestCase):
+    """Test the warmup steps, memory budget and report"""
+
+    def setUp(self):
+        """Start from a cold worker with a 100 MB budget"""
+        self.saved = rate_index._rate_index, adjustments._store, routing._graph
+        rate_index._rate_index = adjustments._store = routing._graph = None
+        frappe.conf.ff_rate_warmup_memory_mb = 100
+
+    def tearDown(self):
+        rate_index._rate_index, adjustments._store, routing._graph = self.saved
+        frappe.conf.pop("ff_rate_warmup_memory_mb", None)
+
+    def warm_up(self, step_memory, company_currency="IDR"):
+        """
+        Run the warmup with each step growing memory by the given MB.
+
+        Returns:
+            dict: Warmup report
+        """
+        step_memory = iter(step_memory)
+        memory = {"rss": 1000.0}
+
+        def rss():
+            return memory["rss"]
+
+        def grow(*args, **kwargs):
+            memory["rss"] += next(step_memory)
+
+        with patch("freight_forwarding.utils.rate.warmup.get_rss_mb", side_effect=rss), \
+                patch("freight_forwarding.utils.rate.pricing_rules.get_pricing_rule_matcher", side_effect=grow), \
+                patch("freight_forwarding.utils.item_groups.get_freight_service_groups", side_effect=grow), \
+                patch("freight_forwarding.utils.rate.routing.get_transfers",
+                      return_value={"version": "t1", "pairs": []}), \
+                patch("freight_forwarding.utils.rate.rate_index.RateIndex.sync", side_effect=grow), \
+                patch("freight_forwarding.utils.rate.adjustments.get_shared_version", return_value="a1"), \
+                patch("freight_forwarding.utils.rate.adjustments.get_company_currency",
+                      return_value=company_currency), \
+                patch("freight_forwarding.utils.rate.adjustments.AdjustmentStore.preload_fx") as preload_fx, \
+                patch("freight_forwarding.utils.rate.adjustments.AdjustmentStore.preload_fuel", side_effect=grow), \
+                patch("frappe.cache") as cache:
+            report = warm_up()
+
+        self.preload_fx = preload_fx
+        self.assertEqual(cache().hset.call_args[0][2], report)
+        return report
+
+    def test_report_contents(self):
+        """Test that every step is reported with its time and memory, and the worker gets what was built"""
+        report = self.warm_up([5, 1, 20, 10])
+
+        self.assertEqual(
+            [(s["step"], s["status"]) for s in report["steps"]],
+            [("pricing_rules", "Loaded"), ("item_groups", "Loaded"), ("transfers", "Loaded"),
+             ("rate_index", "Loaded"), ("adjustments", "Loaded"), ("route_graph", "Loaded")],
+        )
+        self.assertEqual([s["memory_mb"] for s in report["steps"]], [5, 1, 0, 20, 10, 0])
+        self.assertEqual((report["memory_mb"], report["memory_budget_mb"]), (36, 100))
+        self.assertTrue(report["within_budget"])
+        self.assertNotIn("over_budget_mb", report)
+        self.assertEqual(report["rate_index"]["contracts"], 0)
+
+        self.assertIsNotNone(rate_index._rate_index)
+        self.assertEqual(adjustments._store.version, "a1")
+        self.assertEqual(routing._graph.transfer_version, "t1")
+        self.preload_fx.assert_called_once()
+        self.assertEqual(self.preload_fx.call_args[0][2:], (set(), "IDR"))
+
+    def test_budget_skips_remaining_steps(self):
+        """Test that steps after the one crossing the budget are skipped and the overshoot reported"""
+        report = self.warm_up([5, 1, 130])
+
+        statuses = {s["step"]: s for s in report["steps"]}
+        self.assertEqual(statuses["rate_index"]["status"], "Loaded")
+        self.assertEqual(statuses["rate_index"]["over_budget_mb"], 36)
+        self.assertEqual(statuses["adjustments"], {"step": "adjustments", "status": "Skipped"})
+        self.assertEqual(statuses["route_graph"]["status"], "Skipped")
+        self.assertFalse(report["within_budget"])
+        self.assertEqual(report["over_budget_mb"], 36)
+
+        self.assertIsNone(adjustments._store)
+        self.assertIsNone(routing._graph)
+
+    def test_keeps_index_loaded_by_a_request(self):
+        """Test that an index a request loaded while warming up is not replaced"""
+        loaded_by_request = rate_index._rate_index = rate_index.RateIndex()
+        self.warm_up([0, 0, 0, 0])
+
+        self.assertIs(rate_index._rate_index, loaded_by_request)
+        self.assertIsNone(routing._graph)
+        self.assertEqual(adjustments._store.version, "a1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Chargeable Weight
+
+Chargeable weight by mode-specific volumetric divisor, shared by the rate
+engine (weight breaks, per_kg surcharges) and consol allocation
+(by_chargeable), so pricing and cost splits agree.
+
+Chargeable rules (FF Rate Lane `chargeable_rule`, Consol Member `chargeable`):
+- Weight: gross weight
+- Volume: volumetric weight (CBM × 1,000,000 / divisor)
+- Weight or Volume: the higher of the two (default)
+
+All functions accept scalars or arrays (NumPy), so many shipments or
+members are computed in one pass.
+"""
+
+import numpy as np
+from frappe.utils import flt
+
+from freight_forwarding.utils.constants import VOLUMETRIC_DIVISORS
+
+DEFAULT_RULE = "Weight or Volume"
+
+# Divisor used when the mode is unknown (Sea W/M)
+DEFAULT_DIVISOR = VOLUMETRIC_DIVISORS["Sea"]
+
+
+def kg_per_cbm(mode):
+    """Volumetric kg per CBM of a mode"""
+    return 1000000 / VOLUMETRIC_DIVISORS.get(mode, DEFAULT_DIVISOR)
+
+
+def volumetric_weight(cbm, mode):
+    """
+    Volumetric weight in kg.
+
+    Args:
+        cbm: Volume in CBM (scalar or array)
+        mode: "Sea", "Air", or "Land"
+
+    Returns:
+        float or numpy.ndarray
+    """
+    if np.ndim(cbm):
+        return np.asarray(cbm, dtype=float) * kg_per_cbm(mode)
+    return flt(cbm) * kg_per_cbm(mode)
+
+
+def chargeable_weight(weight, cbm, mode, rule=None):
+    """
+    Chargeable weight in kg.
+
+    Args:
+        weight: Gross weight in kg (scalar or array)
+        cbm: Volume in CBM (scalar or array)
+        mode: "Sea", "Air", or "Land"
+        rule: "Weight", "Volume" or "Weight or Volume" (default)
+
+    Returns:
+        float or numpy.ndarray
+    """
+    if np.ndim(weight) or np.ndim(cbm):
+        weight, volume = np.broadcast_arrays(
+            np.nan_to_num(np.asarray(weight, dtype=float)),
+            np.nan_to_num(np.asarray(volumetric_weight(np.nan_to_num(np.asarray(cbm, dtype=float)), mode))),
+        )
+        if rule == "Weight":
+            return weight.copy()
+        if rule == "Volume":
+            return volume.copy()
+        return np.maximum(weight, volume)
+
+    weight = flt(weight)
+    volume = volumetric_weight(cbm, mode)
+    if rule == "Weight":
+        return weight
+    if rule == "Volume":
+        return volume
+    return max(weight, volume)
+
+
+def lane_chargeable_weight(lane, weight=None, cbm=None):
+    """
+    Chargeable weight of a shipment on an FF Rate Lane.
+
+    Uses the lane's chargeable_rule and the volumetric divisor of its
+    lane_type. When the measure the rule asks for is not given, the other
+    one is used; None when neither is.
+
+    Args:
+        lane: FF Rate Lane row
+        weight: Gross weight in kg (scalar or array, optional)
+        cbm: Volume in CBM (scalar or array, optional)
+
+    Returns:
+        float or None; numpy.ndarray (NaN where neither is given) for arrays
+    """
+    rule = lane.get("chargeable_rule") or DEFAULT_RULE
+    mode = lane.get("lane_type")
+
+    if np.ndim(weight) or np.ndim(cbm):
+        weight, cbm = np.broadcast_arrays(
+            np.nan_to_num(np.asarray(weight, dtype=float)), np.nan_to_num(np.asarray(cbm, dtype=float))
+        )
+        result = np.where(
+            cbm == 0,
+            weight,
+            np.where(weight == 0, volumetric_weight(cbm, mode), chargeable_weight(weight, cbm, mode, rule)),
+        )
+        result[(weight == 0) & (cbm == 0)] = np.nan
+        return result
+
+    if not weight and not cbm:
+        return None
+
+    if not cbm:
+        rule = "Weight"
+    elif not weight:
+        rule = "Volume"
+
+    return chargeable_weight(weight, cbm, mode, rule)
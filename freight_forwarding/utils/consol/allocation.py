@@ -8,14 +8,30 @@ Allocation methods:
 - by_chargeable: Allocate by Chargeable Weight/Volume
 - equal: Equal split among all members
 - by_slot: Allocate by slot (1 slot per member)
-- manual_pct: Manual percentage allocation
+- manual_pct: Manual percentage per member (FF Consol Shipment
+  allocation_percentages, by the rule's item or charge code)
+
+All charges of a consol document are allocated in one vectorized call
+(`allocation_matrix`) and rounded to currency precision by largest
+remainder, so each charge's per-project amounts sum exactly to the charge.
 """
 
+import numpy as np
+
 import frappe
 from frappe import _
+from frappe.utils import cint
+
+from freight_forwarding.utils.chargeable_weight import DEFAULT_RULE, chargeable_weight
+from freight_forwarding.utils.rate.rate_index import parse_modes
+
+ALLOCATION_METHODS = ("by_cbm", "by_weight", "by_chargeable", "equal", "by_slot", "manual_pct")
 
+# Decimals of allocated amounts when System Settings has no currency precision
+DEFAULT_PRECISION = 2
 
-def calculate_allocation(consol_shipment, total_amount, allocation_rule):
+
+def calculate_allocation(consol_shipment, total_amount, allocation_rule, precision=None):
     """
     Calculate allocation amount for each consol member based on allocation rule.
     
@@ -23,211 +39,335 @@ def calculate_allocation(consol_shipment, total_amount, allocation_rule):
         consol_shipment: FF Consol Shipment document
         total_amount: Total amount to allocate
         allocation_rule: Allocation Rule document
+        precision: Decimals of the allocated amounts (default: currency precision)
+    
+    Returns:
+        dict: {project: allocated_amount}, summing exactly to total_amount
+    """
+    projects, amounts = allocation_matrix(consol_shipment, [total_amount], [allocation_rule], precision)
+    return dict(zip(projects, amounts[0].tolist()))
+
+
+def allocate_charges(consol_shipment, charges, precision=None):
+    """
+    Allocate every charge of a consol document over the member projects,
+    in one `allocation_matrix` call.
+    
+    Args:
+        consol_shipment: FF Consol Shipment document
+        charges: list of (amount, allocation_rule or None)
+        precision: Decimals of the allocated amounts (default: currency precision)
     
     Returns:
-        dict: {project: allocated_amount}
+        list: {project: allocated_amount} per charge, in order
     """
-    if not consol_shipment.consol_members:
+    if not charges:
+        return []
+    
+    amounts, rules = zip(*charges)
+    projects, matrix = allocation_matrix(consol_shipment, amounts, rules, precision)
+    return [dict(zip(projects, row)) for row in matrix.tolist()]
+
+
+def allocation_matrix(consol_shipment, amounts, allocation_rules, precision=None):
+    """
+    Allocation kernel: split many charges over the consol members at once.
+    
+    Each charge is split in proportion to its rule's member basis (cbm,
+    weight, chargeable weight, one per member, ...), then rounded to
+    `precision` decimals by largest remainder: every member gets its share
+    rounded down and the cents left over go to the members with the largest
+    remainders (the earlier member on ties), so each charge's allocation
+    sums exactly to the charge. Members sharing a project are summed.
+    
+    Args:
+        consol_shipment: FF Consol Shipment document
+        amounts: Charge amounts
+        allocation_rules: Allocation Rule per charge (None: equal split)
+        precision: Decimals of the allocated amounts (default: currency precision)
+    
+    Returns:
+        tuple: (projects, numpy.ndarray of charges x projects)
+    """
+    members = consol_shipment.consol_members
+    if not members:
         frappe.throw(_("No consol members found in consol shipment."))
     
+    if precision is None:
+        precision = get_currency_precision()
+    
+    # One basis row per distinct method, shared by the charges using it
+    percentages = get_manual_percentages(consol_shipment)
+    bases = {}
+    basis_index = []
+    for allocation_rule in allocation_rules:
+        key = get_basis_key(allocation_rule)
+        if key not in bases:
+            bases[key] = (len(bases), member_basis(consol_shipment, allocation_rule, percentages))
+        basis_index.append(bases[key][0])
+    
+    basis = np.vstack([b for _i, b in sorted(bases.values(), key=lambda v: v[0])])
+    basis = basis / basis.sum(axis=1, keepdims=True)
+    shares = basis[basis_index]
+    
+    amounts = np.asarray(amounts, dtype=float)
+    allocated = round_largest_remainder(amounts[:, None] * shares, amounts, precision)
+    
+    return sum_by_project([m.project for m in members], allocated)
+
+
+def get_basis_key(allocation_rule):
+    """Rules with the same key share a member basis"""
     if not allocation_rule:
-        # Default: equal allocation
-        return equal_allocation(consol_shipment, total_amount)
+        return "equal"
+    if allocation_rule.method == "manual_pct":
+        return ("manual_pct", allocation_rule.item, allocation_rule.charge_code)
+    return allocation_rule.method
+
+
+def member_basis(consol_shipment, allocation_rule, percentages=None):
+    """
+    Allocation basis per member for a rule.
     
-    method = allocation_rule.method
+    Returns:
+        numpy.ndarray: One non-negative value per consol member, not all zero
+    """
+    members = consol_shipment.consol_members
+    method = allocation_rule.method if allocation_rule else "equal"
     
     if method == "by_cbm":
-        return by_cbm_allocation(consol_shipment, total_amount)
+        basis = np.array([float(m.cbm or 0) for m in members])
+        if not basis.sum():
+            frappe.throw(_("Total CBM is zero. Cannot allocate by CBM."))
     elif method == "by_weight":
-        return by_weight_allocation(consol_shipment, total_amount)
+        basis = np.array([float(m.weight or 0) for m in members])
+        if not basis.sum():
+            frappe.throw(_("Total weight is zero. Cannot allocate by weight."))
     elif method == "by_chargeable":
-        return by_chargeable_allocation(consol_shipment, total_amount)
-    elif method == "equal":
-        return equal_allocation(consol_shipment, total_amount)
-    elif method == "by_slot":
-        return by_slot_allocation(consol_shipment, total_amount)
+        basis = chargeable_basis(consol_shipment)
+        if not basis.sum():
+            frappe.throw(_("Total chargeable is zero. Cannot allocate by chargeable."))
+    elif method in ("equal", "by_slot"):
+        # by_slot: 1 slot per member
+        basis = np.ones(len(members))
     elif method == "manual_pct":
-        return manual_pct_allocation(consol_shipment, total_amount, allocation_rule)
+        basis = manual_pct_basis(consol_shipment, allocation_rule, percentages)
     else:
         frappe.throw(_(f"Invalid allocation method: {method}"))
+    
+    return basis
 
 
-def by_cbm_allocation(consol_shipment, total_amount):
-    """Allocate by CBM (Cubic Meter)"""
-    total_cbm = sum([float(m.cbm or 0) for m in consol_shipment.consol_members])
+def chargeable_basis(consol_shipment):
+    """
+    Chargeable weight per member
+    
+    Uses each member's chargeable rule (Weight, Volume, Weight or Volume;
+    Flat or empty as Weight or Volume) and the volumetric divisor of the
+    consol's mode, as the rate engine does.
+    """
+    members = consol_shipment.consol_members
+    mode = get_consol_mode(consol_shipment)
     
-    if total_cbm == 0:
-        frappe.throw(_("Total CBM is zero. Cannot allocate by CBM."))
+    weights = np.array([float(m.weight or 0) for m in members])
+    cbms = np.array([float(m.cbm or 0) for m in members])
+    chargeables = np.zeros(len(members))
     
-    allocation = {}
-    for member in consol_shipment.consol_members:
-        cbm = float(member.cbm or 0)
-        percentage = cbm / total_cbm if total_cbm > 0 else 0
-        allocation[member.project] = total_amount * percentage
+    # One vectorized pass per chargeable rule
+    rules = np.array([m.chargeable if m.chargeable in ("Weight", "Volume") else DEFAULT_RULE for m in members])
+    for rule in set(rules.tolist()):
+        idx = rules == rule
+        chargeables[idx] = chargeable_weight(weights[idx], cbms[idx], mode, rule)
     
-    return allocation
+    return chargeables
 
 
-def by_weight_allocation(consol_shipment, total_amount):
-    """Allocate by Weight (kg)"""
-    total_weight = sum([float(m.weight or 0) for m in consol_shipment.consol_members])
+def manual_pct_basis(consol_shipment, allocation_rule, percentages=None):
+    """
+    Manual percentage per member for a manual_pct rule
     
-    if total_weight == 0:
-        frappe.throw(_("Total weight is zero. Cannot allocate by weight."))
+    From the consol's Manual Allocation Percentages of the rule (see
+    `get_rule_percentages`, validated to add up to 100 on save); members
+    without one get nothing. A project's percentage goes to its first member.
+    """
+    if percentages is None:
+        percentages = get_manual_percentages(consol_shipment)
     
-    allocation = {}
-    for member in consol_shipment.consol_members:
-        weight = float(member.weight or 0)
-        percentage = weight / total_weight if total_weight > 0 else 0
-        allocation[member.project] = total_amount * percentage
+    rule_percentages = get_rule_percentages(allocation_rule, percentages)
     
-    return allocation
+    basis = np.zeros(len(consol_shipment.consol_members))
+    seen = set()
+    for i, member in enumerate(consol_shipment.consol_members):
+        if member.project not in seen:
+            basis[i] = rule_percentages.get(member.project, 0)
+            seen.add(member.project)
+    
+    if basis.sum() <= 0:
+        frappe.throw(_("Manual percentages per member are required for manual_pct allocation method."))
+    
+    return basis
 
 
-def by_chargeable_allocation(consol_shipment, total_amount):
-    """Allocate by Chargeable Weight/Volume"""
-    # Chargeable is the higher of weight or volume
-    chargeable_values = []
-    for member in consol_shipment.consol_members:
-        weight = float(member.weight or 0)
-        cbm = float(member.cbm or 0)
-        # Convert CBM to weight equivalent (1 CBM = 1000 kg typically)
-        cbm_weight = cbm * 1000
-        chargeable = max(weight, cbm_weight)
-        chargeable_values.append((member.project, chargeable))
+def get_manual_percentages(consol_shipment):
+    """
+    Manual Allocation Percentages of a consol.
     
-    total_chargeable = sum([v[1] for v in chargeable_values])
+    Returns:
+        dict: {charge: {project: percentage}}
+    """
+    percentages = {}
+    for row in consol_shipment.get("allocation_percentages") or []:
+        percentages.setdefault(row.charge, {})[row.project] = float(row.percentage or 0)
+    return percentages
+
+
+def get_rule_percentages(allocation_rule, percentages):
+    """
+    Manual percentages of a manual_pct rule.
     
-    if total_chargeable == 0:
-        frappe.throw(_("Total chargeable is zero. Cannot allocate by chargeable."))
+    Percentages entered for the rule's item take precedence over those for
+    its charge code, as items do in `get_rule_lookup`; entering both is
+    rejected when the consol is saved.
     
-    allocation = {}
-    for project, chargeable in chargeable_values:
-        percentage = chargeable / total_chargeable if total_chargeable > 0 else 0
-        allocation[project] = total_amount * percentage
+    Args:
+        allocation_rule: Allocation Rule row
+        percentages: {charge: {project: percentage}} (see `get_manual_percentages`)
     
-    return allocation
+    Returns:
+        dict: {project: percentage}
+    """
+    for charge in (allocation_rule.item, allocation_rule.charge_code):
+        if charge and percentages.get(charge):
+            return percentages[charge]
+    return {}
 
 
-def equal_allocation(consol_shipment, total_amount):
-    """Equal split among all members"""
-    member_count = len(consol_shipment.consol_members)
+def round_largest_remainder(values, totals, precision):
+    """
+    Round each row of `values` to `precision` decimals so that it sums
+    exactly to the row's total rounded to `precision`.
+    
+    Args:
+        values: numpy.ndarray of charges x members
+        totals: numpy.ndarray of charge totals
+        precision: Decimals
     
-    if member_count == 0:
-        frappe.throw(_("No consol members found."))
+    Returns:
+        numpy.ndarray
+    """
+    scale = 10 ** precision
+    scaled = values * scale
+    floored = np.floor(scaled)
     
-    amount_per_member = total_amount / member_count
+    # Units (e.g. cents) each charge is short after rounding down
+    shortfall = np.round(totals * scale) - floored.sum(axis=1)
+    shortfall = np.clip(shortfall, 0, values.shape[1]).astype(int)
     
-    allocation = {}
-    for member in consol_shipment.consol_members:
-        allocation[member.project] = amount_per_member
+    # Rank of each member's remainder within its charge (0 = largest)
+    order = np.argsort(-(scaled - floored), axis=1, kind="stable")
+    rank = np.argsort(order, axis=1)
     
-    return allocation
+    return (floored + (rank < shortfall[:, None])) / scale
+
+
+def sum_by_project(projects, allocated):
+    """Sum member columns of the same project, keeping first-seen order"""
+    unique = list(dict.fromkeys(projects))
+    if len(unique) == len(projects):
+        return unique, allocated
+    
+    index = np.array([unique.index(p) for p in projects])
+    summed = np.zeros((len(allocated), len(unique)))
+    np.add.at(summed, (slice(None), index), allocated)
+    return unique, summed
+
+
+def get_currency_precision():
+    """Decimals of currency amounts (System Settings currency precision)"""
+    return cint(frappe.db.get_default("currency_precision")) or DEFAULT_PRECISION
+
+
+def by_cbm_allocation(consol_shipment, total_amount):
+    """Allocate by CBM (Cubic Meter)"""
+    return calculate_allocation(consol_shipment, total_amount, frappe._dict(method="by_cbm"))
+
+
+def by_weight_allocation(consol_shipment, total_amount):
+    """Allocate by Weight (kg)"""
+    return calculate_allocation(consol_shipment, total_amount, frappe._dict(method="by_weight"))
+
+
+def by_chargeable_allocation(consol_shipment, total_amount):
+    """Allocate by Chargeable Weight/Volume (see `chargeable_basis`)"""
+    return calculate_allocation(consol_shipment, total_amount, frappe._dict(method="by_chargeable"))
+
+
+def get_consol_mode(consol_shipment):
+    """Primary mode of a consol shipment (first of its modes, default Sea)"""
+    modes = parse_modes(consol_shipment.mode)
+    return modes[0] if modes else "Sea"
+
+
+def equal_allocation(consol_shipment, total_amount):
+    """Equal split among all members"""
+    return calculate_allocation(consol_shipment, total_amount, None)
 
 
 def by_slot_allocation(consol_shipment, total_amount):
     """Allocate by slot (1 slot per member)"""
-    # Same as equal allocation
-    return equal_allocation(consol_shipment, total_amount)
+    return calculate_allocation(consol_shipment, total_amount, frappe._dict(method="by_slot"))
 
 
 def manual_pct_allocation(consol_shipment, total_amount, allocation_rule):
     """Manual percentage allocation"""
-    if not allocation_rule.manual_percentage:
-        frappe.throw(_("Manual percentage is required for manual_pct allocation method."))
+    return calculate_allocation(consol_shipment, total_amount, allocation_rule)
+
+
+def get_rule_lookup(allocation_rules, fields=("item", "charge_code")):
+    """
+    Map charge codes to allocation rules.
+    
+    The first rule whose `fields` match a code wins, as when the rules are
+    scanned in order for every charge.
     
-    # For manual_pct, we need to store percentage per member
-    # This would require additional fields in Consol Member
-    # For now, we'll use equal allocation as fallback
-    frappe.msgprint(
-        _("Manual percentage allocation requires percentage per member. Using equal allocation as fallback."),
-        alert=True
-    )
-    return equal_allocation(consol_shipment, total_amount)
+    Returns:
+        dict: {code: Allocation Rule row}
+    """
+    lookup = {}
+    for rule in allocation_rules or []:
+        for fieldname in fields:
+            code = rule.get(fieldname)
+            if code:
+                lookup.setdefault(code, rule)
+    return lookup
 
 
-def split_purchase_invoice(consol_shipment, purchase_invoice_name):
+def split_purchase_invoice(consol_shipment, purchase_invoice_name, progress=None):
     """
     Split a Purchase Invoice from consol shipment to individual PIs per project.
     
+    The item x project allocation is computed in memory, compared with the
+    allocation ledger (see utils.consol.ledger) and only the difference is
+    written: each project gets one PI holding all its rows, inserted or
+    saved once. Splitting again (e.g. after a member's weight or cbm was
+    corrected) updates the changed rows only.
+    
     Args:
         consol_shipment: FF Consol Shipment document
         purchase_invoice_name: Name of the consol Purchase Invoice
+        progress: ConsolJobProgress of a background split (optional)
     
     Returns:
         list: List of created Purchase Invoice names
     """
+    from freight_forwarding.utils.consol.ledger import split_consol_document
+    
     consol_pi = frappe.get_doc("Purchase Invoice", purchase_invoice_name)
     
     if not consol_pi:
         frappe.throw(_(f"Purchase Invoice {purchase_invoice_name} not found."))
     
-    # Get allocation rules
-    allocation_rules = consol_shipment.allocation_rules or []
-    
-    created_pis = []
-    
-    # For each item in consol PI, allocate to projects
-    for item in consol_pi.items:
-        # Find matching allocation rule
-        allocation_rule = None
-        for rule in allocation_rules:
-            if rule.item == item.item_code or rule.charge_code == item.item_code:
-                allocation_rule = rule
-                break
-        
-        # Calculate allocation
-        total_amount = item.base_amount
-        allocation = calculate_allocation(consol_shipment, total_amount, allocation_rule)
-        
-        # Create PI per project
-        for project, allocated_amount in allocation.items():
-            # Check if PI for this project already exists
-            existing_pi = frappe.db.exists(
-                "Purchase Invoice",
-                {
-                    "project": project,
-                    "consol_shipment": consol_shipment.name,
-                    "docstatus": ["<", 2],
-                }
-            )
-            
-            if existing_pi:
-                # Add item to existing PI
-                pi_doc = frappe.get_doc("Purchase Invoice", existing_pi)
-            else:
-                # Create new PI
-                pi_doc = frappe.get_doc({
-                    "doctype": "Purchase Invoice",
-                    "supplier": consol_pi.supplier,
-                    "posting_date": consol_pi.posting_date,
-                    "due_date": consol_pi.due_date,
-                    "project": project,
-                    "consol_shipment": consol_shipment.name,
-                    "company": consol_pi.company,
-                    "currency": consol_pi.currency,
-                    "items": [],
-                })
-            
-            # Add item with allocated amount
-            item_row = {
-                "item_code": item.item_code,
-                "item_name": item.item_name,
-                "qty": item.qty * (allocated_amount / total_amount) if total_amount > 0 else 0,
-                "rate": item.rate,
-                "amount": allocated_amount,
-                "base_amount": allocated_amount,
-                "uom": item.uom,
-                "item_group": item.item_group,
-            }
-            
-            pi_doc.append("items", item_row)
-            
-            if not existing_pi:
-                pi_doc.insert()
-                created_pis.append(pi_doc.name)
-            else:
-                pi_doc.save()
+    created_pis = split_consol_document(consol_shipment, consol_pi, progress)
     
     # Cancel original consol PI
     if consol_pi.docstatus == 1:
@@ -236,99 +376,60 @@ def split_purchase_invoice(consol_shipment, purchase_invoice_name):
     return created_pis
 
 
-def split_expense_claim(consol_shipment, expense_claim_name):
+def purchase_invoice_header(consol_pi, consol_shipment, project):
+    """New project Purchase Invoice for a consol PI split"""
+    return {
+        "doctype": "Purchase Invoice",
+        "supplier": consol_pi.supplier,
+        "posting_date": consol_pi.posting_date,
+        "due_date": consol_pi.due_date,
+        "project": project,
+        "consol_shipment": consol_shipment.name,
+        "company": consol_pi.company,
+        "currency": consol_pi.currency,
+        "items": [],
+    }
+
+
+def purchase_invoice_item(item, allocated_amount, consol_source=None, project=None):
+    """Purchase Invoice Item row for a project's share of a consol PI item"""
+    total_amount = item.base_amount
+    return {
+        "item_code": item.item_code,
+        "item_name": item.item_name,
+        "qty": item.qty * (allocated_amount / total_amount) if total_amount > 0 else 0,
+        "rate": item.rate,
+        "amount": allocated_amount,
+        "base_amount": allocated_amount,
+        "uom": item.uom,
+        "item_group": item.item_group,
+        "consol_source": consol_source,
+    }
+
+
+def split_expense_claim(consol_shipment, expense_claim_name, progress=None):
     """
     Split an Expense Claim from consol shipment to individual ECs per project.
     
+    Like `split_purchase_invoice`: allocation in memory, compared with the
+    ledger, one EC per project with all its expense rows.
+    
     Args:
         consol_shipment: FF Consol Shipment document
         expense_claim_name: Name of the consol Expense Claim
+        progress: ConsolJobProgress of a background split (optional)
     
     Returns:
         list: List of created Expense Claim names
     """
+    from freight_forwarding.utils.consol.ledger import split_consol_document
+    
     consol_ec = frappe.get_doc("Expense Claim", expense_claim_name)
     
     if not consol_ec:
         frappe.throw(_(f"Expense Claim {expense_claim_name} not found."))
     
-    # Get allocation rules
-    allocation_rules = consol_shipment.allocation_rules or []
-    
-    created_ecs = []
-    
-    # For each expense detail in consol EC, allocate to projects
-    # Note: Expense Claim uses 'expenses' child table
-    for expense_detail in consol_ec.expenses:
-        # Find matching allocation rule
-        allocation_rule = None
-        for rule in allocation_rules:
-            if rule.item == expense_detail.expense_type:
-                allocation_rule = rule
-                break
-        
-        # Calculate allocation
-        total_amount = expense_detail.amount
-        allocation = calculate_allocation(consol_shipment, total_amount, allocation_rule)
-        
-        # Create EC per project
-        for project, allocated_amount in allocation.items():
-            # Check if EC for this project already exists
-            existing_ec = frappe.db.exists(
-                "Expense Claim",
-                {
-                    "employee": consol_ec.employee,
-                    "consol_shipment": consol_shipment.name,
-                    "docstatus": ["<", 2],
-                }
-            )
-            
-            # Get project from Expense Claim Detail
-            # Note: We need to check by project in Expense Claim Detail
-            existing_ec_by_project = frappe.db.sql("""
-                SELECT DISTINCT parent
-                FROM `tabExpense Claim Detail`
-                WHERE parenttype = 'Expense Claim'
-                AND project = %s
-                AND parent IN (
-                    SELECT name FROM `tabExpense Claim`
-                    WHERE consol_shipment = %s
-                    AND docstatus < 2
-                )
-            """, (project, consol_shipment.name), as_dict=True)
-            
-            if existing_ec_by_project:
-                # Add expense to existing EC
-                ec_doc = frappe.get_doc("Expense Claim", existing_ec_by_project[0].parent)
-            else:
-                # Create new EC
-                ec_doc = frappe.get_doc({
-                    "doctype": "Expense Claim",
-                    "employee": consol_ec.employee,
-                    "expense_approver": consol_ec.expense_approver,
-                    "posting_date": consol_ec.posting_date,
-                    "consol_shipment": consol_shipment.name,
-                    "company": consol_ec.company,
-                    "currency": consol_ec.currency,
-                    "expenses": [],
-                })
-            
-            # Add expense detail with allocated amount
-            expense_row = {
-                "expense_date": expense_detail.expense_date,
-                "expense_type": expense_detail.expense_type,
-                "amount": allocated_amount,
-                "description": expense_detail.description,
-                "project": project,
-            }
-            
-            ec_doc.append("expenses", expense_row)
-            
-            if not existing_ec_by_project:
-                ec_doc.insert()
-                created_ecs.append(ec_doc.name)
-            else:
-                ec_doc.save()
+    created_ecs = split_consol_document(consol_shipment, consol_ec, progress)
     
     # Cancel original consol EC
     if consol_ec.docstatus == 1:
@@ -336,3 +437,28 @@ def split_expense_claim(consol_shipment, expense_claim_name):
     
     return created_ecs
 
+
+def expense_claim_header(consol_ec, consol_shipment, project):
+    """New project Expense Claim for a consol EC split"""
+    return {
+        "doctype": "Expense Claim",
+        "employee": consol_ec.employee,
+        "expense_approver": consol_ec.expense_approver,
+        "posting_date": consol_ec.posting_date,
+        "consol_shipment": consol_shipment.name,
+        "company": consol_ec.company,
+        "currency": consol_ec.currency,
+        "expenses": [],
+    }
+
+
+def expense_claim_detail(expense_detail, allocated_amount, consol_source=None, project=None):
+    """Expense Claim Detail row for a project's share of a consol EC expense"""
+    return {
+        "expense_date": expense_detail.expense_date,
+        "expense_type": expense_detail.expense_type,
+        "amount": allocated_amount,
+        "description": expense_detail.description,
+        "project": project,
+        "consol_source": consol_source,
+    }
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Consol Shipment Background Jobs
+
+Splitting a consol Purchase Invoice or Expense Claim and creating Sales
+Invoices per member run as background jobs on the long queue instead of
+inside the web request. Work is committed every `COMMIT_CHUNK_SIZE`
+projects and progress is published to the FF Consol Shipment form as the
+realtime event `ff_consol_job_progress`; the result is sent to the user
+who started the job as `ff_consol_job`.
+
+Each operation skips the projects it already wrote, so a job interrupted
+by a dying worker resumes where it stopped when started again. Only one
+job per (operation, consol, source document) is queued at a time.
+"""
+
+import frappe
+from frappe import _
+
+# Projects written between commits
+COMMIT_CHUNK_SIZE = 20
+
+# operation: function
+OPERATIONS = {
+    "split_purchase_invoice": "freight_forwarding.utils.consol.allocation.split_purchase_invoice",
+    "split_expense_claim": "freight_forwarding.utils.consol.allocation.split_expense_claim",
+    "create_si_per_member": "freight_forwarding.utils.consol.si_generation.create_si_per_member",
+    "resplit_consol_shipment": "freight_forwarding.utils.consol.ledger.resplit_consol_shipment",
+}
+
+# Operations splitting a source document
+SOURCE_OPERATIONS = ("split_purchase_invoice", "split_expense_claim")
+
+
+class ConsolJobProgress:
+    """
+    Commit and publish progress of a consol job every `chunk_size` projects.
+
+    Args:
+        consol_shipment: FF Consol Shipment name
+        operation: Key of OPERATIONS
+        chunk_size: Projects per commit
+    """
+
+    def __init__(self, consol_shipment, operation, chunk_size=COMMIT_CHUNK_SIZE):
+        self.consol_shipment = consol_shipment
+        self.operation = operation
+        self.chunk_size = chunk_size
+        self.committed = 0
+
+    def start(self):
+        """Start counting projects of the next document"""
+        self.committed = 0
+
+    def update(self, done, total, before_commit=None):
+        """
+        Record that `done` of `total` projects are written.
+
+        Args:
+            done: Projects written so far
+            total: Projects to write
+            before_commit: Called before committing, e.g. to flush buffered rows
+        """
+        if done - self.committed < self.chunk_size and done < total:
+            return
+
+        if before_commit:
+            before_commit()
+        frappe.db.commit()
+        self.committed = done
+        self.publish({
+            "done": done,
+            "total": total,
+            "percent": round(done * 100 / total, 1) if total else 100,
+        })
+
+    def publish(self, data, event="ff_consol_job_progress"):
+        data.update(consol_shipment=self.consol_shipment, operation=self.operation)
+        frappe.publish_realtime(
+            event, data, doctype="FF Consol Shipment", docname=self.consol_shipment, after_commit=False
+        )
+
+
+def get_job_id(operation, consol_shipment, source=None):
+    return f"ff_consol::{operation}::{consol_shipment}::{source or ''}"
+
+
+@frappe.whitelist()
+def enqueue_consol_job(consol_shipment, operation, source=None):
+    """
+    Run a consol split or Sales Invoice creation in the background.
+
+    Args:
+        consol_shipment: FF Consol Shipment name
+        operation: "split_purchase_invoice", "split_expense_claim",
+            "create_si_per_member" or "resplit_consol_shipment"
+        source: Consol Purchase Invoice or Expense Claim to split
+
+    Returns:
+        dict: {"job_id": str, "queued": bool}; queued is False when the
+            same job is already queued or running
+    """
+    if operation not in OPERATIONS:
+        frappe.throw(_("Invalid consol operation: {0}").format(operation))
+    if operation in SOURCE_OPERATIONS and not source:
+        frappe.throw(_("Select the document to split."))
+
+    frappe.has_permission("FF Consol Shipment", "write", doc=consol_shipment, throw=True)
+
+    job_id = get_job_id(operation, consol_shipment, source)
+    job = frappe.enqueue(
+        "freight_forwarding.utils.consol.jobs.run_consol_job",
+        queue="long",
+        timeout=3600,
+        job_id=job_id,
+        deduplicate=True,
+        operation=operation,
+        consol_shipment=consol_shipment,
+        source=source,
+        user=frappe.session.user,
+    )
+
+    return {"job_id": job_id, "queued": bool(job)}
+
+
+def run_consol_job(operation, consol_shipment, source=None, user=None):
+    """Background job: run a consol operation and publish the result"""
+    progress = ConsolJobProgress(consol_shipment, operation)
+    progress.publish({"done": 0, "total": 0, "percent": 0})
+
+    try:
+        consol = frappe.get_doc("FF Consol Shipment", consol_shipment)
+        args = (consol, source) if source else (consol,)
+        created = frappe.get_attr(OPERATIONS[operation])(*args, progress=progress)
+        frappe.db.commit()
+        result = {"created": created}
+    except Exception:
+        frappe.db.rollback()
+        result = {"error": frappe.get_traceback()}
+        frappe.log_error(title=f"Consol job {operation} failed for {consol_shipment}")
+
+    result.update(consol_shipment=consol_shipment, operation=operation)
+    frappe.publish_realtime("ff_consol_job", result, user=user or frappe.session.user)
+    return result
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Consol Allocation Ledger
+
+FF Consol Allocation keeps one entry per (consol, charge, project): the
+amount of a consol Purchase Invoice / Expense Claim row allocated to a
+project and the row of the project's PI / EC holding it. Splitting
+compares the freshly computed allocation with the ledger and writes only
+the difference:
+
+- (charge, project) not in the ledger: row appended to the project's document
+- amount changed: the row updated in place
+- (charge, project) no longer allocated: row removed
+
+A project document cancelled since the last split is replaced: its
+project's rows go to a new document and the ledger entries are re-pointed
+to it. Submitted project documents must be cancelled first.
+
+So splitting again after a member's weight or cbm is corrected touches only
+the projects whose amounts moved, and splitting the same document twice
+writes nothing. Ledger entries are buffered and written with one delete
+and one bulk insert before every commit, in the same transaction as the
+documents, so a split interrupted between commits resumes where it stopped.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import flt, now
+
+from freight_forwarding.utils.consol.allocation import (
+    allocate_charges,
+    expense_claim_detail,
+    expense_claim_header,
+    get_rule_lookup,
+    purchase_invoice_header,
+    purchase_invoice_item,
+)
+
+LEDGER_DOCTYPE = "FF Consol Allocation"
+
+# Columns of a bulk inserted ledger entry
+STANDARD_FIELDS = ["name", "creation", "modified", "owner", "modified_by", "docstatus"]
+LEDGER_FIELDS = ["consol_shipment", "source_doctype", "source", "charge", "item_code", "project",
+                 "allocation_method", "amount", "qty", "target", "target_row"]
+
+# Consol document -> how its rows are allocated and written per project
+SPLIT_DOCTYPES = {
+    "Purchase Invoice": frappe._dict(
+        table="items",
+        child_doctype="Purchase Invoice Item",
+        amount_field="base_amount",
+        code_field="item_code",
+        rule_fields=("item", "charge_code"),
+        header=purchase_invoice_header,
+        row=purchase_invoice_item,
+    ),
+    "Expense Claim": frappe._dict(
+        table="expenses",
+        child_doctype="Expense Claim Detail",
+        amount_field="amount",
+        code_field="expense_type",
+        rule_fields=("item",),
+        header=expense_claim_header,
+        row=expense_claim_detail,
+    ),
+}
+
+
+def split_consol_document(consol_shipment, source_doc, progress=None):
+    """
+    Bring the project PIs / ECs of a consol document in line with its
+    current allocation, writing only what changed since the last split.
+
+    Args:
+        consol_shipment: FF Consol Shipment document
+        source_doc: Consol Purchase Invoice or Expense Claim
+        progress: ConsolJobProgress of a background split (optional)
+
+    Returns:
+        list: Names of the Purchase Invoices / Expense Claims created
+    """
+    spec = SPLIT_DOCTYPES[source_doc.doctype]
+    precision = frappe.get_precision(spec.child_doctype, "amount") or 2
+
+    rows = list(source_doc.get(spec.table))
+    rules = get_rule_lookup(consol_shipment.allocation_rules, spec.rule_fields)
+    charge_rules = [rules.get(row.get(spec.code_field)) for row in rows]
+    allocations = allocate_charges(
+        consol_shipment,
+        [(row.get(spec.amount_field), rule) for row, rule in zip(rows, charge_rules)],
+        precision,
+    )
+    methods = {row.name: rule.method if rule else "equal" for row, rule in zip(rows, charge_rules)}
+
+    ledger = get_ledger(source_doc.name)
+    status = get_target_status(source_doc.doctype, ledger)
+    cancelled = {name for name, docstatus in status.items() if docstatus == 2}
+
+    changes = diff_allocation(rows, allocations, ledger, precision, cancelled)
+    if not changes:
+        return []
+
+    targets = get_targets(spec, source_doc, consol_shipment, ledger, changes, cancelled)
+    check_targets_editable(source_doc.doctype, {targets[p] for p in changes if p in targets}, status)
+
+    if progress:
+        progress.start()
+
+    created = []
+    writer = LedgerWriter(consol_shipment, source_doc, methods)
+    for count, (project, project_changes) in enumerate(changes.items(), 1):
+        doc = apply_changes(spec, source_doc, consol_shipment, project, targets.get(project), project_changes)
+        if doc is not None and doc.name != targets.get(project):
+            created.append(doc.name)
+        writer.add(project, project_changes, doc)
+
+        if progress:
+            progress.update(count, len(changes), before_commit=writer.flush)
+
+    writer.flush()
+    return created
+
+
+def get_ledger(source):
+    """
+    Ledger entries of a consol document.
+
+    Returns:
+        dict: {(charge, project): entry}
+    """
+    entries = frappe.get_all(
+        LEDGER_DOCTYPE,
+        filters={"source": source},
+        fields=["name", "charge", "project", "amount", "qty", "target", "target_row", "creation", "owner"],
+    )
+    return {(entry.charge, entry.project): entry for entry in entries}
+
+
+def get_target_status(doctype, ledger):
+    """
+    docstatus of the project documents the ledger points to.
+
+    Returns:
+        dict: {document name: docstatus}
+    """
+    names = {entry.target for entry in ledger.values() if entry.target}
+    if not names:
+        return {}
+
+    return dict(frappe.get_all(
+        doctype,
+        filters={"name": ["in", list(names)]},
+        fields=["name", "docstatus"],
+        as_list=True,
+    ))
+
+
+def diff_allocation(rows, allocations, ledger, precision=2, cancelled=()):
+    """
+    Compare an allocation with the ledger.
+
+    Args:
+        rows: Charge rows of the consol document
+        allocations: {project: amount} per row (see `allocate_charges`)
+        ledger: {(charge, project): entry} (see `get_ledger`)
+        precision: Decimals amounts are compared at
+        cancelled: Cancelled project documents; entries pointing to them
+            are written again even when their amount is unchanged
+
+    Returns:
+        dict: {project: [(action, row, amount, entry), ...]} with action
+            "add", "update" or "remove", for projects with changes only
+    """
+    changes = {}
+    allocated = set()
+
+    for row, allocation in zip(rows, allocations):
+        for project, amount in allocation.items():
+            amount = flt(amount, precision)
+            key = (row.name, project)
+            allocated.add(key)
+            entry = ledger.get(key)
+
+            if entry is None:
+                changes.setdefault(project, []).append(("add", row, amount, None))
+            elif entry.target in cancelled or flt(entry.amount, precision) != amount:
+                changes.setdefault(project, []).append(("update", row, amount, entry))
+
+    for key, entry in ledger.items():
+        if key not in allocated:
+            changes.setdefault(entry.project, []).append(("remove", None, 0, entry))
+
+    return changes
+
+
+def get_targets(spec, source_doc, consol_shipment, ledger, changes, cancelled=()):
+    """
+    Project PI / EC each project's changes go to: the one holding its
+    ledger rows unless it was cancelled, else the project's draft for this
+    consol, else none (a new document).
+
+    Returns:
+        dict: {project: document name}
+    """
+    targets = {}
+    for entry in ledger.values():
+        if entry.target and entry.target not in cancelled:
+            targets.setdefault(entry.project, entry.target)
+
+    missing = [project for project in changes if project not in targets]
+    if not missing:
+        return targets
+
+    if source_doc.doctype == "Purchase Invoice":
+        drafts = frappe.get_all(
+            "Purchase Invoice",
+            filters={
+                "consol_shipment": consol_shipment.name,
+                "project": ["in", missing],
+                "docstatus": 0,
+                "name": ["!=", source_doc.name],
+            },
+            fields=["project", "name"],
+            order_by="creation asc",
+            as_list=True,
+        )
+    else:
+        drafts = frappe.db.sql("""
+            SELECT detail.project, detail.parent
+            FROM `tabExpense Claim Detail` detail
+            INNER JOIN `tabExpense Claim` ec ON ec.name = detail.parent
+            WHERE detail.parenttype = 'Expense Claim'
+            AND detail.project IN %(projects)s
+            AND ec.consol_shipment = %(consol_shipment)s
+            AND ec.docstatus = 0
+            AND ec.name != %(source)s
+            ORDER BY ec.creation
+        """, {"projects": missing, "consol_shipment": consol_shipment.name, "source": source_doc.name})
+
+    for project, name in drafts:
+        targets.setdefault(project, name)
+
+    return targets
+
+
+def check_targets_editable(doctype, names, status):
+    """Refuse to split into submitted project documents (see `get_target_status`)"""
+    submitted = [name for name in names if status.get(name) == 1]
+    if submitted:
+        frappe.throw(_("Cancel {0} {1} before splitting again.").format(
+            _(doctype), ", ".join(sorted(submitted))
+        ))
+
+
+def apply_changes(spec, source_doc, consol_shipment, project, target, project_changes):
+    """
+    Write one project's changes to its PI / EC, with one insert or save.
+
+    Returns:
+        Document or None when no document holds the project's rows any more
+    """
+    if target and frappe.db.exists(source_doc.doctype, target):
+        doc = frappe.get_doc(source_doc.doctype, target)
+    else:
+        doc = frappe.get_doc(spec.header(source_doc, consol_shipment, project))
+
+    children = {child.name: child for child in doc.get(spec.table)}
+
+    for index, (action, row, amount, entry) in enumerate(project_changes):
+        child = children.get(entry.target_row) if entry else None
+
+        if action == "remove":
+            if child:
+                doc.remove(child)
+            continue
+
+        values = spec.row(row, amount, source_doc.name, project)
+        if child:
+            child.update(values)
+        else:
+            child = doc.append(spec.table, values)
+        project_changes[index] = (action, row, amount, entry, child)
+
+    if not doc.get(spec.table):
+        # Nothing left on a document the split created
+        if not doc.is_new():
+            frappe.delete_doc(source_doc.doctype, doc.name)
+        return None
+
+    if doc.is_new():
+        doc.insert()
+    else:
+        doc.save()
+    return doc
+
+
+class LedgerWriter:
+    """
+    Buffer a split's ledger changes and write them with one delete and one
+    bulk insert per flush.
+
+    Updated entries are deleted and inserted again under their name,
+    creation and owner.
+
+    Args:
+        consol_shipment: FF Consol Shipment document
+        source_doc: Consol Purchase Invoice or Expense Claim
+        methods: {charge: allocation method}
+    """
+
+    def __init__(self, consol_shipment, source_doc, methods):
+        self.consol_shipment = consol_shipment.name
+        self.source_doctype = source_doc.doctype
+        self.source = source_doc.name
+        self.methods = methods
+        self.deleted = []
+        self.pending = []
+
+    def add(self, project, project_changes, doc):
+        """Buffer a project's changes (after its document is written)"""
+        for change in project_changes:
+            action, row, amount, entry = change[:4]
+
+            if entry:
+                self.deleted.append(entry.name)
+            if action == "remove":
+                continue
+
+            child = change[4]
+            self.pending.append(frappe._dict(
+                name=entry.name if entry else frappe.generate_hash(length=10),
+                creation=entry.creation if entry else None,
+                owner=entry.owner if entry else None,
+                consol_shipment=self.consol_shipment,
+                source_doctype=self.source_doctype,
+                source=self.source,
+                charge=row.name,
+                item_code=child.get("item_code") or child.get("expense_type"),
+                project=project,
+                allocation_method=self.methods.get(row.name),
+                amount=amount,
+                qty=child.get("qty"),
+                target=doc.name,
+                target_row=child.name,
+            ))
+
+    def flush(self):
+        """Write buffered changes: removed and updated entries out, new and updated ones in"""
+        if self.deleted:
+            frappe.db.delete(LEDGER_DOCTYPE, {"name": ["in", self.deleted]})
+
+        if self.pending:
+            timestamp = now()
+            user = frappe.session.user
+            frappe.db.bulk_insert(
+                LEDGER_DOCTYPE,
+                STANDARD_FIELDS + LEDGER_FIELDS,
+                [
+                    [e.name, e.creation or timestamp, timestamp, e.owner or user, user, 0]
+                    + [e[f] for f in LEDGER_FIELDS]
+                    for e in self.pending
+                ],
+            )
+
+        self.deleted = []
+        self.pending = []
+
+
+def resplit_consol_shipment(consol_shipment, progress=None):
+    """
+    Split every consol document of a shipment again, e.g. after members'
+    weights or cbms were corrected. Only changed rows are written.
+
+    Args:
+        consol_shipment: FF Consol Shipment document
+        progress: ConsolJobProgress of a background run (optional)
+
+    Returns:
+        list: Names of the Purchase Invoices / Expense Claims created
+    """
+    sources = frappe.get_all(
+        LEDGER_DOCTYPE,
+        filters={"consol_shipment": consol_shipment.name},
+        fields=["source_doctype", "source"],
+        distinct=True,
+        order_by="source_doctype, source",
+        as_list=True,
+    )
+
+    created = []
+    for source_doctype, source in sources:
+        created += split_consol_document(consol_shipment, frappe.get_doc(source_doctype, source), progress)
+    return created
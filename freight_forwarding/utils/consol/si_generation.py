@@ -9,13 +9,17 @@ import frappe
 from frappe import _
 
 
-def create_si_per_member(consol_shipment, sell_plan=None):
+def create_si_per_member(consol_shipment, sell_plan=None, progress=None):
     """
     Create Sales Invoice per project member based on sell plan.
     
+    Members whose project already has a Sales Invoice of this consol are
+    skipped, so an interrupted run can be started again.
+    
     Args:
         consol_shipment: FF Consol Shipment document
         sell_plan: dict of {project: [items]} or None to use default
+        progress: ConsolJobProgress of a background run (optional)
     
     Returns:
         list: List of created Sales Invoice names
@@ -24,9 +28,18 @@ def create_si_per_member(consol_shipment, sell_plan=None):
         frappe.throw(_("No consol members found in consol shipment."))
     
     created_sis = []
+    invoiced_projects = set(frappe.get_all(
+        "Sales Invoice",
+        filters={"consol_shipment": consol_shipment.name, "docstatus": ["<", 2]},
+        pluck="project",
+    ))
+    members = consol_shipment.consol_members
     
-    for member in consol_shipment.consol_members:
-        if not member.project:
+    for count, member in enumerate(members, 1):
+        if progress:
+            progress.update(count - 1, len(members))
+        
+        if not member.project or member.project in invoiced_projects:
             continue
         
         # Get project details
@@ -88,6 +101,10 @@ def create_si_per_member(consol_shipment, sell_plan=None):
         
         si_doc.insert()
         created_sis.append(si_doc.name)
+        invoiced_projects.add(member.project)
+    
+    if progress:
+        progress.update(len(members), len(members))
     
     return created_sis
 
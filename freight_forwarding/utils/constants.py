@@ -67,3 +67,11 @@ ALLOWED_DIVISIONS = ["Export", "Import", "Domestic", "Project"]
 # Allowed modes
 ALLOWED_MODES = ["Sea", "Air", "Land"]
 
+
+# Volumetric divisors (cm³ per kg) for chargeable weight by mode:
+# Air 6000 (IATA, 166.67 kg/CBM), Sea W/M (1 CBM = 1000 kg), Land 3000 (333 kg/CBM)
+VOLUMETRIC_DIVISORS = {
+    "Air": 6000,
+    "Sea": 1000,
+    "Land": 3000,
+}
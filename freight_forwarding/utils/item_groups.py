@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Freight Services Item Group Tree
+
+The Item Groups under "Freight Services" (the whole subtree, by nested
+set), cached per worker. Saving or deleting an Item Group bumps a shared
+version in Redis so every worker reloads the tree on next use.
+"""
+
+import frappe
+
+FREIGHT_SERVICES = "Freight Services"
+
+# Redis key holding the shared item group tree version
+ITEM_GROUP_VERSION_KEY = "ff_item_group_version"
+
+_freight_service_groups = None
+
+
+def get_freight_service_groups():
+    """
+    Names of "Freight Services" and every Item Group below it.
+
+    Returns:
+        frozenset
+    """
+    global _freight_service_groups
+    version = frappe.cache().get_value(ITEM_GROUP_VERSION_KEY)
+    if not version:
+        version = bump_shared_version()
+
+    if _freight_service_groups is None or _freight_service_groups[0] != version:
+        groups = frappe.db.sql("""
+            SELECT child.name
+            FROM `tabItem Group` child
+            INNER JOIN `tabItem Group` root ON root.name = %s
+            WHERE child.lft >= root.lft AND child.rgt <= root.rgt
+        """, (FREIGHT_SERVICES,))
+        _freight_service_groups = (version, frozenset(g[0] for g in groups))
+
+    return _freight_service_groups[1]
+
+
+def bump_shared_version():
+    """Mark every worker's item group tree as stale"""
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(ITEM_GROUP_VERSION_KEY, version)
+    return version
+
+
+def invalidate_item_groups(doc=None, method=None):
+    """Doc event for Item Group: reload the tree after the change is committed"""
+    global _freight_service_groups
+    _freight_service_groups = None
+    frappe.db.after_commit.add(bump_shared_version)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Adjustments: FX and Fuel Index
+
+Time series of exchange rates (ERPNext Currency Exchange) and fuel index
+adjustments (FF Fuel Index), cached per worker and keyed by
+(currency pair, date). A date range can be preloaded with one query so the
+rate engine can normalize every option to the company currency without a
+Currency Exchange query per option.
+
+The per-date rates are kept in an LRU bounded by `FX_CACHE_SIZE`. A miss
+loads the pair's rates for `FX_FALLBACK_DAYS` around the date with one
+query; only dates without a Currency Exchange in reach fall back to
+ERPNext's `get_exchange_rate`.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import timedelta
+
+import frappe
+import numpy as np
+from frappe.utils import flt, getdate
+
+# Redis key holding the shared adjustment version
+ADJUSTMENT_VERSION_KEY = "ff_rate_adjustment_version"
+
+# Days before a preloaded range searched for the rate in effect on its first day
+FX_LOOKBACK_DAYS = 31
+
+# (currency pair, date) rates kept per worker
+FX_CACHE_SIZE = 20000
+
+# Days on each side of a missed date loaded with it
+FX_FALLBACK_DAYS = 15
+
+# Marks a date of a loaded window without Currency Exchange (asks ERPNext once)
+NOT_QUOTED = "not_quoted"
+
+_store = None
+
+
+class TimeSeries:
+    """Values effective from a date until the next entry"""
+
+    def __init__(self, points):
+        points = sorted(points)
+        self.dates = [p[0] for p in points]
+        self.values = [p[1] for p in points]
+
+    def value_on(self, date_filter):
+        """Return the latest value effective on or before `date_filter`, or None"""
+        idx = bisect_right(self.dates, date_filter) - 1
+        return self.values[idx] if idx >= 0 else None
+
+    def values_on(self, dates):
+        """Vectorized `value_on` for an array of dates; NaN where no value is in effect"""
+        idx = np.searchsorted(
+            np.array(self.dates, dtype="datetime64[D]"), np.array(dates, dtype="datetime64[D]"), side="right"
+        ) - 1
+        values = np.array(self.values + [np.nan], dtype=float)
+        return values[np.where(idx >= 0, idx, -1)]
+
+
+class AdjustmentStore:
+    """
+    Per-worker cache of exchange rates and fuel index adjustments.
+
+    With `fallback=False` the store never queries: rates outside what was
+    preloaded are missing (None), so it can be shipped to processes without
+    a site connection.
+
+    Args:
+        version: Shared adjustment version the store was built at
+        fallback: Query rates that were not preloaded
+        max_fx_rates: (currency pair, date) rates kept, least recently used
+            evicted first; None for no bound
+    """
+
+    def __init__(self, version=None, fallback=True, max_fx_rates=FX_CACHE_SIZE):
+        self.version = version
+        self.fallback = fallback
+        self.max_fx_rates = max_fx_rates
+        self.fx_rates = OrderedDict()
+        self._fuel_series = None
+
+    def _remember(self, key, rate):
+        self.fx_rates[key] = rate
+        self.fx_rates.move_to_end(key)
+        if self.max_fx_rates and len(self.fx_rates) > self.max_fx_rates:
+            self.fx_rates.popitem(last=False)
+
+    def preload_fx(self, from_date, to_date, currencies, to_currency):
+        """
+        Load exchange rates for a date range with one query.
+
+        Args:
+            from_date: First date of the range
+            to_date: Last date of the range
+            currencies: Currencies to convert from
+            to_currency: Currency to convert to (usually company currency)
+        """
+        from_date = getdate(from_date)
+        to_date = getdate(to_date)
+        currencies = [c for c in set(currencies) if c and c != to_currency]
+        if not currencies:
+            return
+
+        rows = frappe.get_all(
+            "Currency Exchange",
+            filters={
+                "date": ["between", [from_date - timedelta(days=FX_LOOKBACK_DAYS), to_date]],
+                "from_currency": ["in", currencies + [to_currency]],
+                "to_currency": ["in", currencies + [to_currency]],
+            },
+            fields=["date", "from_currency", "to_currency", "exchange_rate"],
+        )
+
+        direct = {}
+        inverse = {}
+        for row in rows:
+            rate = flt(row.exchange_rate)
+            if not rate:
+                continue
+            if row.to_currency == to_currency:
+                direct.setdefault(row.from_currency, {})[getdate(row.date)] = rate
+            elif row.from_currency == to_currency:
+                inverse.setdefault(row.to_currency, {})[getdate(row.date)] = 1 / rate
+
+        for currency in currencies:
+            # Inverse quotes only fill dates without a direct quote
+            merged = dict(inverse.get(currency, {}))
+            merged.update(direct.get(currency, {}))
+
+            series = TimeSeries(merged.items())
+            day = from_date
+            while day <= to_date:
+                rate = series.value_on(day)
+                if rate:
+                    self._remember((currency, to_currency, day), rate)
+                day += timedelta(days=1)
+
+    def get_exchange_rate(self, from_currency, to_currency, date_filter):
+        """
+        Exchange rate from one currency to another on a date.
+
+        Served from the preloaded/cached series. On a miss the pair's rates
+        for `FX_FALLBACK_DAYS` around the date are loaded with one query;
+        a date still without a rate falls back to ERPNext's
+        `get_exchange_rate` once.
+
+        Returns:
+            float or None
+        """
+        if not from_currency or from_currency == to_currency:
+            return 1.0
+
+        date_filter = getdate(date_filter)
+        key = (from_currency, to_currency, date_filter)
+        if key in self.fx_rates:
+            self.fx_rates.move_to_end(key)
+        elif self.fallback:
+            self.load_fx_window(from_currency, to_currency, date_filter)
+        else:
+            return None
+
+        if self.fx_rates[key] == NOT_QUOTED:
+            from erpnext.setup.utils import get_exchange_rate
+
+            self._remember(key, flt(get_exchange_rate(from_currency, to_currency, date_filter)) or None)
+        return self.fx_rates[key]
+
+    def load_fx_window(self, from_currency, to_currency, date_filter):
+        """Load a pair's rates for `FX_FALLBACK_DAYS` around a date, marking dates without one"""
+        window = timedelta(days=FX_FALLBACK_DAYS)
+        self.preload_fx(date_filter - window, date_filter + window, [from_currency], to_currency)
+
+        day = date_filter - window
+        while day <= date_filter + window:
+            key = (from_currency, to_currency, day)
+            if key not in self.fx_rates:
+                self._remember(key, NOT_QUOTED)
+            day += timedelta(days=1)
+
+        # Only with a bound below the window: the missed date itself was evicted
+        key = (from_currency, to_currency, date_filter)
+        if key not in self.fx_rates:
+            self.preload_fx(date_filter, date_filter, [from_currency], to_currency)
+            if key not in self.fx_rates:
+                self._remember(key, NOT_QUOTED)
+
+    def get_fuel_adjustment_percent(self, mode, date_filter):
+        """Fuel index adjustment (%) in effect for a mode on a date"""
+        if self._fuel_series is None:
+            self.preload_fuel()
+
+        series = self._fuel_series.get(mode)
+        if not series:
+            return 0
+        return series.value_on(getdate(date_filter)) or 0
+
+    def get_fuel_adjustment_percents(self, mode, dates):
+        """Vectorized `get_fuel_adjustment_percent` for an array of dates"""
+        if self._fuel_series is None:
+            self.preload_fuel()
+
+        series = self._fuel_series.get(mode)
+        if not series:
+            return np.zeros(len(dates))
+        return np.nan_to_num(series.values_on([getdate(d) for d in dates]))
+
+    def fuel_index_changes(self, mode, from_date, to_date):
+        """Dates in [from_date, to_date] on which a fuel index adjustment of a mode takes effect"""
+        if self._fuel_series is None:
+            self.preload_fuel()
+
+        series = self._fuel_series.get(mode)
+        if not series:
+            return []
+        dates = series.dates
+        return dates[bisect_left(dates, getdate(from_date)):bisect_right(dates, getdate(to_date))]
+
+    def preload_fuel(self):
+        """Load the fuel index series of all modes with one query"""
+        if self._fuel_series is None:
+            points = {}
+            for row in frappe.get_all(
+                "FF Fuel Index",
+                fields=["mode", "effective_date", "adjustment_percent"],
+            ):
+                points.setdefault(row.mode, []).append(
+                    (getdate(row.effective_date), flt(row.adjustment_percent))
+                )
+            self._fuel_series = {mode: TimeSeries(p) for mode, p in points.items()}
+
+
+def get_adjustment_store():
+    """Get this worker's adjustment store, reset when FX or fuel data changes"""
+    global _store
+    version = get_shared_version()
+    if _store is None or _store.version != version:
+        _store = AdjustmentStore(version=version)
+    return _store
+
+
+def get_shared_version():
+    """Get the FX / fuel version shared by all workers"""
+    version = frappe.cache().get_value(ADJUSTMENT_VERSION_KEY)
+    if not version:
+        version = bump_shared_version()
+    return version
+
+
+def bump_shared_version():
+    """Mark every worker's adjustment store as stale"""
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(ADJUSTMENT_VERSION_KEY, version)
+    return version
+
+
+def invalidate_adjustments(doc=None, method=None):
+    """
+    Drop cached FX/fuel data after a Currency Exchange or FF Fuel Index changed.
+
+    Used as a doc event for Currency Exchange and from FF Fuel Index.
+    """
+    global _store
+    _store = None
+    frappe.db.after_commit.add(bump_shared_version)
+
+
+def get_company_currency(company=None):
+    """Default currency of the given (or default) company"""
+    company = company or frappe.defaults.get_user_default("Company") or frappe.defaults.get_global_default("company")
+    currency = frappe.get_cached_value("Company", company, "default_currency") if company else None
+    return currency or frappe.defaults.get_global_default("currency")
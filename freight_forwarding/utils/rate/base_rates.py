@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Base Rate Tables
+
+Per-lane, per-container-type base rates compiled from a contract's
+`rate_bases`. Weight breaks are kept as sorted arrays and queried by
+bisection instead of scanning every base row for every lane.
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+from frappe.utils import flt
+
+
+class BreakTable:
+    """Sorted, non-overlapping weight breaks for one (lane, container type)"""
+
+    __slots__ = ("starts", "ends", "rates", "_arrays")
+
+    def __init__(self, breaks):
+        breaks = sorted(breaks)
+        self.starts = [b[0] for b in breaks]
+        self.ends = [b[1] for b in breaks]
+        self.rates = [b[2] for b in breaks]
+        self._arrays = None
+
+    def find(self, weight):
+        """Return the rate of the break containing `weight`, or None"""
+        idx = bisect_right(self.starts, weight) - 1
+        if idx >= 0 and weight <= self.ends[idx]:
+            return self.rates[idx]
+        return None
+
+    def find_array(self, weights):
+        """Vectorized `find`: rates for an array of weights, NaN on a miss"""
+        if self._arrays is None:
+            self._arrays = (
+                np.array(self.starts, dtype=float),
+                np.array(self.ends, dtype=float),
+                np.array(self.rates, dtype=float),
+            )
+        starts, ends, rates = self._arrays
+
+        idx = np.searchsorted(starts, weights, side="right") - 1
+        clipped = np.clip(idx, 0, len(starts) - 1)
+        hit = (idx >= 0) & (weights <= ends[clipped])
+        return np.where(hit, rates[clipped], np.nan)
+
+    def overlaps(self):
+        """
+        Return (start, end) pairs of adjacent breaks that overlap.
+
+        Breaks may touch (0-45, 45-100); the boundary weight goes to the
+        higher break.
+        """
+        return [
+            ((self.starts[i], self.ends[i]), (self.starts[i + 1], self.ends[i + 1]))
+            for i in range(len(self.starts) - 1)
+            if self.starts[i + 1] < self.ends[i]
+        ]
+
+
+def format_weight_break(start, end):
+    """Weight break for messages: "45-100", or "1000+" when open-ended"""
+    return f"{start}+" if end == float("inf") else f"{start}-{end}"
+
+
+class BaseRateTable:
+    """
+    Base rates of one contract version, keyed by (rate_lane, container_type).
+
+    Rows with a weight break go to a BreakTable; rows without one are flat
+    rates for their lane/container type. A break with only
+    weight_break_from (e.g. 1000+ kg) is open-ended.
+    """
+
+    def __init__(self, rate_bases):
+        breaks = {}
+        self.flat = {}
+
+        for rate_base in rate_bases:
+            key = (rate_base.rate_lane, rate_base.container_type or None)
+            base_rate = flt(rate_base.base_rate)
+
+            if flt(rate_base.weight_break_from) > 0 or flt(rate_base.weight_break_to) > 0:
+                breaks.setdefault(key, []).append(
+                    (flt(rate_base.weight_break_from), flt(rate_base.weight_break_to) or float("inf"), base_rate)
+                )
+            else:
+                # First flat row per key wins, as in contract row order
+                self.flat.setdefault(key, base_rate)
+
+        self.breaks = {key: BreakTable(rows) for key, rows in breaks.items()}
+
+    def find(self, lane_name, weight=None, container_type=None):
+        """
+        Find the base rate for a lane.
+
+        Lookup order: container type (by weight break, then flat), then
+        weight break without container type, then the lane's flat rate.
+
+        Args:
+            lane_name: FF Rate Lane row name
+            weight: Weight in kg (optional)
+            container_type: Container type (optional)
+
+        Returns:
+            float or None: None when no base row matches
+        """
+        keys = []
+        if container_type:
+            keys.append((lane_name, container_type))
+        keys.append((lane_name, None))
+
+        for key in keys:
+            if weight:
+                table = self.breaks.get(key)
+                if table:
+                    rate = table.find(weight)
+                    if rate is not None:
+                        return rate
+            if key in self.flat:
+                return self.flat[key]
+
+        return None
+
+    def find_many(self, lane_name, size, weights=None, container_types=None):
+        """
+        Vectorized `find` for many shipments on one lane.
+
+        Args:
+            lane_name: FF Rate Lane row name
+            size: Number of shipments
+            weights: array of weights in kg (optional)
+            container_types: array of container types (optional)
+
+        Returns:
+            numpy.ndarray: Base rates, NaN where no base row matches
+        """
+        result = np.full(size, np.nan)
+        weights = np.nan_to_num(np.asarray(weights, dtype=float)) if weights is not None else None
+        if container_types is not None:
+            container_types = np.array([c or "" for c in container_types], dtype=object)
+        else:
+            container_types = np.full(size, "", dtype=object)
+
+        for container_type in set(container_types):
+            group = container_types == container_type
+
+            keys = []
+            if container_type:
+                keys.append((lane_name, container_type))
+            keys.append((lane_name, None))
+
+            for key in keys:
+                table = self.breaks.get(key)
+                if table and weights is not None:
+                    pending = group & np.isnan(result) & (weights > 0)
+                    if pending.any():
+                        result[pending] = table.find_array(weights[pending])
+                if key in self.flat:
+                    result[group & np.isnan(result)] = self.flat[key]
+
+        return result
+
+
+def get_base_rate_table(contract_doc):
+    """
+    Get the compiled base rate table of a contract.
+
+    Built once per contract object: compiled contracts are replaced on every
+    new version, so the table always matches the contract's rate_bases.
+    """
+    table = getattr(contract_doc, "_base_rate_table", None)
+    if table is None:
+        table = BaseRateTable(contract_doc.rate_bases or [])
+        contract_doc._base_rate_table = table
+    return table
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Contract Versions
+
+Every save of an FF Rate Contract that changes its rates records an
+FF Rate Contract Version holding one fingerprint per lane. The delta to
+the previous version (lanes added, removed or repriced) is a hash join of
+the two fingerprint maps, so republishing a contract only invalidates the
+lanes that actually changed in the rate index, quote cache and rate cube.
+
+Lanes are identified by their natural key (lane type, endpoints, service,
+equipment, carrier) rather than the child row name, so a contract whose
+rows were deleted and re-entered diffs by content.
+"""
+
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, flt, get_datetime
+
+from freight_forwarding.utils.rate.rate_index import LANE_ENDPOINTS, parse_modes
+
+LANE_KEY_FIELDS = [
+    "lane_type", "pol", "pod", "aoo", "aod", "origin", "destination",
+    "service", "equipment", "carrier", "airline", "vehicle_type",
+]
+LANE_RATE_FIELDS = ["transit", "chargeable_rule", "basis", "distance"]
+BASE_FIELDS = ["container_type", "equipment", "weight_break_from", "weight_break_to", "base_rate", "currency", "uom"]
+SURCHARGE_FIELDS = ["surcharge_code", "calc_type", "amount"]
+FREETIME_FIELDS = [
+    "port", "free_time_demurrage", "free_time_detention", "free_time_storage",
+    "demurrage_rate", "detention_rate", "storage_rate", "currency",
+]
+HEADER_FIELDS = ["vendor", "carrier", "currency", "status", "mode", "validity_from", "validity_to"]
+
+
+def normalize(value):
+    """JSON-stable form of a field value (numbers as floats, dates as strings)"""
+    if isinstance(value, (int, float)):
+        return flt(value)
+    if value in (None, ""):
+        return None
+    return str(value)
+
+
+def digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def lane_key(lane):
+    """Natural key of a lane, as a string (JSON object key)"""
+    return "|".join(str(lane.get(f) or "") for f in LANE_KEY_FIELDS)
+
+
+def lane_fingerprints(contract):
+    """
+    Fingerprint of every lane of a contract.
+
+    A lane's fingerprint covers its own rate fields and base rows plus the
+    contract-wide header, surcharges and free time, so a change to any of
+    those reprices every lane.
+
+    Args:
+        contract: FF Rate Contract document or CompiledContract
+
+    Returns:
+        dict: {lane_key: fingerprint}
+    """
+    contract_digest = digest({
+        "header": [normalize(getattr(contract, f, None)) for f in HEADER_FIELDS],
+        "surcharges": sorted(
+            [normalize(s.get(f)) for f in SURCHARGE_FIELDS] for s in contract.rate_surcharges or []
+        ),
+        "freetimes": sorted(
+            [normalize(t.get(f)) for f in FREETIME_FIELDS] for t in contract.rate_freetimes or []
+        ),
+    })
+
+    bases_by_lane = {}
+    for rate_base in contract.rate_bases or []:
+        bases_by_lane.setdefault(rate_base.rate_lane, []).append(
+            [normalize(rate_base.get(f)) for f in BASE_FIELDS]
+        )
+
+    # Lanes sharing a natural key are fingerprinted together
+    lanes_by_key = {}
+    for lane in contract.rate_lanes or []:
+        lanes_by_key.setdefault(lane_key(lane), []).append([
+            [normalize(lane.get(f)) for f in LANE_RATE_FIELDS],
+            sorted(bases_by_lane.get(lane.name, [])),
+        ])
+
+    return {
+        key: digest([contract_digest, sorted(lanes)])
+        for key, lanes in lanes_by_key.items()
+    }
+
+
+def diff_fingerprints(old, new):
+    """
+    Delta between two fingerprint maps (hash join on lane key).
+
+    Returns:
+        dict: {"added": [...], "removed": [...], "repriced": [...]} lane keys
+    """
+    return {
+        "added": sorted(key for key in new if key not in old),
+        "removed": sorted(key for key in old if key not in new),
+        "repriced": sorted(key for key, fingerprint in new.items() if key in old and old[key] != fingerprint),
+    }
+
+
+def index_keys(lane_keys, modes):
+    """
+    Rate index keys (mode, lane_type, origin, destination) of lane keys.
+
+    Args:
+        lane_keys: Natural lane keys (see `lane_key`)
+        modes: Modes of the contract
+
+    Returns:
+        set
+    """
+    keys = set()
+    for key in lane_keys:
+        lane = dict(zip(LANE_KEY_FIELDS, key.split("|")))
+        for mode in modes:
+            origin_field, destination_field = LANE_ENDPOINTS.get(mode, (None, None))
+            origin = lane.get(origin_field) if origin_field else None
+            destination = lane.get(destination_field) if destination_field else None
+            if origin and destination:
+                keys.add((mode, lane["lane_type"], origin, destination))
+    return keys
+
+
+def get_latest_version(contract_name):
+    """Latest FF Rate Contract Version of a contract, or None"""
+    versions = frappe.get_all(
+        "FF Rate Contract Version",
+        filters={"rate_contract": contract_name},
+        fields=["name", "version", "contract_modified", "mode", "lane_fingerprints"],
+        order_by="version desc",
+        limit=1,
+    )
+    return versions[0] if versions else None
+
+
+def record_contract_version(contract):
+    """
+    Record a new version of a saved contract and return its delta.
+
+    Called from FF Rate Contract on_update. No version is recorded when no
+    lane changed.
+
+    Args:
+        contract: FF Rate Contract document
+
+    Returns:
+        dict or None: {"previous_modified", "modified", "changed_keys", "added",
+            "removed", "repriced"}; None when the contract has no previous
+            version (everything changed)
+    """
+    fingerprints = lane_fingerprints(contract)
+    previous = get_latest_version(contract.name)
+    old = json.loads(previous.lane_fingerprints or "{}") if previous else {}
+    delta = diff_fingerprints(old, fingerprints)
+
+    if previous and not any(delta.values()):
+        # Nothing that prices a lane changed: carry the version forward
+        frappe.db.set_value(
+            "FF Rate Contract Version", previous.name, "contract_modified", contract.modified,
+            update_modified=False,
+        )
+        return make_delta(previous, contract, delta, set())
+
+    frappe.get_doc({
+        "doctype": "FF Rate Contract Version",
+        "rate_contract": contract.name,
+        "version": cint(previous.version if previous else 0) + 1,
+        "contract_modified": contract.modified,
+        "mode": contract.mode,
+        "lanes_added": len(delta["added"]),
+        "lanes_removed": len(delta["removed"]),
+        "lanes_repriced": len(delta["repriced"]),
+        "delta": json.dumps(delta),
+        "lane_fingerprints": json.dumps(fingerprints, sort_keys=True),
+    }).insert(ignore_permissions=True)
+
+    if not previous:
+        return None
+
+    changed = index_keys(delta["removed"] + delta["repriced"], parse_modes(previous.mode))
+    changed |= index_keys(delta["added"] + delta["repriced"], parse_modes(contract.mode))
+    return make_delta(previous, contract, delta, changed)
+
+
+def make_delta(previous, contract, delta, changed_keys):
+    return {
+        "previous_modified": str(get_datetime(previous.contract_modified)) if previous.contract_modified else None,
+        "modified": str(get_datetime(contract.modified)),
+        "changed_keys": sorted(changed_keys),
+        "added": delta["added"],
+        "removed": delta["removed"],
+        "repriced": delta["repriced"],
+    }
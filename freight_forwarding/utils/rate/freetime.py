@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Demurrage, Detention and Storage (D&D) Costs
+
+Compiles a contract's `rate_freetimes` into per-port free days and daily
+rates, and prices projected dwell for many containers in one NumPy pass:
+
+    charge = max(0, days - free days) * daily rate
+
+Demurrage and storage accrue on dwell days at the port, detention on days
+the container is out of the terminal.
+"""
+
+import numpy as np
+from frappe.utils import cint, flt
+
+CHARGES = ("demurrage", "detention", "storage")
+
+
+class FreetimeTerms:
+    """Free days and daily rates of one port"""
+
+    __slots__ = ("free_days", "rates", "currency")
+
+    def __init__(self, freetime):
+        self.free_days = {
+            "demurrage": cint(freetime.free_time_demurrage),
+            "detention": cint(freetime.free_time_detention),
+            "storage": cint(freetime.free_time_storage),
+        }
+        self.rates = {
+            "demurrage": flt(freetime.demurrage_rate),
+            "detention": flt(freetime.detention_rate),
+            "storage": flt(freetime.storage_rate),
+        }
+        self.currency = freetime.currency
+
+    def evaluate(self, dwell_days, detention_days=None):
+        """
+        D&D per container for arrays of projected days.
+
+        Args:
+            dwell_days: array of days at the port (demurrage, storage)
+            detention_days: array of days out of the terminal (optional)
+
+        Returns:
+            dict: {"demurrage", "detention", "storage", "total"} arrays
+        """
+        dwell_days = np.nan_to_num(np.asarray(dwell_days, dtype=float))
+        if detention_days is None:
+            detention_days = np.zeros(dwell_days.shape)
+        else:
+            detention_days = np.nan_to_num(np.asarray(detention_days, dtype=float))
+
+        days = {"demurrage": dwell_days, "detention": detention_days, "storage": dwell_days}
+        result = {
+            charge: np.maximum(days[charge] - self.free_days[charge], 0) * self.rates[charge]
+            for charge in CHARGES
+        }
+        result["total"] = result["demurrage"] + result["detention"] + result["storage"]
+        return result
+
+    def total(self, dwell_days, detention_days=None):
+        """D&D of one container"""
+        cost = 0
+        for charge, days in (("demurrage", dwell_days), ("detention", detention_days), ("storage", dwell_days)):
+            if days:
+                cost += max(flt(days) - self.free_days[charge], 0) * self.rates[charge]
+        return cost
+
+
+class FreetimeTable:
+    """
+    Free-time terms of one contract version, keyed by port.
+
+    The first row per port wins; a row without a port applies to every
+    port without its own row.
+    """
+
+    def __init__(self, rate_freetimes):
+        self.ports = {}
+        for freetime in rate_freetimes:
+            self.ports.setdefault(freetime.port or None, FreetimeTerms(freetime))
+
+    def find(self, port):
+        """Terms for a port, or None when the contract has none"""
+        return self.ports.get(port) or self.ports.get(None)
+
+
+def get_freetime_table(contract_doc):
+    """Get the compiled free-time table of a contract (built once per contract object)"""
+    table = getattr(contract_doc, "_freetime_table", None)
+    if table is None:
+        table = FreetimeTable(contract_doc.rate_freetimes or [])
+        contract_doc._freetime_table = table
+    return table
+
+
+def get_lane_port(lane):
+    """Port where a lane's cargo dwells (POD of Sea lanes, else the destination)"""
+    return lane.get("pod") or lane.get("aod") or lane.get("destination")
+
+
+def calculate_dd_cost(contract_doc, lane, dwell_days=None, detention_days=None, containers=1):
+    """
+    Expected D&D of a shipment on a contract lane.
+
+    Args:
+        contract_doc: FF Rate Contract document or CompiledContract
+        lane: FF Rate Lane row
+        dwell_days: Projected days at the port
+        detention_days: Projected days out of the terminal (optional)
+        containers: Number of containers
+
+    Returns:
+        tuple: (cost, currency); (None, None) when the contract has no terms
+            for the port, i.e. the D&D is unknown
+    """
+    terms = get_freetime_table(contract_doc).find(get_lane_port(lane))
+    if not terms:
+        return None, None
+
+    cost = terms.total(dwell_days, detention_days) * (cint(containers) or 1)
+    return cost, terms.currency or contract_doc.currency
+
+
+def price_freetime(contract_doc, port, dwell_days, detention_days=None):
+    """
+    Price D&D for a vector of containers at one port in one pass.
+
+    Args:
+        contract_doc: FF Rate Contract document or CompiledContract
+        port: FF Port
+        dwell_days: array of projected days at the port
+        detention_days: array of projected days out of the terminal (optional)
+
+    Returns:
+        dict: {"demurrage", "detention", "storage", "total", "currency"};
+            None when the contract has no terms for the port, i.e. the D&D
+            is unknown
+    """
+    terms = get_freetime_table(contract_doc).find(port)
+    if not terms:
+        return None
+
+    result = terms.evaluate(dwell_days, detention_days)
+    result["currency"] = terms.currency or contract_doc.currency
+    return result
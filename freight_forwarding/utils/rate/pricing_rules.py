@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Pricing Rule Cache
+
+Keeps active FF Pricing Rules in worker memory as a compiled matcher, so
+sell pricing is an in-memory scan per option instead of a query round-trip.
+Saving or deleting an FF Pricing Rule bumps a shared version in Redis and
+every worker recompiles on its next lookup.
+"""
+
+import frappe
+from frappe.utils import flt, getdate
+
+from freight_forwarding.utils.rate.contract_versions import digest
+from freight_forwarding.utils.rate.rate_index import parse_modes
+from freight_forwarding.utils.rate.validity_index import ChangePoints
+
+# Redis key holding the shared pricing rule version
+PRICING_RULE_VERSION_KEY = "ff_pricing_rule_version"
+
+PRICING_RULE_FIELDS = [
+    "name", "division", "mode", "customer", "commodity", "priority",
+    "validity_from", "validity_to", "markup_type", "markup_value",
+    "discount_type", "discount_value", "modified",
+]
+
+_matcher = None
+
+
+class CompiledPricingRule:
+    """FF Pricing Rule reduced to its match conditions and adjustments"""
+
+    def __init__(self, rule):
+        self.name = rule.name
+        self.priority = rule.priority if rule.priority is not None else 10
+        self.division = rule.division or None
+        self.modes = parse_modes(rule.mode)
+        self.customer = rule.customer or None
+        self.commodity = (rule.commodity or "").strip().lower() or None
+        self.validity_from = getdate(rule.validity_from) if rule.validity_from else None
+        self.validity_to = getdate(rule.validity_to) if rule.validity_to else None
+        self.markup_type = rule.markup_type
+        self.markup_value = flt(rule.markup_value)
+        self.discount_type = rule.discount_type
+        self.discount_value = flt(rule.discount_value)
+        self.modified = rule.modified
+        self.specificity = sum(1 for v in (self.division, self.customer, self.commodity) if v)
+
+    def matches(self, date_filter, division=None, customer=None, commodity=None):
+        """Check division, customer, commodity and validity conditions"""
+        if self.division and self.division != division:
+            return False
+        if self.customer and self.customer != customer:
+            return False
+        if self.commodity and self.commodity != (commodity or "").strip().lower():
+            return False
+        if self.validity_from and date_filter < self.validity_from:
+            return False
+        if self.validity_to and date_filter > self.validity_to:
+            return False
+        return True
+
+    def apply(self, buy_rate):
+        """Apply markup/discount to a buy rate"""
+        sell_rate = buy_rate
+
+        if self.markup_value:
+            if self.markup_type == "Percentage":
+                sell_rate = sell_rate * (1 + self.markup_value / 100)
+            else:
+                sell_rate = sell_rate + self.markup_value
+
+        if self.discount_value:
+            if self.discount_type == "Percentage":
+                sell_rate = sell_rate * (1 - self.discount_value / 100)
+            else:
+                sell_rate = sell_rate - self.discount_value
+
+        return sell_rate
+
+
+class PricingRuleMatcher:
+    """Active pricing rules grouped by mode, in priority order"""
+
+    def __init__(self, rules, version=None):
+        self.version = version
+        self.rules = sorted(
+            (CompiledPricingRule(r) for r in rules),
+            key=lambda r: (r.priority, -r.specificity, r.name),
+        )
+
+        # Rules without a mode apply to every mode
+        self.rules_by_mode = {}
+        self.mode_fingerprints = {}
+        for mode in ("Sea", "Air", "Land"):
+            self.rules_by_mode[mode] = [r for r in self.rules if not r.modes or mode in r.modes]
+            # Stable across processes, unlike hash(), so stamps can be compared between workers
+            self.mode_fingerprints[mode] = digest([(r.name, str(r.modified)) for r in self.rules_by_mode[mode]])
+
+        self.change_points = ChangePoints((r.validity_from, r.validity_to) for r in self.rules)
+
+    def validity_changes(self, from_date, to_date):
+        """Return dates in [from_date, to_date] on which any rule starts or ends"""
+        return self.change_points.between(getdate(from_date), getdate(to_date))
+
+    def match(self, mode, date_filter=None, division=None, customer=None, commodity=None):
+        """
+        Find the highest-priority rule matching a quote context.
+
+        Args:
+            mode: "Sea", "Air", or "Land"
+            date_filter: Quote date (default: today)
+            division: Export / Import / Domestic / Project
+            customer: Customer name
+            commodity: Commodity description
+
+        Returns:
+            CompiledPricingRule or None
+        """
+        date_filter = getdate(date_filter)
+        for rule in self.rules_by_mode.get(mode, []):
+            if rule.matches(date_filter, division, customer, commodity):
+                return rule
+        return None
+
+
+def get_pricing_rule_matcher():
+    """Get this worker's compiled pricing rule matcher, reloaded when rules change"""
+    global _matcher
+    version = get_shared_version()
+    if _matcher is None or _matcher.version != version:
+        rules = frappe.get_all(
+            "FF Pricing Rule",
+            filters={"status": "Active"},
+            fields=PRICING_RULE_FIELDS,
+        )
+        _matcher = PricingRuleMatcher(rules, version=version)
+    return _matcher
+
+
+def get_shared_version():
+    """Get the pricing rule version shared by all workers"""
+    version = frappe.cache().get_value(PRICING_RULE_VERSION_KEY)
+    if not version:
+        version = bump_shared_version()
+    return version
+
+
+def bump_shared_version():
+    """Mark every worker's pricing rule matcher as stale"""
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(PRICING_RULE_VERSION_KEY, version)
+    return version
+
+
+def invalidate_pricing_rules():
+    """
+    Drop the cached matcher after an FF Pricing Rule changed.
+
+    Called from FF Pricing Rule on_update/on_trash. The shared version is
+    bumped once the transaction is committed.
+    """
+    global _matcher
+    _matcher = None
+    frappe.db.after_commit.add(bump_shared_version)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Engine Profiling
+
+Every rate engine call records its wall time into per-worker latency
+histograms, flushed to Redis in batches (one pipeline every
+`METRICS_FLUSH_CALLS` calls or `METRICS_FLUSH_INTERVAL` seconds) and
+aggregated across workers by `get_rate_metrics`.
+
+Profiled calls additionally record per-stage wall time and query counts
+(rate snapshot, quote cache, lane matching, base rates, surcharges and
+fuel, pricing rules) and option counts. A call is profiled when requested (API `debug=1`) or
+sampled at the site config rate `ff_rate_profile_sample_rate` (0 to 1).
+Unprofiled calls only pay for two clock reads.
+
+Counters are raw Redis integers/floats, so they are written and read
+through a pipeline (the cache wrapper pickles hash values).
+"""
+
+import random
+import time
+from contextlib import contextmanager, nullcontext
+
+import frappe
+from frappe.utils import flt
+
+# Redis hash of histogram counters, shared by all workers
+METRICS_KEY = "ff_rate_metrics"
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Stages timed in profiled calls, in pipeline order
+STAGES = ("snapshot", "rate_index", "quote_cache", "lane_match", "base_rate", "surcharges", "pricing_rules")
+
+METRICS_FLUSH_CALLS = 100
+METRICS_FLUSH_INTERVAL = 60
+
+_pending = {}
+_pending_calls = 0
+_last_flush = time.monotonic()
+
+
+class RateProfile:
+    """Per-stage timings, query counts and option counts of one rate engine call"""
+
+    __slots__ = ("operation", "timings", "stage_queries", "counts", "queries", "started")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.timings = {}
+        self.stage_queries = {}
+        self.counts = {}
+        self.queries = 0
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as stage `name` (accumulated over repeated blocks)"""
+        started = time.perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, self.queries - queries)
+
+    def add(self, name, seconds, queries=0):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+        if queries:
+            self.stage_queries[name] = self.stage_queries.get(name, 0) + queries
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def as_dict(self):
+        """Timings in milliseconds, with the total and unattributed time"""
+        total = time.perf_counter() - self.started
+        stages = {
+            name: {
+                "ms": round(self.timings[name] * 1000, 3),
+                "queries": self.stage_queries.get(name, 0),
+            }
+            for name in STAGES
+            if name in self.timings
+        }
+        return {
+            "operation": self.operation,
+            "total_ms": round(total * 1000, 3),
+            "other_ms": round(max(total - sum(self.timings.values()), 0) * 1000, 3),
+            "queries": self.queries,
+            "stages": stages,
+            "counts": dict(self.counts),
+        }
+
+
+def get_active_profile():
+    """Profile of the current call, or None when the call is not profiled"""
+    return getattr(frappe.local, "ff_rate_profile", None)
+
+
+def profile_stage(profile, name):
+    """`profile.stage(name)`, or a no-op context when the call is not profiled"""
+    return profile.stage(name) if profile else nullcontext()
+
+
+def should_profile():
+    """Sample a call for profiling at the site's configured rate"""
+    rate = flt(frappe.conf.get("ff_rate_profile_sample_rate"))
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def rate_profile(operation, force=False):
+    """
+    Measure one rate engine call.
+
+    Nested calls (e.g. `find_rates_batch` quoting lanes through the
+    snapshot) are part of the outermost call and are not recorded twice.
+
+    Args:
+        operation: Name of the call, e.g. "find_rates"
+        force: Profile this call regardless of sampling (debug mode)
+
+    Yields:
+        RateProfile or None: The profile when the call is profiled
+    """
+    if getattr(frappe.local, "ff_rate_call", None):
+        yield get_active_profile()
+        return
+
+    profile = RateProfile(operation) if force or should_profile() else None
+    restore_sql = count_queries(profile) if profile else None
+    frappe.local.ff_rate_call = operation
+    frappe.local.ff_rate_profile = profile
+    started = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        elapsed = time.perf_counter() - started
+        frappe.local.ff_rate_call = None
+        frappe.local.ff_rate_profile = None
+        if restore_sql:
+            restore_sql()
+        record_call(operation, elapsed, profile)
+
+
+def count_queries(profile):
+    """
+    Count queries run during a profiled call by wrapping `frappe.db.sql`
+    (like frappe.recorder). Returns a function restoring the original.
+    """
+    db = getattr(frappe.local, "db", None)
+    if not db:
+        return None
+
+    sql = db.sql
+
+    def counted_sql(*args, **kwargs):
+        profile.queries += 1
+        return sql(*args, **kwargs)
+
+    db.sql = counted_sql
+
+    def restore():
+        db.sql = sql
+
+    return restore
+
+
+def bucket_label(ms):
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return str(bound)
+    return "inf"
+
+
+def observe(name, ms):
+    """Add one observation to the pending histogram `name`"""
+    bucket = f"{name}|le_{bucket_label(ms)}"
+    _pending[bucket] = _pending.get(bucket, 0) + 1
+    _pending[f"{name}|count"] = _pending.get(f"{name}|count", 0) + 1
+    _pending[f"{name}|sum_ms"] = _pending.get(f"{name}|sum_ms", 0) + ms
+
+
+def record_call(operation, seconds, profile=None):
+    """Record a call's latency (and stage breakdown when profiled), flushing when due"""
+    global _pending_calls
+
+    observe(f"{operation}|total", seconds * 1000)
+    if profile:
+        for name, stage_seconds in profile.timings.items():
+            observe(f"{operation}|{name}", stage_seconds * 1000)
+        observe(f"{operation}|queries", profile.queries)
+
+    _pending_calls += 1
+    if _pending_calls >= METRICS_FLUSH_CALLS or time.monotonic() - _last_flush >= METRICS_FLUSH_INTERVAL:
+        flush_metrics()
+
+
+def flush_metrics():
+    """Add this worker's pending counters to the shared Redis histograms"""
+    global _pending, _pending_calls, _last_flush
+
+    pending, _pending, _pending_calls = _pending, {}, 0
+    _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_KEY)
+        pipeline = cache.pipeline()
+        for field, value in pending.items():
+            if isinstance(value, int):
+                pipeline.hincrby(key, field, value)
+            else:
+                pipeline.hincrbyfloat(key, field, value)
+        pipeline.execute()
+    except Exception:
+        # Metrics must never fail a quote
+        frappe.log_error(title="Rate metrics flush failed")
+
+
+def get_rate_metrics():
+    """
+    Latency histograms of all workers.
+
+    Returns:
+        dict: {operation: {series: {count, sum_ms, avg_ms, p50_ms, p95_ms,
+            buckets}}}; series are "total", the stages, and "queries"
+            (queries per profiled call). Percentiles are bucket upper bounds.
+    """
+    flush_metrics()
+
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.hgetall(cache.make_key(METRICS_KEY))
+    raw = pipeline.execute()[0] or {}
+
+    metrics = {}
+    for field, value in raw.items():
+        field = frappe.safe_decode(field)
+        operation, series, stat = field.split("|")
+        entry = metrics.setdefault(operation, {}).setdefault(series, {"count": 0, "sum_ms": 0, "buckets": {}})
+        if stat.startswith("le_"):
+            entry["buckets"][stat[3:]] = int(value)
+        elif stat == "count":
+            entry["count"] = int(value)
+        else:
+            entry["sum_ms"] = flt(frappe.safe_decode(value))
+
+    for series in (s for operation in metrics.values() for s in operation.values()):
+        series["avg_ms"] = series["sum_ms"] / series["count"] if series["count"] else None
+        series["p50_ms"] = histogram_quantile(series["buckets"], series["count"], 0.5)
+        series["p95_ms"] = histogram_quantile(series["buckets"], series["count"], 0.95)
+
+    return metrics
+
+
+def histogram_quantile(buckets, count, quantile):
+    """
+    Upper bound of the bucket holding the `quantile` observation; None when
+    there are no observations or it falls above the largest bucket.
+    """
+    if not count:
+        return None
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += buckets.get(str(bound), 0)
+        if seen >= quantile * count:
+            return bound
+    return None
+
+
+def reset_rate_metrics():
+    """Clear the shared histograms"""
+    global _pending, _pending_calls
+    _pending, _pending_calls = {}, 0
+    frappe.cache().delete_value(METRICS_KEY)
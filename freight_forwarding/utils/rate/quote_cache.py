@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Quote Cache
+
+In-process LRU cache of `find_rates` results with a TTL, keyed by
+(lane, mode, date, cargo spec, pricing context).
+
+Entries are stamped with what they were computed from: the generation of
+the lane in the rate index, the pricing rules of the mode, and the FX/fuel
+data version. An entry is served only while all three are unchanged, so
+saving, cancelling or expiring an FF Rate Contract invalidates just the
+lanes it serves, and an FF Pricing Rule change invalidates just its modes.
+"""
+
+import time
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_MAX_SIZE = 2048
+DEFAULT_TTL = 600
+
+_quote_cache = None
+
+
+class QuoteCache:
+    """LRU cache with TTL and hit/miss counters"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, stamp):
+        """
+        Return cached options for `key` if still valid for `stamp`, else None.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, entry_stamp, options = entry
+        if expires_at < time.monotonic() or entry_stamp != stamp:
+            del self.entries[key]
+            self.stale += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [dict(o) for o in options]
+
+    def set(self, key, stamp, options):
+        """Store options for `key`, evicting the least recently used entry if full"""
+        self.entries[key] = (time.monotonic() + self.ttl, stamp, [dict(o) for o in options])
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        self.entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else None,
+        }
+
+
+def get_quote_cache():
+    """Get this worker's quote cache, sized from site config"""
+    global _quote_cache
+    if _quote_cache is None:
+        _quote_cache = QuoteCache(
+            max_size=cint(frappe.conf.get("ff_quote_cache_size")) or DEFAULT_MAX_SIZE,
+            ttl=cint(frappe.conf.get("ff_quote_cache_ttl")) or DEFAULT_TTL,
+        )
+    return _quote_cache
+
+
+def make_quote_key(lane_type, origin, destination, mode, date_filter, weight, cbm, container_type,
+                   division, customer, commodity):
+    """Cache key of one quote"""
+    return (
+        mode, lane_type, origin, destination, date_filter,
+        weight, cbm, container_type or None,
+        division or None, customer or None, (commodity or "").strip().lower() or None,
+    )
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Cube
+
+Materialized, pre-priced view of every Active FF Rate Contract: one
+FF Rate Cube row per (contract lane, container type / weight break,
+validity window) with the base rate and surcharge totals of its contract
+already compiled.
+
+A background job rebuilds the cube (hourly, while it is stale; after
+migrate and on request, always) and records the rate index version it
+was built from. While no contract changed since (the version still
+matches), `find_rates` reads a lane with one indexed query instead of
+loading and pricing contracts; otherwise it falls back to the live index.
+
+Saving a contract rewrites its cube rows in the same transaction and, once
+committed, changes the generation of each lane it rewrote, so quotes served
+from the cube are invalidated per lane like quotes from the live index.
+"""
+
+from functools import partial
+
+import frappe
+from frappe.utils import flt, now_datetime
+
+from freight_forwarding.utils.rate.rate_index import get_shared_version, load_contracts
+from freight_forwarding.utils.rate.surcharges import get_surcharge_vector
+
+# Redis key holding the rate index version the cube was built from
+CUBE_STATE_KEY = "ff_rate_cube_state"
+
+# Redis hash of a generation per cube lane, changed whenever a contract save rewrites the lane
+CUBE_LANE_KEY = "ff_rate_cube_lane_generation"
+
+# Lane key fields of a cube row
+LANE_KEY_FIELDS = ["mode", "lane_type", "origin", "destination"]
+
+# Rows per bulk insert
+INSERT_CHUNK_SIZE = 1000
+
+CUBE_FIELDS = [
+    "name", "rate_contract", "vendor", "carrier", "currency", "validity_from", "validity_to",
+    "mode", "lane_type", "origin", "destination", "rate_lane", "transit", "chargeable_rule",
+    "container_type", "weight_break_from", "weight_break_to", "base_rate", "base_idx",
+    "surcharge_flat", "surcharge_per_kg", "surcharge_per_cntr", "surcharge_percent",
+    "creation", "modified", "owner", "modified_by",
+]
+
+
+def flatten_contract(contract, timestamp=None):
+    """
+    Cube rows of one compiled contract.
+
+    Args:
+        contract: CompiledContract
+        timestamp: creation/modified of the rows (default: now)
+
+    Returns:
+        list: Value tuples in CUBE_FIELDS order
+    """
+    timestamp = timestamp or now_datetime()
+    totals = get_surcharge_vector(contract).totals
+    bases_by_lane = {}
+    for idx, rate_base in enumerate(contract.rate_bases):
+        bases_by_lane.setdefault(rate_base.rate_lane, []).append((idx, rate_base))
+
+    rows = []
+    for (mode, lane_type, origin, destination), lane in contract.lane_keys():
+        per_km = lane.get("basis") == "per_km"
+        for idx, rate_base in bases_by_lane.get(lane.name, []):
+            base_rate = flt(rate_base.base_rate)
+            if per_km:
+                base_rate = base_rate * flt(lane.get("distance"))
+            rows.append((
+                frappe.generate_hash(length=10), contract.name, contract.vendor, contract.carrier,
+                contract.currency, contract.validity_from, contract.validity_to,
+                mode, lane_type, origin, destination, lane.name, lane.transit, lane.get("chargeable_rule"),
+                rate_base.container_type or "", flt(rate_base.weight_break_from),
+                flt(rate_base.weight_break_to), base_rate, idx,
+                totals["flat"], totals["per_kg"], totals["per_cntr"], totals["percent"],
+                timestamp, timestamp, "Administrator", "Administrator",
+            ))
+    return rows
+
+
+def build_rate_cube():
+    """
+    Rebuild the rate cube from all Active FF Rate Contracts.
+
+    Enqueued by the scheduler. The cube is marked fresh only if no contract
+    changed while it was being built.
+    """
+    index_version = get_shared_version()
+
+    contract_names = frappe.get_all(
+        "FF Rate Contract", filters={"status": "Active"}, pluck="name"
+    )
+
+    frappe.db.delete("FF Rate Cube")
+
+    timestamp = now_datetime()
+    rows = []
+    for contract in load_contracts(contract_names):
+        rows.extend(flatten_contract(contract, timestamp))
+        if len(rows) >= INSERT_CHUNK_SIZE:
+            frappe.db.bulk_insert("FF Rate Cube", CUBE_FIELDS, rows)
+            rows = []
+    if rows:
+        frappe.db.bulk_insert("FF Rate Cube", CUBE_FIELDS, rows)
+
+    frappe.db.commit()
+
+    if get_shared_version() == index_version:
+        frappe.cache().delete_value(CUBE_LANE_KEY)
+        frappe.cache().set_value(CUBE_STATE_KEY, {
+            "index_version": index_version,
+            "built_at": str(timestamp),
+            "contracts": len(contract_names),
+        })
+    else:
+        frappe.cache().delete_value(CUBE_STATE_KEY)
+
+
+def update_cube_contract(contract_name, contract=None, delta=None):
+    """
+    Bring the cube rows of one contract up to date inside the saving transaction.
+
+    The generations of the lanes rewritten change once it is committed.
+
+    Args:
+        contract_name: FF Rate Contract name
+        contract: CompiledContract, or None when it was deleted or is no
+            longer Active
+        delta: Version delta (optional); only its changed lane keys are
+            rewritten, all rows of the contract otherwise
+    """
+    changed_keys = None
+    if contract and delta and delta.get("previous_modified"):
+        changed_keys = {tuple(key) for key in delta.get("changed_keys") or []}
+
+    key_slice = slice(CUBE_FIELDS.index("mode"), CUBE_FIELDS.index("destination") + 1)
+
+    if changed_keys is None:
+        changed_keys = set(frappe.get_all(
+            "FF Rate Cube",
+            filters={"rate_contract": contract_name},
+            fields=LANE_KEY_FIELDS,
+            distinct=True,
+            as_list=True,
+        ))
+        frappe.db.delete("FF Rate Cube", {"rate_contract": contract_name})
+        rows = flatten_contract(contract) if contract else []
+        changed_keys.update(tuple(row[key_slice]) for row in rows)
+    else:
+        for mode, lane_type, origin, destination in changed_keys:
+            frappe.db.delete("FF Rate Cube", {
+                "rate_contract": contract_name,
+                "mode": mode,
+                "lane_type": lane_type,
+                "origin": origin,
+                "destination": destination,
+            })
+        rows = [row for row in flatten_contract(contract) if tuple(row[key_slice]) in changed_keys]
+
+    if rows:
+        frappe.db.bulk_insert("FF Rate Cube", CUBE_FIELDS, rows, chunk_size=INSERT_CHUNK_SIZE)
+
+    if changed_keys:
+        frappe.db.after_commit.add(partial(bump_cube_lanes, changed_keys))
+
+
+def bump_cube_lanes(lane_keys):
+    """After commit: invalidate quotes served from the cube on these lanes"""
+    cache = frappe.cache()
+    for key in lane_keys:
+        cache.hset(CUBE_LANE_KEY, "|".join(key), frappe.generate_hash(length=8))
+
+
+def cube_lane_generation(mode, lane_type, origin, destination):
+    """
+    Generation of a lane in the cube, changing whenever the cube is rebuilt
+    or a contract save rewrites the lane.
+
+    Returns:
+        tuple: (cube build time, lane generation)
+    """
+    state = frappe.cache().get_value(CUBE_STATE_KEY) or {}
+    lane = frappe.cache().hget(CUBE_LANE_KEY, "|".join((mode, lane_type, origin, destination)))
+    return state.get("built_at"), lane
+
+
+def carry_cube_version(previous_version, new_version):
+    """
+    Keep the cube current across an index version bump.
+
+    Only valid when the change behind the bump was also applied to the cube
+    (see `update_cube_contract`).
+    """
+    state = frappe.cache().get_value(CUBE_STATE_KEY)
+    if state and state.get("index_version") == previous_version:
+        state["index_version"] = new_version
+        frappe.cache().set_value(CUBE_STATE_KEY, state)
+
+
+def enqueue_rate_cube_build(force=False):
+    """
+    Rebuild the rate cube in the background.
+
+    The hourly scheduler skips the rebuild while the cube is fresh: contract
+    saves keep it current (see `update_cube_contract`), and a rebuild would
+    invalidate every quote served from it. after_migrate and the manual
+    rebuild force it.
+
+    Args:
+        force: Rebuild even when the cube is fresh
+    """
+    if not force and get_fresh_cube_version():
+        return
+
+    frappe.enqueue(
+        "freight_forwarding.utils.rate.rate_cube.build_rate_cube",
+        queue="long",
+        job_id="ff_rate_cube_build",
+        deduplicate=True,
+    )
+
+
+def get_fresh_cube_version():
+    """Index version of the rate cube if it is fresh, else None"""
+    state = frappe.cache().get_value(CUBE_STATE_KEY)
+    if state and state.get("index_version") == get_shared_version():
+        return state["index_version"]
+    return None
+
+
+def get_rate_cube_state():
+    """Build state of the rate cube, with whether it is still fresh"""
+    state = frappe.cache().get_value(CUBE_STATE_KEY) or {}
+    state["fresh"] = bool(state) and state.get("index_version") == get_shared_version()
+    return state
+
+
+def query_rate_cube(mode, lane_type, origin, destination, date_filter, container_type=None):
+    """
+    Cube rows serving a lane on a date, with one indexed query.
+
+    Args:
+        mode, lane_type, origin, destination: Lane key
+        date_filter: Quote date
+        container_type: Container type (optional); rows without container
+            type are always included
+
+    Returns:
+        list: FF Rate Cube rows in contract base row order
+    """
+    return frappe.db.sql("""
+        SELECT rate_contract, vendor, carrier, currency, lane_type, rate_lane, transit,
+            chargeable_rule, container_type, weight_break_from, weight_break_to, base_rate,
+            surcharge_flat, surcharge_per_kg, surcharge_per_cntr, surcharge_percent
+        FROM `tabFF Rate Cube`
+        WHERE mode = %(mode)s
+            AND lane_type = %(lane_type)s
+            AND origin = %(origin)s
+            AND destination = %(destination)s
+            AND (validity_from IS NULL OR validity_from <= %(date)s)
+            AND (validity_to IS NULL OR validity_to >= %(date)s)
+            AND container_type IN %(container_types)s
+        ORDER BY rate_contract, base_idx
+    """, {
+        "mode": mode,
+        "lane_type": lane_type,
+        "origin": origin,
+        "destination": destination,
+        "date": date_filter,
+        "container_types": ("", container_type) if container_type else ("",),
+    }, as_dict=True)
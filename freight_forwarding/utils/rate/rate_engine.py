@@ -8,12 +8,33 @@ Apply pricing rule → sell
 Return ranked options (cost, transit, carrier)
 """
 
+import base64
+import heapq
+import json
+import time
+from datetime import date
+from operator import itemgetter
+
 import frappe
+import numpy as np
 from frappe import _
-from datetime import date
+from frappe.utils import add_days, cint, flt, getdate
 
+from freight_forwarding.utils.chargeable_weight import lane_chargeable_weight
+from freight_forwarding.utils.rate.adjustments import get_adjustment_store, get_company_currency
+from freight_forwarding.utils.rate.base_rates import BaseRateTable, get_base_rate_table
+from freight_forwarding.utils.rate.freetime import calculate_dd_cost
+from freight_forwarding.utils.rate.pricing_rules import get_pricing_rule_matcher
+from freight_forwarding.utils.rate.profiling import get_active_profile, profile_stage, rate_profile
+from freight_forwarding.utils.rate.quote_cache import get_quote_cache, make_quote_key
+from freight_forwarding.utils.rate.rate_cube import cube_lane_generation, get_fresh_cube_version, query_rate_cube
+from freight_forwarding.utils.rate.rate_index import get_rate_index
+from freight_forwarding.utils.rate.surcharges import get_surcharge_vector
 
-def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None, container_type=None):
+
+def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None, container_type=None,
+               division=None, customer=None, commodity=None, limit=None, dwell_days=None, detention_days=None,
+               containers=None):
     """
     Find rates for a given lane.
     
@@ -26,65 +47,504 @@ def find_rates(lane_type, origin, destination, mode, date_filter=None, weight=No
         weight: Weight in kg (optional)
         cbm: Volume in CBM (optional)
         container_type: Container type for Sea (optional)
+        division: Division for pricing rule matching (optional)
+        customer: Customer for pricing rule matching (optional)
+        commodity: Commodity for pricing rule matching (optional)
+        limit: Return only the best `limit` options (optional)
+        dwell_days: Projected days at the destination port; when set, options
+            include expected D&D and are ranked by landed cost, contracts
+            without free-time terms for the port last (optional)
+        detention_days: Projected days out of the terminal (optional)
+        containers: Number of containers for D&D (default: 1)
     
     Returns:
         list: Ranked rate options with buy/sell prices
     """
-    if not date_filter:
-        date_filter = date.today()
-    
-    # Find active rate contracts
-    rate_contracts = frappe.get_all(
-        "FF Rate Contract",
-        filters={
-            "status": "Active",
-            "mode": ["like", f"%{mode}%"],
-            "validity_from": ["<=", date_filter],
-            "validity_to": [">=", date_filter],
-        },
-        fields=["name", "vendor", "carrier", "currency", "mode"]
-    )
+    with rate_profile("find_rates"):
+        return get_rate_snapshot().find_rates(
+            lane_type, origin, destination, mode, date_filter=date_filter,
+            weight=weight, cbm=cbm, container_type=container_type,
+            division=division, customer=customer, commodity=commodity, limit=limit,
+            dwell_days=dwell_days, detention_days=detention_days, containers=containers
+        )
+
+
+def find_rates_page(lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None,
+                    container_type=None, division=None, customer=None, commodity=None, page_length=20, cursor=None):
+    """
+    One page of the full ranked option list.
+    
+    Args:
+        lane_type, origin, destination, mode, date_filter, weight, cbm,
+        container_type, division, customer, commodity: See `find_rates`
+        page_length: Options per page
+        cursor: `next_cursor` of the previous page (None for the first page)
+    
+    Returns:
+        dict: {"options": list, "next_cursor": str or None}
+    """
+    page_length = cint(page_length) or 20
+    
+    # Fetch one extra option to know whether another page exists
+    with rate_profile("find_rates_page"):
+        options = get_rate_snapshot().find_rates(
+            lane_type, origin, destination, mode, date_filter=date_filter,
+            weight=weight, cbm=cbm, container_type=container_type,
+            division=division, customer=customer, commodity=commodity,
+            limit=page_length + 1, cursor=cursor
+        )
+    
+    has_more = len(options) > page_length
+    options = options[:page_length]
+    
+    return {
+        "options": options,
+        "next_cursor": options[-1]["cursor"] if has_more else None,
+    }
+
+
+def find_rates_batch(requests, date_filter=None, division=None, customer=None, commodity=None):
+    """
+    Find rates for many lanes/shipments against one contract snapshot.
+    
+    Args:
+        requests: list of dicts with lane_type, origin, destination, mode and
+            optional key, date_filter, weight, cbm, container_type, division,
+            customer, commodity, limit, dwell_days, detention_days, containers.
+            Missing values fall back to the batch-level arguments.
+        date_filter: Default date for all requests (default: today)
+        division: Default division for pricing rule matching
+        customer: Default customer for pricing rule matching
+        commodity: Default commodity for pricing rule matching
+    
+    Returns:
+        dict: {"results": {key: options}, "errors": {key: message}}
+    """
+    with rate_profile("find_rates_batch") as profile:
+        if profile:
+            profile.count("requests", len(requests))
+        return _find_rates_batch(requests, date_filter, division, customer, commodity)
+
+
+def _find_rates_batch(requests, date_filter, division, customer, commodity):
+    snapshot = get_rate_snapshot()
+    results = {}
+    errors = {}
+    
+    request_dates = [getdate(r.get("date_filter") or date_filter) for r in requests]
+    if request_dates:
+        snapshot.preload(min(request_dates), max(request_dates))
+    
+    for idx, request in enumerate(requests):
+        request = frappe._dict(request)
+        key = str(request.key) if request.key is not None else str(idx)
+        
+        missing = [f for f in ("lane_type", "origin", "destination", "mode") if not request.get(f)]
+        if missing:
+            errors[key] = _("Missing {0}").format(", ".join(missing))
+            continue
+        
+        results[key] = snapshot.find_rates(
+            request.lane_type, request.origin, request.destination, request.mode,
+            date_filter=request.date_filter or date_filter,
+            weight=request.weight,
+            cbm=request.cbm,
+            container_type=request.container_type,
+            division=request.division or division,
+            customer=request.customer or customer,
+            commodity=request.commodity or commodity,
+            limit=request.limit,
+            dwell_days=request.dwell_days,
+            detention_days=request.detention_days,
+            containers=request.containers,
+        )
+    
+    return {"results": results, "errors": errors}
+
+
+def get_rate_timeline(lane_type, origin, destination, mode, from_date, to_date, weight=None, cbm=None,
+                      container_type=None, division=None, customer=None, commodity=None):
+    """
+    Historical rate timeline for a lane.
+    
+    Instead of quoting every day in the range, the lane is quoted once per
+    period between validity changes of its contracts and of pricing rules,
+    and fuel index adjustments taking effect. Exchange rates move daily:
+    each period is converted to the company currency at the rate of its
+    first day.
     
-    if not rate_contracts:
-        return []
+    Args:
+        lane_type, origin, destination, mode: Lane (see `find_rates`)
+        from_date: First date of the range
+        to_date: Last date of the range
+        weight, cbm, container_type: Cargo spec (optional)
+        division, customer, commodity: Pricing rule context (optional)
+    
+    Returns:
+        list: Periods as {from_date, to_date, best, options}
+    """
+    from_date = getdate(from_date)
+    to_date = getdate(to_date)
+    
+    if from_date > to_date:
+        frappe.throw(_("From Date must be on or before To Date."))
+    
+    with rate_profile("get_rate_timeline"):
+        return _get_rate_timeline(
+            lane_type, origin, destination, mode, from_date, to_date, weight, cbm,
+            container_type, division, customer, commodity
+        )
+
+
+def _get_rate_timeline(lane_type, origin, destination, mode, from_date, to_date, weight, cbm,
+                       container_type, division, customer, commodity):
+    snapshot = get_rate_snapshot()
+    snapshot.preload(from_date, to_date)
+    
+    changes = set(snapshot.rate_index.validity_changes(mode, lane_type, origin, destination, from_date, to_date))
+    changes.update(snapshot.pricing_rule_matcher.validity_changes(from_date, to_date))
+    if snapshot.adjustments:
+        changes.update(snapshot.adjustments.fuel_index_changes(lane_type, from_date, to_date))
+    changes.discard(from_date)
+    period_starts = [from_date] + sorted(changes)
     
-    options = []
+    timeline = []
     
-    for contract in rate_contracts:
-        contract_doc = frappe.get_doc("FF Rate Contract", contract.name)
+    for idx, period_start in enumerate(period_starts):
+        if idx + 1 < len(period_starts):
+            period_end = add_days(period_starts[idx + 1], -1)
+        else:
+            period_end = to_date
         
-        # Find matching lanes
-        matching_lanes = find_matching_lanes(
-            contract_doc, lane_type, origin, destination, mode
+        options = snapshot.find_rates(
+            lane_type, origin, destination, mode, date_filter=period_start,
+            weight=weight, cbm=cbm, container_type=container_type,
+            division=division, customer=customer, commodity=commodity
         )
         
-        for lane in matching_lanes:
+        timeline.append({
+            "from_date": period_start,
+            "to_date": period_end,
+            "best": options[0] if options else None,
+            "options": options,
+        })
+    
+    return timeline
+
+
+def get_rate_snapshot():
+    """Get the current rate index, pricing rules and FX/fuel data as one snapshot"""
+    with profile_stage(get_active_profile(), "snapshot"):
+        return RateSnapshot(
+            None, get_pricing_rule_matcher(), get_adjustment_store(), get_company_currency()
+        )
+
+
+class RateSnapshot:
+    """Rate index, pricing rules and adjustments shared by every lookup of one call"""
+
+    def __init__(self, rate_index, pricing_rule_matcher, adjustments=None, company_currency=None):
+        self._rate_index = rate_index
+        self.pricing_rule_matcher = pricing_rule_matcher
+        self.adjustments = adjustments
+        self.company_currency = company_currency
+
+    @property
+    def rate_index(self):
+        """Compiled rate index, synced on first use (quotes served from the rate cube skip it)"""
+        if self._rate_index is None:
+            with profile_stage(get_active_profile(), "rate_index"):
+                self._rate_index = get_rate_index()
+        return self._rate_index
+
+    def preload(self, from_date, to_date):
+        """Preload exchange rates of all indexed contract currencies for a date range"""
+        if not self.adjustments or not self.company_currency:
+            return
+        currencies = {c.currency for c in self.rate_index.contracts.values()}
+        self.adjustments.preload_fx(from_date, to_date, currencies, self.company_currency)
+
+    def to_company_currency(self, currency, date_filter):
+        """Exchange rate from a contract currency to the company currency"""
+        if not self.adjustments or not self.company_currency:
+            return 1.0
+        return self.adjustments.get_exchange_rate(currency, self.company_currency, date_filter)
+
+    def quote_stamp(self, lane_type, origin, destination, mode, cube_version=None):
+        """What a quote for this lane was computed from, for quote cache validation"""
+        return (
+            ("cube", cube_lane_generation(mode, lane_type, origin, destination)) if cube_version
+            else self.rate_index.lane_generation(mode, lane_type, origin, destination),
+            self.pricing_rule_matcher.mode_fingerprints.get(mode),
+            self.adjustments.version if self.adjustments else None,
+            self.company_currency,
+        )
+
+    def find_rates(self, lane_type, origin, destination, mode, date_filter=None, weight=None, cbm=None,
+                   container_type=None, division=None, customer=None, commodity=None, limit=None, cursor=None,
+                   dwell_days=None, detention_days=None, containers=None):
+        """Find ranked rate options for one lane (see `find_rates`), through the quote cache"""
+        date_filter = getdate(date_filter) if date_filter else date.today()
+        weight = flt(weight) if weight else None
+        cbm = flt(cbm) if cbm else None
+        limit = cint(limit) or None
+        dwell = make_dwell(dwell_days, detention_days, containers)
+        
+        # Pre-priced rate cube while it is fresh; it holds no free-time terms
+        cube_version = None if dwell else get_fresh_cube_version()
+
+        quote_cache = get_quote_cache()
+        key = make_quote_key(
+            lane_type, origin, destination, mode, date_filter, weight, cbm, container_type,
+            division, customer, commodity
+        ) + (limit, cursor, dwell)
+        stamp = self.quote_stamp(lane_type, origin, destination, mode, cube_version=cube_version)
+
+        profile = get_active_profile()
+        with profile_stage(profile, "quote_cache"):
+            options = quote_cache.get(key, stamp)
+        if profile:
+            profile.count("cache_misses" if options is None else "cache_hits")
+
+        if options is None:
+            options = self.compute_rates(
+                lane_type, origin, destination, mode, date_filter, weight, cbm, container_type,
+                division, customer, commodity, limit=limit, cursor=cursor, dwell=dwell,
+                use_cube=bool(cube_version)
+            )
+            quote_cache.set(key, stamp, options)
+
+        if profile:
+            profile.count("options", len(options))
+        return options
+
+    def compute_rates(self, lane_type, origin, destination, mode, date_filter, weight, cbm, container_type,
+                      division, customer, commodity, limit=None, cursor=None, dwell=None, use_cube=False):
+        """
+        Compute ranked rate options for one lane, bypassing the quote cache.
+
+        Candidates are generated lazily and only the best `limit` are kept
+        (bounded heap); pricing rules are applied to those only.
+        """
+        if use_cube:
+            candidates = self.iter_cube_candidates(
+                lane_type, origin, destination, mode, date_filter, weight, cbm, container_type
+            )
+        else:
+            candidates = self.iter_candidates(
+                lane_type, origin, destination, mode, date_filter, weight, cbm, container_type, dwell=dwell
+            )
+
+        if cursor:
+            after = decode_rank_cursor(cursor)
+            candidates = (c for c in candidates if c[0] > after)
+
+        if limit:
+            ranked = heapq.nsmallest(limit, candidates, key=itemgetter(0))
+        else:
+            ranked = sorted(candidates, key=itemgetter(0))
+
+        with profile_stage(get_active_profile(), "pricing_rules"):
+            return [
+                self.build_option(
+                    candidate, mode, date_filter, division=division, customer=customer, commodity=commodity
+                )
+                for candidate in ranked
+            ]
+
+    def iter_candidates(self, lane_type, origin, destination, mode, date_filter, weight, cbm, container_type,
+                        dwell=None):
+        """
+        Yield (rank_key, contract, lane, buy_rate, exchange_rate, dd_cost) for every priced lane.
+
+        rank_key is (dd_unknown, landed cost in company currency, transit,
+        contract, lane), a total order usable as a pagination cursor. Landed
+        cost is the buy rate plus, when `dwell` (see `make_dwell`) is given,
+        the expected D&D (`dd_cost`, in company currency; None without
+        `dwell`). A contract without free-time terms for the port has an
+        unknown D&D: dd_unknown is 1 and it ranks after every lane whose
+        landed cost is known, by buy rate.
+        """
+        profile = get_active_profile()
+        
+        # Look up serving lanes in the compiled rate index
+        with profile_stage(profile, "lane_match"):
+            lanes = self.rate_index.lookup(mode, lane_type, origin, destination, date_filter)
+        if profile:
+            profile.count("lanes", len(lanes))
+        
+        for contract, lane in lanes:
             # Calculate buy rate
-            buy_rate = calculate_buy_rate(contract_doc, lane, weight, cbm, container_type)
+            buy_rate = calculate_buy_rate(
+                contract, lane, weight, cbm, container_type,
+                date_filter=date_filter, adjustments=self.adjustments, profile=profile
+            )
             
-            if buy_rate:
-                # Apply pricing rules to get sell rate
-                sell_rate = apply_pricing_rules(
-                    buy_rate, contract_doc, lane, mode
-                )
-                
-                options.append({
-                    "rate_contract": contract.name,
-                    "vendor": contract.vendor,
-                    "carrier": contract.carrier or contract.vendor,
-                    "lane": lane.name if hasattr(lane, 'name') else None,
-                    "transit_days": lane.transit if hasattr(lane, 'transit') else None,
-                    "buy_rate": buy_rate,
-                    "sell_rate": sell_rate,
-                    "currency": contract.currency,
-                    "margin": sell_rate - buy_rate if sell_rate and buy_rate else None,
-                    "margin_percent": ((sell_rate - buy_rate) / buy_rate * 100) if sell_rate and buy_rate and buy_rate > 0 else None,
-                })
-    
-    # Rank options by cost (buy_rate), then by transit
-    options.sort(key=lambda x: (x.get("buy_rate") or float('inf'), x.get("transit_days") or float('inf')))
-    
-    return options
+            if not buy_rate:
+                continue
+            
+            exchange_rate = self.to_company_currency(contract.currency, date_filter)
+            landed_cost = buy_rate * exchange_rate if exchange_rate else float('inf')
+            
+            # Expected demurrage/detention/storage at the destination port
+            dd_cost = None
+            dd_unknown = 0
+            if dwell:
+                dd_cost, dd_currency = calculate_dd_cost(contract, lane, *dwell)
+                if dd_cost is None:
+                    dd_unknown = 1
+                elif dd_cost:
+                    dd_exchange_rate = self.to_company_currency(dd_currency, date_filter)
+                    dd_cost = dd_cost * dd_exchange_rate if dd_exchange_rate else float('inf')
+                landed_cost += dd_cost or 0
+            
+            rank_key = (
+                dd_unknown,
+                landed_cost,
+                lane.transit or float('inf'),
+                contract.name,
+                lane.name or "",
+            )
+            yield rank_key, contract, lane, buy_rate, exchange_rate, dd_cost
+
+    def iter_cube_candidates(self, lane_type, origin, destination, mode, date_filter, weight, cbm,
+                             container_type):
+        """
+        Same as `iter_candidates`, priced from the rate cube with one query.
+
+        Base rates and surcharge totals come precompiled per contract lane;
+        only the weight break, chargeable weight, fuel index and FX depend
+        on the quote.
+        """
+        profile = get_active_profile()
+        with profile_stage(profile, "lane_match"):
+            rows = query_rate_cube(mode, lane_type, origin, destination, date_filter, container_type)
+        
+        lanes = {}
+        for row in rows:
+            lanes.setdefault((row.rate_contract, row.rate_lane), []).append(row)
+        
+        if profile:
+            profile.count("lanes", len(lanes))
+        
+        for rows in lanes.values():
+            head = rows[0]
+            contract = frappe._dict(
+                name=head.rate_contract, vendor=head.vendor, carrier=head.carrier, currency=head.currency
+            )
+            lane = frappe._dict(
+                name=head.rate_lane, lane_type=head.lane_type, transit=head.transit,
+                chargeable_rule=head.chargeable_rule
+            )
+            
+            chargeable = lane_chargeable_weight(lane, weight, cbm)
+            base_rate = BaseRateTable(rows).find(lane.name, weight=chargeable, container_type=container_type)
+            if not base_rate:
+                continue
+            
+            surcharges_total = flt(head.surcharge_flat)
+            if chargeable:
+                surcharges_total += flt(head.surcharge_per_kg) * chargeable
+            if container_type:
+                surcharges_total += flt(head.surcharge_per_cntr)
+            surcharges_total += flt(head.surcharge_percent) * base_rate / 100
+            
+            fuel_adjustment = 0
+            if self.adjustments:
+                fuel_percent = self.adjustments.get_fuel_adjustment_percent(lane.lane_type, date_filter)
+                fuel_adjustment = base_rate * fuel_percent / 100
+            
+            buy_rate = base_rate + surcharges_total + fuel_adjustment
+            
+            exchange_rate = self.to_company_currency(contract.currency, date_filter)
+            rank_key = (
+                0,
+                buy_rate * exchange_rate if exchange_rate else float('inf'),
+                lane.transit or float('inf'),
+                contract.name,
+                lane.name or "",
+            )
+            yield rank_key, contract, lane, buy_rate, exchange_rate, None
+
+    def build_option(self, candidate, mode, date_filter, division=None, customer=None, commodity=None):
+        """Apply pricing rules to a ranked candidate and build the option dict"""
+        rank_key, contract, lane, buy_rate, exchange_rate, dd_cost = candidate
+        
+        # Apply pricing rules to get sell rate
+        sell_rate = apply_pricing_rules(
+            buy_rate, contract, lane, mode, date_filter,
+            division=division, customer=customer, commodity=commodity,
+            matcher=self.pricing_rule_matcher
+        )
+        
+        option = {
+            "rate_contract": contract.name,
+            "vendor": contract.vendor,
+            "carrier": contract.carrier or contract.vendor,
+            "lane": lane.name if hasattr(lane, 'name') else None,
+            "transit_days": lane.transit if hasattr(lane, 'transit') else None,
+            "buy_rate": buy_rate,
+            "sell_rate": sell_rate,
+            "currency": contract.currency,
+            "margin": sell_rate - buy_rate if sell_rate and buy_rate else None,
+            "margin_percent": (
+                ((sell_rate - buy_rate) / buy_rate * 100) if sell_rate and buy_rate and buy_rate > 0 else None
+            ),
+            "company_currency": self.company_currency or contract.currency,
+            "exchange_rate": exchange_rate,
+            "base_buy_rate": buy_rate * exchange_rate if exchange_rate else None,
+            "base_sell_rate": sell_rate * exchange_rate if exchange_rate and sell_rate else None,
+            "cursor": encode_rank_cursor(rank_key),
+        }
+        
+        if rank_key[0]:
+            # No free-time terms for the port: D&D unknown
+            option["dd_cost"] = None
+            option["landed_cost"] = None
+            option["dd_unknown"] = True
+        elif dd_cost is not None:
+            option["dd_cost"] = dd_cost
+            option["landed_cost"] = rank_key[1]
+        
+        return option
+
+
+def make_dwell(dwell_days=None, detention_days=None, containers=None):
+    """
+    Normalized D&D projection (dwell_days, detention_days, containers), or
+    None when no dwell is projected.
+    """
+    if not dwell_days and not detention_days:
+        return None
+    return (flt(dwell_days), flt(detention_days), cint(containers) or 1)
+
+
+def encode_rank_cursor(rank_key):
+    """
+    Opaque pagination cursor for a rank key.
+
+    Unknown costs and transits rank as infinity; they are encoded as null
+    so the cursor stays standard JSON.
+    """
+    values = [None if value == float("inf") else value for value in rank_key]
+    return base64.urlsafe_b64encode(json.dumps(values, allow_nan=False).encode()).decode()
+
+
+def decode_rank_cursor(cursor):
+    """Rank key from a pagination cursor (see `encode_rank_cursor`)"""
+    try:
+        dd_unknown, cost, transit, contract, lane = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(contract, str) or not isinstance(lane, str):
+            raise ValueError(cursor)
+        return (
+            int(dd_unknown),
+            float("inf") if cost is None else float(cost),
+            float("inf") if transit is None else float(transit),
+            contract,
+            lane,
+        )
+    except Exception:
+        frappe.throw(_("Invalid rate cursor."))
 
 
 def find_matching_lanes(contract_doc, lane_type, origin, destination, mode):
@@ -108,91 +568,145 @@ def find_matching_lanes(contract_doc, lane_type, origin, destination, mode):
     return matching_lanes
 
 
-def calculate_buy_rate(contract_doc, lane, weight=None, cbm=None, container_type=None):
+def calculate_buy_rate(contract_doc, lane, weight=None, cbm=None, container_type=None, date_filter=None,
+                       adjustments=None, profile=None):
     """
-    Calculate buy rate = base + surcharges ± fuel index/FX
+    Calculate buy rate = base + surcharges ± fuel index
+    
+    FX is not applied here: the buy rate stays in the contract currency and
+    is normalized to the company currency when options are ranked.
+    
+    Weight breaks and per_kg surcharges use the chargeable weight of the
+    lane (chargeable_rule, volumetric divisor of the mode); per_km lanes
+    multiply the base rate by the lane distance.
     
     Args:
-        contract_doc: FF Rate Contract document
-        lane: FF Rate Lane document
+        contract_doc: FF Rate Contract document or CompiledContract
+        lane: FF Rate Lane row
         weight: Weight in kg
         cbm: Volume in CBM
         container_type: Container type
+        date_filter: Quote date for the fuel index (default: today)
+        adjustments: AdjustmentStore (optional; no fuel adjustment without it)
+        profile: RateProfile timing the base_rate and surcharges stages (optional)
     
     Returns:
         float: Total buy rate
     """
+    started = time.perf_counter() if profile else None
+    
+    chargeable = lane_chargeable_weight(lane, weight, cbm)
+    
     # Get base rate
-    base_rate = get_base_rate(contract_doc, lane, weight, cbm, container_type)
+    base_rate = get_base_rate(contract_doc, lane, chargeable, cbm, container_type)
     
     if not base_rate:
         return None
     
+    if lane.get("basis") == "per_km":
+        base_rate = base_rate * flt(lane.get("distance"))
+        if not base_rate:
+            return None
+    
+    if profile:
+        now = time.perf_counter()
+        profile.add("base_rate", now - started)
+        started = now
+    
     # Get surcharges
-    surcharges_total = calculate_surcharges(contract_doc, lane, weight, cbm, container_type)
+    surcharges_total = calculate_surcharges(contract_doc, lane, chargeable, cbm, container_type, base_rate=base_rate)
+    
+    # Fuel index adjustment on the base rate
+    fuel_adjustment = 0
+    if adjustments:
+        fuel_percent = adjustments.get_fuel_adjustment_percent(lane.lane_type, date_filter)
+        fuel_adjustment = base_rate * fuel_percent / 100
     
-    # TODO: Apply fuel index/FX adjustments
-    # fuel_adjustment = get_fuel_index_adjustment(contract_doc, lane)
-    # fx_adjustment = get_fx_adjustment(contract_doc)
+    total_buy = base_rate + surcharges_total + fuel_adjustment
     
-    total_buy = base_rate + surcharges_total
+    if profile:
+        profile.add("surcharges", time.perf_counter() - started)
     
     return total_buy
 
 
+def calculate_buy_rates(contract_doc, lane, weights=None, cbms=None, container_types=None, dates=None,
+                        adjustments=None):
+    """
+    Vectorized `calculate_buy_rate` for many shipments on one contract lane.
+    
+    Same chargeable weight, per_km distance and fuel index as the scalar
+    calculation, in one NumPy pass per contract lane.
+    
+    Args:
+        contract_doc: FF Rate Contract document or CompiledContract
+        lane: FF Rate Lane row
+        weights: array of weights in kg (NaN or 0 where unknown)
+        cbms: array of volumes in CBM (NaN or 0 where unknown)
+        container_types: array of container types (optional)
+        dates: array of quote dates for the fuel index (required with `adjustments`)
+        adjustments: AdjustmentStore (optional; no fuel adjustment without it)
+    
+    Returns:
+        numpy.ndarray: Buy rates, NaN where the lane does not price the shipment
+    """
+    size = len(next(v for v in (weights, cbms, container_types, dates) if v is not None))
+    chargeable = lane_chargeable_weight(
+        lane,
+        np.full(size, np.nan) if weights is None else weights,
+        np.full(size, np.nan) if cbms is None else cbms,
+    )
+    
+    base_rates = get_base_rate_table(contract_doc).find_many(
+        lane.name, size, weights=chargeable, container_types=container_types
+    )
+    if lane.get("basis") == "per_km":
+        base_rates = base_rates * flt(lane.get("distance"))
+    base_rates[base_rates == 0] = np.nan
+    
+    buy_rates = base_rates + get_surcharge_vector(contract_doc).evaluate(base_rates, chargeable, container_types)
+    
+    if adjustments:
+        fuel_percents = adjustments.get_fuel_adjustment_percents(lane.lane_type, dates)
+        buy_rates += base_rates * fuel_percents / 100
+    
+    return buy_rates
+
+
 def get_base_rate(contract_doc, lane, weight=None, cbm=None, container_type=None):
-    """Get base rate from rate bases"""
-    if not contract_doc.rate_bases:
-        return 0
+    """
+    Get base rate from rate bases.
     
-    # Find matching rate base
-    for rate_base in contract_doc.rate_bases:
-        if rate_base.rate_lane != lane.name:
-            continue
-        
-        # Match by container type (Sea)
-        if container_type and rate_base.container_type:
-            if rate_base.container_type == container_type:
-                return float(rate_base.base_rate or 0)
-        
-        # Match by weight break
-        if weight and rate_base.weight_break_from and rate_base.weight_break_to:
-            if rate_base.weight_break_from <= weight <= rate_base.weight_break_to:
-                return float(rate_base.base_rate or 0)
+    Uses the contract's compiled base rate table (weight breaks sorted per
+    lane and container type, looked up by bisection).
     
-    # If no match, return first base rate or 0
-    if contract_doc.rate_bases:
-        return float(contract_doc.rate_bases[0].base_rate or 0)
+    Returns:
+        float or None: None when no base row matches the lane, container
+            type or weight, instead of falling back to an unrelated row
+    """
+    if not contract_doc.rate_bases:
+        return None
     
-    return 0
+    return get_base_rate_table(contract_doc).find(lane.name, weight=weight, container_type=container_type)
 
 
-def calculate_surcharges(contract_doc, lane, weight=None, cbm=None, container_type=None):
-    """Calculate total surcharges"""
+def calculate_surcharges(contract_doc, lane, weight=None, cbm=None, container_type=None, base_rate=None):
+    """
+    Calculate total surcharges.
+    
+    flat is added once, per_kg per kg of weight, per_cntr when a container
+    type is quoted, and percent as a percentage of `base_rate`.
+    """
     if not contract_doc.rate_surcharges:
         return 0
     
-    total_surcharges = 0
-    
-    for surcharge in contract_doc.rate_surcharges:
-        amount = float(surcharge.amount or 0)
-        calc_type = surcharge.calc_type
-        
-        if calc_type == "flat":
-            total_surcharges += amount
-        elif calc_type == "per_kg" and weight:
-            total_surcharges += amount * weight
-        elif calc_type == "per_cntr" and container_type:
-            total_surcharges += amount
-        elif calc_type == "percent":
-            # Percent of base rate (would need base rate here)
-            # For simplicity, using flat amount
-            total_surcharges += amount
-    
-    return total_surcharges
+    return get_surcharge_vector(contract_doc).total(
+        base_rate=base_rate, weight=weight, container_type=container_type
+    )
 
 
-def apply_pricing_rules(buy_rate, contract_doc, lane, mode):
+def apply_pricing_rules(buy_rate, contract_doc, lane, mode, date_filter=None, division=None, customer=None,
+                        commodity=None, matcher=None):
     """
     Apply pricing rules to calculate sell rate.
     
@@ -201,6 +715,11 @@ def apply_pricing_rules(buy_rate, contract_doc, lane, mode):
         contract_doc: FF Rate Contract document
         lane: FF Rate Lane document
         mode: Mode (Sea/Air/Land)
+        date_filter: Quote date for rule validity (default: today)
+        division: Division of the quote (optional)
+        customer: Customer of the quote (optional)
+        commodity: Commodity of the quote (optional)
+        matcher: PricingRuleMatcher to use (default: this worker's cached one)
     
     Returns:
         float: Sell rate
@@ -208,39 +727,13 @@ def apply_pricing_rules(buy_rate, contract_doc, lane, mode):
     if not buy_rate:
         return None
     
-    # Find applicable pricing rules
-    pricing_rules = frappe.get_all(
-        "FF Pricing Rule",
-        filters={
-            "status": "Active",
-            "mode": ["like", f"%{mode}%"],
-        },
-        fields=["name", "priority", "markup_type", "markup_value", "discount_type", "discount_value"],
-        order_by="priority asc"
+    # Apply first matching pricing rule (by priority)
+    matcher = matcher or get_pricing_rule_matcher()
+    rule = matcher.match(
+        mode, date_filter, division=division, customer=customer, commodity=commodity
     )
     
-    sell_rate = buy_rate
+    if not rule:
+        return buy_rate
     
-    # Apply first matching pricing rule
-    for rule_doc in pricing_rules:
-        rule = frappe.get_doc("FF Pricing Rule", rule_doc.name)
-        
-        # Check if rule matches (division, customer, commodity, validity)
-        # For now, apply first rule found
-        if rule.markup_value:
-            if rule.markup_type == "Percentage":
-                sell_rate = sell_rate * (1 + rule.markup_value / 100)
-            else:
-                sell_rate = sell_rate + rule.markup_value
-        
-        if rule.discount_value:
-            if rule.discount_type == "Percentage":
-                sell_rate = sell_rate * (1 - rule.discount_value / 100)
-            else:
-                sell_rate = sell_rate - rule.discount_value
-        
-        # Apply only first matching rule
-        break
-    
-    return sell_rate
-
+    return rule.apply(buy_rate)
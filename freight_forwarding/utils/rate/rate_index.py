@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled Rate Index
+
+Keeps active FF Rate Contracts in worker memory, flattened into a lookup
+keyed by (mode, lane_type, origin, destination). Each entry holds the lane,
+its contract header (validity, currency, vendor), bases and surcharges, so a
+quote is a dictionary lookup instead of loading whole documents.
+
+Child rows are held as compact `__slots__` records (see records) with only
+the fields the engine reads; the index tracks their approximate memory
+against the site config budget `ff_rate_index_memory_mb`.
+
+The index is rebuilt incrementally: saving or deleting an FF Rate Contract
+bumps a shared version in Redis, and every worker reloads only the contracts
+whose `modified` timestamp changed on its next lookup. When the contract
+version delta is known (see contract_versions), only the lanes it changed
+are invalidated.
+"""
+
+import sys
+from functools import partial
+
+import frappe
+from frappe.utils import cint, get_datetime, getdate
+
+from freight_forwarding.utils.rate.records import (
+    BASE_FIELDS,
+    FREETIME_FIELDS,
+    INDEX_ENTRY_SIZE,
+    LANE_FIELDS,
+    SURCHARGE_FIELDS,
+    BaseRecord,
+    FreetimeRecord,
+    LaneRecord,
+    SurchargeRecord,
+    compact,
+)
+from freight_forwarding.utils.rate.validity_index import ChangePoints
+
+# Redis key holding the shared index version
+INDEX_VERSION_KEY = "ff_rate_index_version"
+
+# Redis hash of the latest version delta per contract
+CONTRACT_DELTA_KEY = "ff_rate_contract_delta"
+
+# Lane fields used as origin/destination per mode
+LANE_ENDPOINTS = {
+    "Sea": ("pol", "pod"),
+    "Air": ("aoo", "aod"),
+    "Land": ("origin", "destination"),
+}
+
+# Max parents per IN (...) clause when loading child rows
+LOAD_CHUNK_SIZE = 500
+
+# Default per-worker memory budget of the index (site config ff_rate_index_memory_mb)
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+_rate_index = None
+
+
+def parse_modes(mode_value):
+    """Split a MultiSelect mode value into a list of modes"""
+    if not mode_value:
+        return []
+    separator = "\n" if "\n" in mode_value else ","
+    return [m.strip() for m in mode_value.split(separator) if m.strip()]
+
+
+class CompiledContract:
+    """
+    FF Rate Contract header and child rows, detached from the ORM.
+
+    Child rows are kept as compact records (see records); `size` is the
+    approximate memory they hold, for the index memory budget.
+    """
+
+    __slots__ = (
+        "name", "vendor", "carrier", "currency", "status", "mode", "modes", "validity_from", "validity_to",
+        "modified", "rate_lanes", "rate_bases", "rate_surcharges", "rate_freetimes", "size",
+        "_base_rate_table", "_surcharge_vector", "_freetime_table",
+    )
+
+    def __init__(self, header, rate_lanes=None, rate_bases=None, rate_surcharges=None, rate_freetimes=None):
+        self.name = header.name
+        self.vendor = header.vendor
+        self.carrier = header.carrier
+        self.currency = header.currency
+        self.status = header.status
+        self.mode = header.mode
+        self.modes = parse_modes(header.mode)
+        self.validity_from = getdate(header.validity_from) if header.validity_from else None
+        self.validity_to = getdate(header.validity_to) if header.validity_to else None
+        self.modified = header.modified
+        self.rate_lanes = compact(LaneRecord, rate_lanes)
+        self.rate_bases = compact(BaseRecord, rate_bases)
+        self.rate_surcharges = compact(SurchargeRecord, rate_surcharges)
+        self.rate_freetimes = compact(FreetimeRecord, rate_freetimes)
+        self._base_rate_table = None
+        self._surcharge_vector = None
+        self._freetime_table = None
+        self.size = self.estimate_size()
+
+    def estimate_size(self):
+        """Approximate bytes held by this contract's rows and its index entries"""
+        size = sys.getsizeof(self)
+        for rows in (self.rate_lanes, self.rate_bases, self.rate_surcharges, self.rate_freetimes):
+            size += sys.getsizeof(rows) + sum(row.sizeof() for row in rows)
+        return size + INDEX_ENTRY_SIZE * len(self.rate_lanes) * len(self.modes)
+
+    def is_valid_on(self, date_filter):
+        """Check validity window (inclusive on both ends)"""
+        if self.validity_from and date_filter < self.validity_from:
+            return False
+        if self.validity_to and date_filter > self.validity_to:
+            return False
+        return True
+
+    def lane_keys(self):
+        """Yield (key, lane) for every mode/lane combination this contract serves"""
+        for mode in self.modes:
+            origin_field, destination_field = LANE_ENDPOINTS.get(mode, (None, None))
+            if not origin_field:
+                continue
+            for lane in self.rate_lanes:
+                origin = lane.get(origin_field)
+                destination = lane.get(destination_field)
+                if not origin or not destination:
+                    continue
+                yield (mode, lane.lane_type, origin, destination), lane
+
+
+class RateIndex:
+    """In-memory lane index over active FF Rate Contracts"""
+
+    def __init__(self):
+        self.contracts = {}
+        self.lanes = {}
+        self.version = None
+        # Bumped per lane key whenever a contract serving it changes
+        self.lane_generations = {}
+        self._generation = 0
+        # Built lazily per lane key, reset whenever a contract serving it changes
+        self._change_points = {}
+        # Approximate bytes held by the indexed contracts
+        self.memory = 0
+        self._over_budget = False
+
+    def add_contract(self, contract):
+        """Add (or replace) a compiled contract"""
+        self.remove_contract(contract.name)
+        self.contracts[contract.name] = contract
+        self.memory += contract.size
+        for key, lane in contract.lane_keys():
+            self.lanes.setdefault(key, []).append((contract, lane))
+            self._lane_changed(key)
+
+    def remove_contract(self, contract_name):
+        """Drop a contract and its lane entries"""
+        contract = self.contracts.pop(contract_name, None)
+        if not contract:
+            return
+        self.memory -= contract.size
+        for key, _lane in contract.lane_keys():
+            self._lane_changed(key)
+            entries = self.lanes.get(key)
+            if not entries:
+                continue
+            entries[:] = [e for e in entries if e[0].name != contract_name]
+            if not entries:
+                del self.lanes[key]
+
+    def replace_contract(self, contract, delta=None):
+        """
+        Replace a contract, invalidating only the lanes its version delta changed.
+
+        Falls back to `add_contract` (every lane invalidated) without a delta,
+        or when the delta does not start from the version held here.
+
+        Args:
+            contract: CompiledContract
+            delta: Version delta with previous_modified, modified and changed_keys
+        """
+        old = self.contracts.get(contract.name)
+        if (
+            not old
+            or not delta
+            or delta.get("previous_modified") != str(get_datetime(old.modified))
+            or delta.get("modified") != str(get_datetime(contract.modified))
+        ):
+            self.add_contract(contract)
+            return
+
+        self.contracts[contract.name] = contract
+        self.memory += contract.size - old.size
+
+        new_entries = {}
+        for key, lane in contract.lane_keys():
+            new_entries.setdefault(key, []).append((contract, lane))
+        old_keys = {key for key, _lane in old.lane_keys()}
+
+        for key in old_keys | set(new_entries):
+            entries = [e for e in self.lanes.get(key, []) if e[0].name != contract.name]
+            entries.extend(new_entries.get(key, []))
+            if entries:
+                self.lanes[key] = entries
+            else:
+                self.lanes.pop(key, None)
+
+        for key in delta.get("changed_keys") or []:
+            self._lane_changed(tuple(key))
+
+    def _lane_changed(self, key):
+        """Invalidate per-lane caches derived from the contracts serving `key`"""
+        self._generation += 1
+        self.lane_generations[key] = self._generation
+        self._change_points.pop(key, None)
+
+    def lane_generation(self, mode, lane_type, origin, destination):
+        """Generation of a lane key; changes whenever a contract serving it changes"""
+        return self.lane_generations.get((mode, lane_type, origin, destination), 0)
+
+    def lookup(self, mode, lane_type, origin, destination, date_filter=None):
+        """
+        Return (contract, lane) pairs serving a lane on a given date.
+
+        Args:
+            mode: "Sea", "Air", or "Land"
+            lane_type: Lane type of the FF Rate Lane row
+            origin: POL / AOO / origin city
+            destination: POD / AOD / destination city
+            date_filter: Date to check validity (default: today)
+
+        Returns:
+            list: (CompiledContract, lane row) tuples
+        """
+        date_filter = getdate(date_filter)
+        return [
+            (contract, lane)
+            for contract, lane in self.lanes.get((mode, lane_type, origin, destination), [])
+            if contract.is_valid_on(date_filter)
+        ]
+
+    def validity_changes(self, mode, lane_type, origin, destination, from_date, to_date):
+        """
+        Return dates in [from_date, to_date] on which the set of contracts
+        valid for a lane changes.
+
+        Returns:
+            list: Sorted dates
+        """
+        key = (mode, lane_type, origin, destination)
+        change_points = self._change_points.get(key)
+        if change_points is None:
+            change_points = ChangePoints(
+                (contract.validity_from, contract.validity_to)
+                for contract, _lane in self.lanes.get(key, [])
+            )
+            self._change_points[key] = change_points
+        return change_points.between(getdate(from_date), getdate(to_date))
+
+    def sync(self):
+        """Reload contracts changed since this worker last synced"""
+        shared_version = get_shared_version()
+        if self.version == shared_version:
+            return
+
+        current = {
+            c.name: c.modified
+            for c in frappe.get_all(
+                "FF Rate Contract",
+                filters={"status": "Active"},
+                fields=["name", "modified"],
+            )
+        }
+
+        for name in list(self.contracts):
+            if name not in current:
+                self.remove_contract(name)
+
+        changed = [
+            name for name, modified in current.items()
+            if name not in self.contracts or self.contracts[name].modified != modified
+        ]
+        deltas = get_contract_deltas(changed)
+        for contract in load_contracts(changed):
+            self.replace_contract(contract, deltas.get(contract.name))
+
+        self.version = shared_version
+
+        if changed:
+            self.check_memory_budget()
+
+    def stats(self):
+        """Size of the index and its memory estimate against the site's budget"""
+        budget_mb = cint(frappe.conf.get("ff_rate_index_memory_mb")) or DEFAULT_MEMORY_BUDGET_MB
+        memory_mb = self.memory / 2**20
+        return {
+            "contracts": len(self.contracts),
+            "lanes": sum(len(c.rate_lanes) for c in self.contracts.values()),
+            "lane_keys": len(self.lanes),
+            "memory_mb": round(memory_mb, 2),
+            "memory_budget_mb": budget_mb,
+            "within_budget": memory_mb <= budget_mb,
+        }
+
+    def check_memory_budget(self):
+        """Log when the index grows past `ff_rate_index_memory_mb` (once per crossing)"""
+        stats = self.stats()
+        over_budget = not stats["within_budget"]
+        if over_budget and not self._over_budget:
+            frappe.log_error(
+                title="Rate index over memory budget",
+                message=frappe.as_json(stats),
+            )
+        self._over_budget = over_budget
+
+
+def load_contracts(contract_names):
+    """
+    Load and compile FF Rate Contracts in bulk.
+
+    One query for headers plus one per child table per chunk, instead of a
+    `frappe.get_doc` per contract.
+
+    Args:
+        contract_names: List of FF Rate Contract names
+
+    Returns:
+        list: CompiledContract objects
+    """
+    compiled = []
+
+    for start in range(0, len(contract_names), LOAD_CHUNK_SIZE):
+        chunk = contract_names[start:start + LOAD_CHUNK_SIZE]
+
+        headers = frappe.get_all(
+            "FF Rate Contract",
+            filters={"name": ["in", chunk]},
+            fields=["name", "vendor", "carrier", "currency", "status", "mode",
+                    "validity_from", "validity_to", "modified"],
+        )
+
+        children = {}
+        for child_doctype, parentfield, fields in (
+            ("FF Rate Lane", "rate_lanes", LANE_FIELDS),
+            ("FF Rate Base", "rate_bases", BASE_FIELDS),
+            ("FF Rate Surcharge", "rate_surcharges", SURCHARGE_FIELDS),
+            ("FF Rate Freetime", "rate_freetimes", FREETIME_FIELDS),
+        ):
+            rows = frappe.get_all(
+                child_doctype,
+                filters={
+                    "parent": ["in", chunk],
+                    "parenttype": "FF Rate Contract",
+                    "parentfield": parentfield,
+                },
+                fields=["parent", *fields],
+                order_by="idx asc",
+            )
+            for row in rows:
+                children.setdefault((row.parent, parentfield), []).append(row)
+
+        for header in headers:
+            compiled.append(CompiledContract(
+                header,
+                rate_lanes=children.get((header.name, "rate_lanes")),
+                rate_bases=children.get((header.name, "rate_bases")),
+                rate_surcharges=children.get((header.name, "rate_surcharges")),
+                rate_freetimes=children.get((header.name, "rate_freetimes")),
+            ))
+
+    return compiled
+
+
+def get_shared_version():
+    """Get the index version shared by all workers"""
+    version = frappe.cache().get_value(INDEX_VERSION_KEY)
+    if not version:
+        version = bump_shared_version()
+    return version
+
+
+def bump_shared_version():
+    """Mark every worker's index as stale"""
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(INDEX_VERSION_KEY, version)
+    return version
+
+
+def get_rate_index():
+    """Get this worker's rate index, synced with the latest contract changes"""
+    global _rate_index
+    if _rate_index is None:
+        _rate_index = RateIndex()
+    _rate_index.sync()
+    return _rate_index
+
+
+def get_contract_deltas(contract_names):
+    """Latest published version deltas of contracts, by name"""
+    if not contract_names:
+        return {}
+    deltas = {}
+    for name in contract_names:
+        delta = frappe.cache().hget(CONTRACT_DELTA_KEY, name)
+        if delta:
+            deltas[name] = delta
+    return deltas
+
+
+def publish_contract_change(contract_name, delta=None):
+    """
+    After commit: share a contract's version delta and bump the index version.
+
+    The rate cube, if it was current and has been updated in the same
+    transaction, stays current.
+    """
+    from freight_forwarding.utils.rate.rate_cube import carry_cube_version
+
+    if delta:
+        frappe.cache().hset(CONTRACT_DELTA_KEY, contract_name, delta)
+    else:
+        frappe.cache().hdel(CONTRACT_DELTA_KEY, contract_name)
+
+    previous_version = get_shared_version()
+    carry_cube_version(previous_version, bump_shared_version())
+
+
+def refresh_contract(contract_name, deleted=False, delta=None):
+    """
+    Reindex a single contract after it changed.
+
+    Called from FF Rate Contract on_update/on_trash. Updates the rate cube
+    in the same transaction; this worker's index is updated and other
+    workers are signalled to resync once the transaction is committed, so a
+    rolled back save never reaches the in-memory index.
+
+    Args:
+        contract_name: FF Rate Contract name
+        deleted: True when the contract is being deleted
+        delta: Version delta from `record_contract_version` (optional); only
+            the lanes it changed are invalidated
+    """
+    from freight_forwarding.utils.rate.rate_cube import get_fresh_cube_version, update_cube_contract
+
+    frappe.db.after_commit.add(partial(publish_contract_change, contract_name, delta))
+
+    cube_fresh = bool(get_fresh_cube_version())
+    if _rate_index is None and not cube_fresh:
+        return
+
+    contract = None
+    if not deleted:
+        contract = next(iter(load_contracts([contract_name])), None)
+        if contract and contract.status != "Active":
+            contract = None
+
+    if cube_fresh:
+        update_cube_contract(contract_name, contract, delta)
+
+    frappe.db.after_commit.add(partial(apply_contract_change, contract_name, contract, delta))
+
+
+def apply_contract_change(contract_name, contract=None, delta=None):
+    """After commit: replace or drop a contract in this worker's index"""
+    if _rate_index is None:
+        return
+
+    if contract:
+        _rate_index.replace_contract(contract, delta)
+    else:
+        _rate_index.remove_contract(contract_name)
+
+
+def expire_rate_contracts():
+    """
+    Mark Active contracts past their validity as Expired (daily scheduler).
+
+    Expired contracts leave the rate index, which also invalidates cached
+    quotes on their lanes.
+    """
+    expired = frappe.get_all(
+        "FF Rate Contract",
+        filters={"status": "Active", "validity_to": ["<", getdate()]},
+        pluck="name",
+    )
+
+    for contract_name in expired:
+        frappe.db.set_value("FF Rate Contract", contract_name, "status", "Expired")
+        refresh_contract(contract_name, deleted=True)
+
+    return expired
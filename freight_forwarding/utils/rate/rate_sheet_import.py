@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Sheet Import
+
+Streams a carrier rate sheet (CSV or XLSX) row by row into one
+FF Rate Contract. Lanes are validated against FF Port / FF Airport in
+memory, and lanes, bases and surcharges are written with bulk inserts in
+chunks instead of through the ORM row by row.
+
+Sheet columns (one row per base rate or surcharge):
+- Lane: lane_type, pol, pod, aoo, aod, origin, destination, service,
+  equipment, carrier, airline, vehicle_type, transit, chargeable_rule,
+  basis, distance. Rows with the same lane columns share one FF Rate Lane.
+- Base: container_type, weight_break_from, weight_break_to, base_rate, uom
+- Surcharge rows: surcharge_code, surcharge_name, calc_type, amount, taxable
+  (no lane columns needed)
+"""
+
+import csv
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now
+
+from freight_forwarding.utils.rate.base_rates import format_weight_break
+from freight_forwarding.utils.rate.rate_index import LANE_ENDPOINTS, parse_modes
+from freight_forwarding.utils.rate.surcharges import CALC_TYPES
+
+# Child rows per bulk insert
+CHUNK_SIZE = 2000
+
+# Rows between progress updates
+PROGRESS_EVERY = 1000
+
+# Per-row errors kept in the result
+MAX_REPORTED_ERRORS = 1000
+
+LANE_FIELDS = [
+    "lane_type", "pol", "pod", "aoo", "aod", "origin", "destination", "service", "equipment",
+    "carrier", "airline", "vehicle_type", "transit", "chargeable_rule", "basis", "distance",
+]
+BASE_FIELDS = ["container_type", "weight_break_from", "weight_break_to", "base_rate", "uom"]
+SURCHARGE_FIELDS = ["surcharge_code", "surcharge_name", "calc_type", "amount", "taxable"]
+
+CHILD_TABLES = {
+    "FF Rate Lane": ("rate_lanes", LANE_FIELDS),
+    "FF Rate Base": ("rate_bases", ["rate_lane"] + BASE_FIELDS),
+    "FF Rate Surcharge": ("rate_surcharges", SURCHARGE_FIELDS),
+}
+
+INT_FIELDS = {"transit"}
+FLOAT_FIELDS = {"distance", "weight_break_from", "weight_break_to", "base_rate", "amount"}
+
+
+class RateSheetRowError(Exception):
+    """Invalid rate sheet row"""
+
+    pass
+
+
+def iter_rate_sheet(file_path):
+    """
+    Yield (row_no, row) from a CSV or XLSX rate sheet without loading it whole.
+
+    Row numbers count the header as row 1, as shown in a spreadsheet.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension == ".csv":
+        with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+            for row_no, row in enumerate(csv.DictReader(f), start=2):
+                yield row_no, row
+
+    elif extension == ".xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+            for row_no, values in enumerate(rows, start=2):
+                yield row_no, dict(zip(header, values))
+        finally:
+            workbook.close()
+
+    else:
+        frappe.throw(_("Rate sheets must be .csv or .xlsx files."))
+
+
+def count_rate_sheet_rows(file_path):
+    """Number of data rows, for progress (XLSX from sheet dimensions)"""
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, "rb") as f:
+            return max(sum(1 for _line in f) - 1, 0)
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        return max((workbook.active.max_row or 1) - 1, 0)
+    finally:
+        workbook.close()
+
+
+def clean(value, fieldname):
+    """Normalize a sheet cell for a field"""
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ""):
+        return 0 if fieldname in FLOAT_FIELDS | INT_FIELDS else None
+    if fieldname in INT_FIELDS:
+        return cint(value)
+    if fieldname in FLOAT_FIELDS:
+        return flt(value)
+    if isinstance(value, float) and value.is_integer():
+        # Numeric XLSX cell: 123, not "123.0"
+        value = int(value)
+    if fieldname in ("pol", "pod", "aoo", "aod"):
+        return str(value).upper()
+    return str(value)
+
+
+class RateSheetImporter:
+    """
+    Buffers rate sheet rows of one contract and writes them in chunks.
+
+    Args:
+        contract_name: FF Rate Contract the rows belong to
+        modes: Modes of the contract
+        ports: Set of FF Port names
+        airports: Set of FF Airport names
+        chunk_size: Child rows per bulk insert
+    """
+
+    def __init__(self, contract_name, modes, ports, airports, chunk_size=CHUNK_SIZE):
+        self.contract_name = contract_name
+        self.modes = set(modes)
+        self.ports = ports
+        self.airports = airports
+        self.chunk_size = chunk_size
+
+        self.lanes = {}
+        self.pending = {doctype: [] for doctype in CHILD_TABLES}
+        self.idx = {doctype: 0 for doctype in CHILD_TABLES}
+        self.breaks = {}
+        self.inserted = {doctype: 0 for doctype in CHILD_TABLES}
+        self.errors = []
+        self.error_count = 0
+        self.timestamp = now()
+        self.user = frappe.session.user
+
+    def add_row(self, row_no, row):
+        """Validate and buffer one sheet row; errors are recorded, not raised"""
+        try:
+            if clean(row.get("surcharge_code"), "surcharge_code"):
+                self.add_surcharge(row)
+            else:
+                self.add_base(row_no, row)
+        except RateSheetRowError as e:
+            self.add_error(row_no, str(e))
+
+        if sum(len(rows) for rows in self.pending.values()) >= self.chunk_size:
+            self.flush()
+
+    def add_error(self, row_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_no, "error": message})
+
+    def add_surcharge(self, row):
+        values = {f: clean(row.get(f), f) for f in SURCHARGE_FIELDS}
+        if not values["surcharge_name"]:
+            values["surcharge_name"] = values["surcharge_code"]
+        if values["calc_type"] not in CALC_TYPES:
+            raise RateSheetRowError(_("Invalid calc_type {0}").format(values["calc_type"]))
+        self.append("FF Rate Surcharge", values)
+
+    def add_base(self, row_no, row):
+        lane = {f: clean(row.get(f), f) for f in LANE_FIELDS}
+        self.validate_lane(lane)
+
+        base = {f: clean(row.get(f), f) for f in BASE_FIELDS}
+        if not base["base_rate"]:
+            raise RateSheetRowError(_("Base rate is required"))
+        if base["weight_break_to"] and base["weight_break_from"] >= base["weight_break_to"]:
+            raise RateSheetRowError(_("Weight break from must be below weight break to"))
+
+        lane_key = tuple(lane[f] for f in LANE_FIELDS)
+        lane_name = self.lanes.get(lane_key)
+        if not lane_name:
+            lane_name = self.append("FF Rate Lane", lane)
+            self.lanes[lane_key] = lane_name
+
+        base["rate_lane"] = lane_name
+        self.append("FF Rate Base", base)
+
+        if base["weight_break_from"] or base["weight_break_to"]:
+            # Only weight_break_from: open-ended, as in BaseRateTable
+            self.breaks.setdefault((lane_name, base["container_type"]), []).append(
+                (base["weight_break_from"], base["weight_break_to"] or float("inf"), row_no)
+            )
+
+    def validate_lane(self, lane):
+        lane_type = lane["lane_type"]
+        if lane_type not in LANE_ENDPOINTS:
+            raise RateSheetRowError(_("Invalid lane_type {0}").format(lane_type))
+        if lane_type not in self.modes:
+            raise RateSheetRowError(_("Lane type {0} is not a mode of the contract").format(lane_type))
+
+        origin_field, destination_field = LANE_ENDPOINTS[lane_type]
+        for fieldname in (origin_field, destination_field):
+            value = lane[fieldname]
+            if not value:
+                raise RateSheetRowError(_("{0} is required for {1} lanes").format(fieldname, lane_type))
+            if lane_type == "Sea" and value not in self.ports:
+                raise RateSheetRowError(_("Unknown FF Port {0}").format(value))
+            if lane_type == "Air" and value not in self.airports:
+                raise RateSheetRowError(_("Unknown FF Airport {0}").format(value))
+
+    def append(self, doctype, values):
+        """Buffer a child row and return its generated name"""
+        parentfield, _fields = CHILD_TABLES[doctype]
+        self.idx[doctype] += 1
+        values.update({
+            "name": frappe.generate_hash(length=10),
+            "parent": self.contract_name,
+            "parenttype": "FF Rate Contract",
+            "parentfield": parentfield,
+            "idx": self.idx[doctype],
+        })
+        self.pending[doctype].append(values)
+        return values["name"]
+
+    def flush(self):
+        """Bulk insert buffered rows (lanes before the bases linking them)"""
+        standard = ["name", "parent", "parenttype", "parentfield", "idx",
+                    "creation", "modified", "owner", "modified_by", "docstatus"]
+        for doctype, (_parentfield, fields) in CHILD_TABLES.items():
+            rows = self.pending[doctype]
+            if not rows:
+                continue
+            frappe.db.bulk_insert(
+                doctype,
+                standard + fields,
+                [
+                    [r["name"], r["parent"], r["parenttype"], r["parentfield"], r["idx"],
+                     self.timestamp, self.timestamp, self.user, self.user, 0]
+                    + [r.get(f) for f in fields]
+                    for r in rows
+                ],
+                chunk_size=self.chunk_size,
+            )
+            self.inserted[doctype] += len(rows)
+            self.pending[doctype] = []
+
+    def check_weight_breaks(self):
+        """Report overlapping weight breaks per lane/container type"""
+        for breaks in self.breaks.values():
+            breaks.sort()
+            for first, second in zip(breaks, breaks[1:]):
+                if second[0] < first[1]:
+                    self.add_error(second[2], _("Weight break {0} overlaps {1} (row {2})").format(
+                        format_weight_break(*second[:2]), format_weight_break(*first[:2]), first[2]
+                    ))
+
+    def summary(self):
+        return {
+            "rate_contract": self.contract_name,
+            "lanes": self.inserted["FF Rate Lane"],
+            "bases": self.inserted["FF Rate Base"],
+            "surcharges": self.inserted["FF Rate Surcharge"],
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def create_contract_header(header):
+    """Insert the FF Rate Contract header without child rows (validated on activation)"""
+    contract = frappe.new_doc("FF Rate Contract")
+    contract.update(header)
+    contract.set_new_name()
+    contract.owner = contract.modified_by = frappe.session.user
+    contract.creation = contract.modified = now()
+    contract.db_insert()
+    return contract
+
+
+def import_rate_sheet(file_path, vendor, mode, validity_from, validity_to, currency, carrier=None,
+                      payment_term=None, chunk_size=CHUNK_SIZE):
+    """
+    Import a rate sheet as a new Draft FF Rate Contract.
+
+    Rows are bulk inserted without document validation, so the contract
+    starts as Draft; saving it as Active validates it and indexes it.
+
+    Args:
+        file_path: Path of the CSV/XLSX sheet
+        vendor, mode, validity_from, validity_to, currency, carrier,
+            payment_term: Contract header
+        chunk_size: Child rows per bulk insert
+
+    Returns:
+        dict: {rate_contract, lanes, bases, surcharges, error_count, errors}
+    """
+    contract = create_contract_header({
+        "vendor": vendor,
+        "carrier": carrier,
+        "mode": mode,
+        "validity_from": validity_from,
+        "validity_to": validity_to,
+        "currency": currency,
+        "payment_term": payment_term,
+        "status": "Draft",
+    })
+
+    importer = RateSheetImporter(
+        contract.name,
+        parse_modes(mode),
+        set(frappe.get_all("FF Port", pluck="name")),
+        set(frappe.get_all("FF Airport", pluck="name")),
+        chunk_size=cint(chunk_size) or CHUNK_SIZE,
+    )
+
+    total = count_rate_sheet_rows(file_path)
+    for row_no, row in iter_rate_sheet(file_path):
+        importer.add_row(row_no, row)
+        if (row_no - 1) % PROGRESS_EVERY == 0:
+            frappe.publish_progress(
+                (row_no - 1) * 100 / total if total else 0,
+                title=_("Importing rate sheet"),
+                description=_("Row {0} of {1}").format(row_no - 1, total),
+            )
+
+    importer.flush()
+    importer.check_weight_breaks()
+
+    return importer.summary()
+
+
+def run_rate_sheet_import(file_url, user=None, **header):
+    """Background job: import a sheet and publish the result to the user"""
+    file_path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+    try:
+        result = import_rate_sheet(file_path, **header)
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        result = {"error": frappe.get_traceback()}
+        frappe.log_error(title="Rate sheet import failed")
+
+    frappe.publish_realtime("ff_rate_sheet_import", result, user=user or frappe.session.user)
+    return result
+
+
+@frappe.whitelist()
+def enqueue_rate_sheet_import(file_url, vendor, mode, validity_from, validity_to, currency, carrier=None,
+                              payment_term=None):
+    """
+    Import an uploaded rate sheet in the background.
+
+    Progress is published with `publish_progress`; the summary is sent to
+    the user as a realtime `ff_rate_sheet_import` event.
+
+    Args:
+        file_url: URL of the uploaded File (CSV or XLSX)
+        vendor, mode, validity_from, validity_to, currency, carrier,
+            payment_term: Contract header
+
+    Returns:
+        dict: {"job_id": str}
+    """
+    frappe.has_permission("FF Rate Contract", "create", throw=True)
+    file_doc = frappe.get_doc("File", {"file_url": file_url})
+    frappe.has_permission("File", "read", doc=file_doc, throw=True)
+
+    job = frappe.enqueue(
+        "freight_forwarding.utils.rate.rate_sheet_import.run_rate_sheet_import",
+        queue="long",
+        timeout=3600,
+        file_url=file_url,
+        user=frappe.session.user,
+        vendor=vendor,
+        mode=mode,
+        validity_from=validity_from,
+        validity_to=validity_to,
+        currency=currency,
+        carrier=carrier,
+        payment_term=payment_term,
+    )
+
+    return {"job_id": job.id if job else None}
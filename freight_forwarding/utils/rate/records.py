@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Compact Rate Records
+
+FF Rate Contract child rows as `__slots__` records holding only the fields
+the rate engine reads, instead of one `frappe._dict` per row with every
+column (notes, owner, timestamps, ...). Repeated codes (ports, lane types,
+container types, currencies) are interned, so a port shared by thousands
+of lanes is stored once per worker.
+
+Records keep the `row.field` and `row.get(field)` access of Frappe rows, so
+the engine, rate cube and contract versions work on either.
+"""
+
+import sys
+
+LANE_FIELDS = (
+    "name", "lane_type", "pol", "pod", "aoo", "aod", "origin", "destination",
+    "service", "equipment", "carrier", "airline", "vehicle_type",
+    "transit", "chargeable_rule", "basis", "distance",
+)
+BASE_FIELDS = (
+    "name", "rate_lane", "container_type", "equipment", "weight_break_from", "weight_break_to",
+    "base_rate", "currency", "uom",
+)
+SURCHARGE_FIELDS = ("name", "surcharge_code", "calc_type", "amount")
+FREETIME_FIELDS = (
+    "name", "port", "free_time_demurrage", "free_time_detention", "free_time_storage",
+    "demurrage_rate", "detention_rate", "storage_rate", "currency",
+)
+
+# Per-entry overhead of a lane in the rate index lookup (tuple + list slot)
+INDEX_ENTRY_SIZE = 64
+
+
+class RateRecord:
+    """Base class: one child row, fields in __slots__"""
+
+    __slots__ = ()
+
+    # String fields worth interning (values repeated across many rows)
+    interned = ()
+
+    def __init__(self, row):
+        for fieldname in self.__slots__:
+            value = row.get(fieldname)
+            if value is not None and fieldname in self.interned and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, fieldname, value)
+
+    def get(self, fieldname, default=None):
+        return getattr(self, fieldname, default)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+    def sizeof(self):
+        """Approximate bytes held by this record (interned values excluded)"""
+        size = sys.getsizeof(self)
+        for fieldname in self.__slots__:
+            value = getattr(self, fieldname)
+            if value is not None and fieldname not in self.interned:
+                size += sys.getsizeof(value)
+        return size
+
+
+class LaneRecord(RateRecord):
+    __slots__ = LANE_FIELDS
+    interned = frozenset((
+        "lane_type", "pol", "pod", "aoo", "aod", "origin", "destination",
+        "service", "equipment", "carrier", "airline", "vehicle_type", "chargeable_rule", "basis",
+    ))
+
+
+class BaseRecord(RateRecord):
+    __slots__ = BASE_FIELDS
+    interned = frozenset(("container_type", "equipment", "currency", "uom"))
+
+
+class SurchargeRecord(RateRecord):
+    __slots__ = SURCHARGE_FIELDS
+    interned = frozenset(("surcharge_code", "calc_type"))
+
+
+class FreetimeRecord(RateRecord):
+    __slots__ = FREETIME_FIELDS
+    interned = frozenset(("port", "currency"))
+
+
+def compact(record_class, rows):
+    """Convert rows (dicts or documents) to records; records pass through"""
+    return [row if isinstance(row, record_class) else record_class(row) for row in rows or []]
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-leg Routing Engine
+
+Builds a graph from the lanes in the compiled rate index (ports, airports
+and Land origin/destination nodes) and finds the k best itineraries by total
+buy cost or transit, e.g. Land pickup → Sea POL→POD → Land delivery.
+
+Land endpoints are free text, so a Land node whose name is the city of an
+FF Port/FF Airport is linked to that port/airport by a zero-cost transfer.
+"""
+
+import heapq
+from itertools import count
+
+import frappe
+from frappe import _
+
+# Redis key caching city → port/airport transfer pairs
+TRANSFER_CACHE_KEY = "ff_routing_transfers"
+
+TRANSFER = "Transfer"
+
+METRICS = ("cost", "transit")
+
+_graph = None
+
+
+def node_id(value):
+    """Normalize a location (port/airport code or city) to a graph node"""
+    return (value or "").strip().upper()
+
+
+class RouteGraph:
+    """Adjacency lists over rate index lane keys plus transfer edges"""
+
+    def __init__(self, rate_index, transfers):
+        self.generation = rate_index._generation
+        self.transfer_version = transfers["version"]
+        self.edges = {}
+
+        # Edge: (from_node, to_node, mode, lane_type, origin, destination)
+        for mode, lane_type, origin, destination in rate_index.lanes:
+            self._add((node_id(origin), node_id(destination), mode, lane_type, origin, destination))
+
+        for city, code in transfers["pairs"]:
+            self._add((node_id(city), node_id(code), TRANSFER, None, city, code))
+            self._add((node_id(code), node_id(city), TRANSFER, None, code, city))
+
+    def _add(self, edge):
+        if edge[0] == edge[1]:
+            return
+        self.edges.setdefault(edge[0], set()).add(edge)
+
+    def out_edges(self, node):
+        return self.edges.get(node, ())
+
+
+def get_route_graph(rate_index):
+    """Get this worker's route graph, rebuilt when the rate index changes"""
+    global _graph
+    transfers = get_transfers()
+    if (
+        _graph is None
+        or _graph.generation != rate_index._generation
+        or _graph.transfer_version != transfers["version"]
+    ):
+        _graph = RouteGraph(rate_index, transfers)
+    return _graph
+
+
+def get_transfers():
+    """
+    (city, code) pairs linking Land nodes to FF Ports and FF Airports.
+
+    Returns:
+        dict: {"version": str, "pairs": list}
+    """
+    return frappe.cache().get_value(TRANSFER_CACHE_KEY, generator=_load_transfers)
+
+
+def _load_transfers():
+    pairs = []
+    for doctype in ("FF Port", "FF Airport"):
+        for row in frappe.get_all(doctype, filters={"city": ["is", "set"]}, fields=["name", "city"]):
+            pairs.append((row.city, row.name))
+    return {"version": frappe.generate_hash(length=12), "pairs": pairs}
+
+
+def invalidate_transfers():
+    """Drop cached transfers after an FF Port/FF Airport changed (every worker rebuilds its graph)"""
+    frappe.cache().delete_value(TRANSFER_CACHE_KEY)
+
+
+class RouteFinder:
+    """
+    k-shortest itineraries (Yen's algorithm) over a RouteGraph.
+
+    Edge weights come from the best priced option of the lane for the given
+    cargo and date, evaluated lazily and memoized for one search.
+    """
+
+    def __init__(self, snapshot, graph, date_filter, weight=None, cbm=None, container_type=None,
+                 metric="cost", max_legs=3):
+        self.snapshot = snapshot
+        self.graph = graph
+        self.date_filter = date_filter
+        self.weight = weight
+        self.cbm = cbm
+        self.container_type = container_type
+        self.metric = metric
+        self.max_legs = max_legs
+        self._best = {}
+
+    def best_candidate(self, edge):
+        """Best (weight, candidate) for an edge, or None when it cannot be priced"""
+        if edge not in self._best:
+            _from, _to, mode, lane_type, origin, destination = edge
+            if mode == TRANSFER:
+                self._best[edge] = (0, None)
+            else:
+                best = None
+                for candidate in self.snapshot.iter_candidates(
+                    lane_type, origin, destination, mode, self.date_filter,
+                    self.weight, self.cbm, self.container_type
+                ):
+                    rank_key = candidate[0]
+                    # (dd_unknown, cost, transit, ...); routes are priced without dwell
+                    edge_weight = rank_key[2] if self.metric == "transit" else rank_key[1]
+                    if edge_weight == float("inf"):
+                        continue
+                    if best is None or (edge_weight, rank_key) < (best[0], best[1][0]):
+                        best = (edge_weight, candidate)
+                self._best[edge] = best
+        return self._best[edge]
+
+    def shortest(self, source, target, max_legs, removed_edges=frozenset(), removed_nodes=frozenset()):
+        """Dijkstra over (node, legs) states; returns (total, [edges]) or None"""
+        tie = count()
+        heap = [(0, next(tie), source, ())]
+        settled = set()
+
+        while heap:
+            total, _tie, node, path = heapq.heappop(heap)
+            legs = sum(1 for e in path if e[2] != TRANSFER)
+            if node == target:
+                return total, list(path)
+            if (node, legs) in settled:
+                continue
+            settled.add((node, legs))
+
+            visited = {source} | {e[1] for e in path}
+            for edge in self.graph.out_edges(node):
+                if edge in removed_edges or edge[1] in removed_nodes or edge[1] in visited:
+                    continue
+                next_legs = legs + (0 if edge[2] == TRANSFER else 1)
+                if next_legs > max_legs:
+                    continue
+                best = self.best_candidate(edge)
+                if best is None:
+                    continue
+                heapq.heappush(heap, (total + best[0], next(tie), edge[1], path + (edge,)))
+
+        return None
+
+    def k_shortest(self, source, target, k):
+        """Yen's algorithm: up to k loopless itineraries, best first"""
+        first = self.shortest(source, target, self.max_legs)
+        if not first:
+            return []
+
+        found = [first]
+        pending = []
+        seen = {tuple(first[1])}
+        tie = count()
+
+        while len(found) < k:
+            last_path = found[-1][1]
+            for i in range(len(last_path)):
+                root = last_path[:i]
+                spur_node = root[-1][1] if root else source
+                root_legs = sum(1 for e in root if e[2] != TRANSFER)
+
+                removed_edges = {p[i] for _total, p in found if len(p) > i and p[:i] == root}
+                removed_nodes = {source} | {e[1] for e in root}
+                removed_nodes.discard(spur_node)
+
+                spur = self.shortest(
+                    spur_node, target, self.max_legs - root_legs,
+                    frozenset(removed_edges), frozenset(removed_nodes)
+                )
+                if not spur:
+                    continue
+
+                path = root + spur[1]
+                if tuple(path) in seen:
+                    continue
+                seen.add(tuple(path))
+                total = sum(self.best_candidate(e)[0] for e in path)
+                heapq.heappush(pending, (total, next(tie), path))
+
+            if not pending:
+                break
+            total, _tie, path = heapq.heappop(pending)
+            found.append((total, path))
+
+        return found
+
+
+def find_routes(origin, destination, date_filter=None, weight=None, cbm=None, container_type=None,
+                k=3, metric="cost", max_legs=3, division=None, customer=None, commodity=None):
+    """
+    Find the k best multi-leg itineraries between two locations.
+
+    Args:
+        origin: Port/airport code or Land origin city
+        destination: Port/airport code or Land destination city
+        date_filter: Date to check validity (default: today)
+        weight: Weight in kg (optional)
+        cbm: Volume in CBM (optional)
+        container_type: Container type for Sea legs (optional)
+        k: Number of itineraries
+        metric: "cost" (buy rate in company currency) or "transit" (days)
+        max_legs: Maximum priced legs per itinerary
+        division, customer, commodity: Pricing rule context (optional)
+
+    Returns:
+        list: Itineraries as {legs, total_buy_rate, total_sell_rate, total_transit_days}
+    """
+    from frappe.utils import cint, flt, getdate
+
+    from freight_forwarding.utils.rate.rate_engine import get_rate_snapshot
+
+    if metric not in METRICS:
+        frappe.throw(_("Metric must be one of: {0}").format(", ".join(METRICS)))
+
+    date_filter = getdate(date_filter)
+    snapshot = get_rate_snapshot()
+    finder = RouteFinder(
+        snapshot, get_route_graph(snapshot.rate_index), date_filter,
+        weight=flt(weight) or None, cbm=flt(cbm) or None, container_type=container_type,
+        metric=metric, max_legs=cint(max_legs) or 3,
+    )
+
+    itineraries = []
+    for _total, path in finder.k_shortest(node_id(origin), node_id(destination), cint(k) or 3):
+        legs = []
+        for edge in path:
+            if edge[2] == TRANSFER:
+                continue
+            option = snapshot.build_option(
+                finder.best_candidate(edge)[1], edge[2], date_filter,
+                division=division, customer=customer, commodity=commodity
+            )
+            option.update({"mode": edge[2], "origin": edge[4], "destination": edge[5]})
+            legs.append(option)
+
+        itineraries.append({
+            "legs": legs,
+            "total_buy_rate": sum(leg["base_buy_rate"] or 0 for leg in legs),
+            "total_sell_rate": sum(leg["base_sell_rate"] or 0 for leg in legs),
+            "total_transit_days": sum(leg["transit_days"] or 0 for leg in legs),
+            "currency": snapshot.company_currency,
+        })
+
+    return itineraries
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+What-if Repricing Simulator
+
+Re-prices historical Projects against a chosen set of FF Rate Contracts
+("what margin would we have made had contract X applied last quarter?")
+and aggregates the margin deltas against each Project's actual margin.
+
+All data is loaded up front into one picklable snapshot (contracts, lane
+index, pricing rules, preloaded FX and fuel index), which is handed once
+to every process of a process pool; workers never touch the database.
+
+Only Sea and Air legs are re-priced: a Project records its POL/POD and
+AOO/AOD but no trucking origin or destination, so its Land leg is left
+out of the simulation (not counted as unpriced). Margins of multimodal
+Projects are compared on their Sea/Air legs alone.
+
+With a projected dwell, each shipment's expected D&D (demurrage, detention
+and storage) is priced in bulk from the contracts' free-time terms, ranked
+on landed cost as `find_rates` does, and counted in the simulated cost.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from functools import partial
+
+import frappe
+import numpy as np
+from frappe import _
+from frappe.utils import cint, flt, getdate
+
+from freight_forwarding.utils.rate.adjustments import AdjustmentStore, get_company_currency
+from freight_forwarding.utils.rate.freetime import get_lane_port, price_freetime
+from freight_forwarding.utils.rate.pricing_rules import get_pricing_rule_matcher
+from freight_forwarding.utils.rate.rate_engine import RateSnapshot, apply_pricing_rules, calculate_buy_rates, make_dwell
+from freight_forwarding.utils.rate.rate_index import LANE_ENDPOINTS, RateIndex, load_contracts, parse_modes
+
+# Shipments per task sent to a worker process
+SIMULATION_CHUNK_SIZE = 500
+
+# Margin bases
+MARGIN_BASES = ("repriced", "billed")
+
+# Modes whose lane endpoints a Project records (see LANE_ENDPOINTS)
+SIMULATED_MODES = ("Sea", "Air")
+
+PROJECT_FIELDS = [
+    "name", "customer", "division", "mode", "pol", "pod", "aoo", "aod", "etd",
+    "expected_start_date", "creation", "gross_margin", "total_billed_amount",
+]
+
+# Snapshot of the worker process, set once by the pool initializer
+_worker_snapshot = None
+
+
+def build_simulation_snapshot(contract_names, from_date, to_date, ignore_validity=True):
+    """
+    One self-contained pricing snapshot over the chosen contracts.
+
+    Args:
+        contract_names: FF Rate Contracts to simulate (any status)
+        from_date, to_date: Shipment date range (FX preload)
+        ignore_validity: Apply the contracts on any date, not just within
+            their validity window
+
+    Returns:
+        RateSnapshot: Safe to pickle; never queries
+    """
+    index = RateIndex()
+    for contract in load_contracts(contract_names):
+        if ignore_validity:
+            contract = copy(contract)
+            contract.validity_from = contract.validity_to = None
+        index.add_contract(contract)
+
+    missing = set(contract_names) - set(index.contracts)
+    if missing:
+        frappe.throw(_("Rate Contracts not found: {0}").format(", ".join(sorted(missing))))
+
+    company_currency = get_company_currency()
+    # Bounded by the simulated date range already
+    adjustments = AdjustmentStore(fallback=False, max_fx_rates=None)
+    currencies = [c.currency for c in index.contracts.values()]
+    currencies += [f.currency for c in index.contracts.values() for f in c.rate_freetimes or [] if f.currency]
+    adjustments.preload_fx(from_date, to_date, currencies, company_currency)
+    adjustments.preload_fuel()
+
+    return RateSnapshot(index, get_pricing_rule_matcher(), adjustments, company_currency)
+
+
+def load_shipments(projects=None, from_date=None, to_date=None):
+    """
+    Shipments to simulate: one per Sea / Air lane of a Project, with
+    consol member cargo. Land legs are left out (see SIMULATED_MODES).
+
+    Args:
+        projects: Project names (optional)
+        from_date, to_date: ETD range when no projects are given
+
+    Returns:
+        list: Shipment tuples (see `price_shipment`)
+    """
+    filters = {}
+    if projects:
+        filters["name"] = ["in", projects]
+    else:
+        filters["etd"] = ["between", [from_date, to_date]]
+
+    rows = frappe.get_all("Project", filters=filters, fields=PROJECT_FIELDS)
+
+    # Cargo per project from consol members, with one query
+    cargo = {}
+    for member in frappe.get_all(
+        "Consol Member",
+        filters={"project": ["in", [r.name for r in rows]], "parenttype": "FF Consol Shipment"},
+        fields=["project", "weight", "cbm"],
+    ) if rows else []:
+        weight, cbm = cargo.get(member.project, (0, 0))
+        cargo[member.project] = (weight + flt(member.weight), cbm + flt(member.cbm))
+
+    shipments = []
+    for row in rows:
+        weight, cbm = cargo.get(row.name, (0, 0))
+        shipment_date = getdate(row.etd or row.expected_start_date or row.creation)
+        for mode in parse_modes(row.mode):
+            if mode not in SIMULATED_MODES:
+                continue
+            origin_field, destination_field = LANE_ENDPOINTS[mode]
+            shipments.append((
+                row.name, mode, row.get(origin_field), row.get(destination_field), shipment_date,
+                weight or None, cbm or None,
+                row.customer, row.division, flt(row.gross_margin), flt(row.total_billed_amount),
+            ))
+    return shipments
+
+
+def price_shipment(snapshot, shipment, dwell=None):
+    """
+    Best option for one shipment on the snapshot.
+
+    Args:
+        snapshot: RateSnapshot
+        shipment: (project, mode, origin, destination, date, weight, cbm,
+            customer, division, actual_margin, billed)
+        dwell: Projected D&D (see `make_dwell`; optional)
+
+    Returns:
+        tuple: (project, mode, base_buy_rate, base_sell_rate, rate_contract);
+            rates None when no lane prices the shipment. With `dwell` the
+            buy includes the expected D&D in company currency.
+    """
+    return price_shipment_batch(snapshot, [shipment], dwell=dwell)[0]
+
+
+def price_shipment_batch(snapshot, shipments, dwell=None):
+    """
+    Best option for each of many shipments, priced per lane.
+
+    The shipments of one lane are priced on each contract lane serving it
+    with one `calculate_buy_rates` pass (and one `price_freetime` pass with
+    `dwell`) and ranked as `compute_rates` ranks them (D&D unknown last,
+    landed cost in company currency, transit, contract, lane); pricing
+    rules are applied to the best option only.
+
+    Returns:
+        list: `price_shipment` results in shipment order
+    """
+    results = [None] * len(shipments)
+    lanes = {}
+    for idx, shipment in enumerate(shipments):
+        project, mode, origin, destination = shipment[:4]
+        if not origin or not destination:
+            results[idx] = (project, mode, None, None, None)
+        else:
+            lanes.setdefault((mode, origin, destination), []).append(idx)
+
+    for (mode, origin, destination), indexes in lanes.items():
+        lane_results = price_lane(snapshot, mode, origin, destination, [shipments[i] for i in indexes], dwell)
+        for idx, result in zip(indexes, lane_results):
+            results[idx] = result
+    return results
+
+
+def price_lane(snapshot, mode, origin, destination, shipments, dwell=None):
+    """Best option for shipments of one lane (see `price_shipment_batch`)"""
+    size = len(shipments)
+    dates = [s[4] for s in shipments]
+    weights = np.array([flt(s[5]) for s in shipments])
+    cbms = np.array([flt(s[6]) for s in shipments])
+    if dwell:
+        dwell_days, detention_days = np.full(size, dwell[0]), np.full(size, dwell[1])
+
+    # Contract lanes serving the lane on any shipment date, with the shipments they serve
+    serving = {}
+    for shipment_date in set(dates):
+        on_date = np.array([d == shipment_date for d in dates])
+        for contract, lane in snapshot.rate_index.lookup(mode, mode, origin, destination, shipment_date):
+            entry = serving.setdefault(id(lane), [contract, lane, np.zeros(size, dtype=bool)])
+            entry[2] |= on_date
+
+    candidates = sorted(
+        serving.values(), key=lambda c: (c[1].transit or float("inf"), c[0].name, c[1].name or "")
+    )
+
+    best = np.full(size, -1)
+    # 2 until a candidate is found: any candidate, even with unknown D&D, is better
+    best_dd_unknown = np.full(size, 2)
+    best_cost = np.full(size, np.inf)
+    best_buy = np.full(size, np.nan)
+    best_exchange = np.full(size, np.nan)
+    best_dd = np.zeros(size)
+    exchange_rates = {}
+
+    def company_exchange_rates(currency):
+        if currency not in exchange_rates:
+            by_date = {d: snapshot.to_company_currency(currency, d) for d in set(dates)}
+            exchange_rates[currency] = np.array([by_date[d] or np.nan for d in dates])
+        return exchange_rates[currency]
+
+    for position, (contract, lane, served) in enumerate(candidates):
+        buy_rates = calculate_buy_rates(
+            contract, lane, weights, cbms, dates=dates, adjustments=snapshot.adjustments
+        )
+        exchange = company_exchange_rates(contract.currency)
+
+        # Unknown FX ranks last, as in `iter_candidates`
+        costs = np.where(np.isnan(exchange), np.inf, buy_rates * exchange)
+
+        dd_unknown = 0
+        dd_costs = np.zeros(size)
+        if dwell:
+            freetime = price_freetime(contract, get_lane_port(lane), dwell_days, detention_days)
+            if freetime is None:
+                dd_unknown = 1
+            else:
+                dd_costs = freetime["total"] * dwell[2]
+                dd_exchange = company_exchange_rates(freetime["currency"])
+                dd_costs = np.where(dd_costs == 0, 0, np.where(np.isnan(dd_exchange), np.inf, dd_costs * dd_exchange))
+                costs = costs + dd_costs
+
+        better = served & ~np.isnan(buy_rates) & (
+            (dd_unknown < best_dd_unknown) | ((dd_unknown == best_dd_unknown) & (costs < best_cost))
+        )
+        best[better] = position
+        best_dd_unknown[better] = dd_unknown
+        best_cost[better] = costs[better]
+        best_buy[better] = buy_rates[better]
+        best_exchange[better] = exchange[better]
+        best_dd[better] = dd_costs[better]
+
+    results = []
+    for idx, shipment in enumerate(shipments):
+        project, customer, division = shipment[0], shipment[7], shipment[8]
+        if best[idx] < 0:
+            results.append((project, mode, None, None, None))
+            continue
+
+        contract, lane, _served = candidates[best[idx]]
+        buy_rate = float(best_buy[idx])
+        exchange_rate = None if np.isnan(best_exchange[idx]) else float(best_exchange[idx])
+        sell_rate = apply_pricing_rules(
+            buy_rate, contract, lane, mode, dates[idx], division=division, customer=customer,
+            matcher=snapshot.pricing_rule_matcher
+        )
+        # Without an exchange rate to the company currency (buy or D&D) the cost is unknown
+        cost = buy_rate * exchange_rate + float(best_dd[idx]) if exchange_rate else None
+        results.append((
+            project, mode,
+            cost if cost is not None and np.isfinite(cost) else None,
+            sell_rate * exchange_rate if exchange_rate and sell_rate else None,
+            contract.name,
+        ))
+    return results
+
+
+def _init_worker(snapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _price_chunk(shipments, dwell=None):
+    return price_shipment_batch(_worker_snapshot, shipments, dwell=dwell)
+
+
+def price_shipments(snapshot, shipments, workers=None, dwell=None):
+    """
+    Price shipments, across a process pool when there is more than one chunk.
+
+    Shipments are chunked by lane so each chunk prices few lanes in bulk.
+
+    Returns:
+        list: `price_shipment` results in shipment order
+    """
+    order = sorted(range(len(shipments)), key=lambda i: tuple(str(v or "") for v in shipments[i][1:4]))
+    ordered = [shipments[i] for i in order]
+    chunks = [
+        ordered[start:start + SIMULATION_CHUNK_SIZE]
+        for start in range(0, len(ordered), SIMULATION_CHUNK_SIZE)
+    ]
+    workers = min(cint(workers) or cint(frappe.conf.get("ff_simulation_workers")) or os.cpu_count() or 1, len(chunks))
+
+    if workers <= 1:
+        ordered_results = price_shipment_batch(snapshot, ordered, dwell=dwell)
+    else:
+        ordered_results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshot,)) as pool:
+            for chunk_results in pool.map(partial(_price_chunk, dwell=dwell), chunks):
+                ordered_results.extend(chunk_results)
+
+    results = [None] * len(shipments)
+    for idx, result in zip(order, ordered_results):
+        results[idx] = result
+    return results
+
+
+def aggregate_margins(shipments, results, margin_basis="repriced"):
+    """
+    Simulated vs. actual margin per project, and totals by mode and division.
+
+    A project's simulated margin is the sum over its lanes of sell - buy
+    ("repriced", pricing rules re-applied) or its billed amount less the
+    simulated buy ("billed"). Projects with an unpriced lane are counted
+    as unpriced and left out of the totals.
+    """
+    projects = {}
+    for shipment, (project, mode, buy, sell, rate_contract) in zip(shipments, results):
+        entry = projects.setdefault(project, {
+            "project": project,
+            "division": shipment[8],
+            "modes": [],
+            "actual_margin": shipment[9],
+            "billed": shipment[10],
+            "buy": 0,
+            "sell": 0,
+            "rate_contracts": [],
+            "priced": True,
+        })
+        entry["modes"].append(mode)
+        if buy is None:
+            entry["priced"] = False
+            continue
+        entry["buy"] += buy
+        entry["sell"] += sell or 0
+        entry["rate_contracts"].append(rate_contract)
+
+    totals = {"actual_margin": 0, "simulated_margin": 0, "margin_delta": 0}
+    by_mode = {}
+    by_division = {}
+    unpriced = []
+    details = []
+
+    for entry in projects.values():
+        if not entry["priced"]:
+            unpriced.append(entry["project"])
+            continue
+
+        if margin_basis == "billed":
+            entry["simulated_margin"] = entry["billed"] - entry["buy"]
+        else:
+            entry["simulated_margin"] = entry["sell"] - entry["buy"]
+        entry["margin_delta"] = entry["simulated_margin"] - entry["actual_margin"]
+        details.append(entry)
+
+        for group in (totals, by_mode.setdefault(", ".join(entry["modes"]), {}),
+                      by_division.setdefault(entry["division"] or "", {})):
+            for field in ("actual_margin", "simulated_margin", "margin_delta"):
+                group[field] = group.get(field, 0) + entry[field]
+            group["projects"] = group.get("projects", 0) + 1
+
+    return {
+        "projects": len(projects),
+        "priced": len(details),
+        "unpriced": unpriced,
+        "totals": totals,
+        "by_mode": by_mode,
+        "by_division": by_division,
+        "details": details,
+    }
+
+
+def simulate_repricing(contracts, projects=None, from_date=None, to_date=None, margin_basis="repriced",
+                       ignore_validity=True, workers=None, include_details=False, dwell_days=None,
+                       detention_days=None, containers=None):
+    """
+    Re-price historical Projects on a set of rate contracts.
+
+    Args:
+        contracts: FF Rate Contract names to apply
+        projects: Project names (optional; default: ETD within the range)
+        from_date, to_date: ETD range (required without projects)
+        margin_basis: "repriced" (sell - buy) or "billed" (billed - buy)
+        ignore_validity: Apply contracts outside their validity window
+        workers: Worker processes (default: site config
+            `ff_simulation_workers`, else CPU count)
+        include_details: Include per-project results
+        dwell_days: Projected days at the destination port of every
+            shipment; adds expected D&D to the simulated cost (optional)
+        detention_days: Projected days out of the terminal (optional)
+        containers: Containers per shipment for D&D (default: 1)
+
+    Returns:
+        dict: {projects, priced, unpriced, totals, by_mode, by_division, details}
+    """
+    if margin_basis not in MARGIN_BASES:
+        frappe.throw(_("Margin basis must be one of: {0}").format(", ".join(MARGIN_BASES)))
+    if not contracts:
+        frappe.throw(_("Select at least one Rate Contract."))
+    if not projects and not (from_date and to_date):
+        frappe.throw(_("Select projects or a date range."))
+
+    shipments = load_shipments(projects, from_date, to_date)
+    if not shipments:
+        return aggregate_margins([], [], margin_basis)
+
+    shipment_dates = [s[4] for s in shipments]
+    snapshot = build_simulation_snapshot(
+        contracts, min(shipment_dates), max(shipment_dates), ignore_validity=ignore_validity
+    )
+
+    dwell = make_dwell(dwell_days, detention_days, containers)
+    result = aggregate_margins(shipments, price_shipments(snapshot, shipments, workers, dwell), margin_basis)
+    if not include_details:
+        result.pop("details")
+    return result
+
+
+def run_simulation(user=None, **kwargs):
+    """Background job: run a simulation and send the result to the user"""
+    result = simulate_repricing(**kwargs)
+    frappe.publish_realtime("ff_repricing_simulation", result, user=user or frappe.session.user)
+    return result
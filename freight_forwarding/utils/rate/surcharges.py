@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Surcharge Evaluation
+
+Compiles a contract's `rate_surcharges` into one amount array per calc_type
+(flat, per_kg, per_cntr, percent of base) and evaluates them for whole
+vectors of shipments in a single NumPy pass, for bulk repricing of
+shipment history (see `rate_engine.calculate_buy_rates`).
+"""
+
+import numpy as np
+from frappe.utils import flt
+
+
+CALC_TYPES = ("flat", "per_kg", "per_cntr", "percent")
+
+
+class SurchargeVector:
+    """Surcharges of one contract version, grouped by calc_type"""
+
+    def __init__(self, rate_surcharges):
+        amounts = {calc_type: [] for calc_type in CALC_TYPES}
+        codes = {calc_type: [] for calc_type in CALC_TYPES}
+
+        for surcharge in rate_surcharges:
+            if surcharge.calc_type not in amounts:
+                continue
+            amounts[surcharge.calc_type].append(flt(surcharge.amount))
+            codes[surcharge.calc_type].append(surcharge.surcharge_code)
+
+        self.amounts = {k: np.array(v, dtype=float) for k, v in amounts.items()}
+        self.codes = codes
+        self.totals = {k: float(v.sum()) for k, v in self.amounts.items()}
+
+    def total(self, base_rate=0, weight=None, container_type=None):
+        """
+        Total surcharges for one shipment.
+
+        Args:
+            base_rate: Base rate the percent surcharges apply to
+            weight: Weight (or chargeable weight) in kg
+            container_type: Container type; per_cntr applies only when set
+
+        Returns:
+            float: Total surcharges
+        """
+        total = self.totals["flat"]
+        if weight:
+            total += self.totals["per_kg"] * weight
+        if container_type:
+            total += self.totals["per_cntr"]
+        if base_rate:
+            total += self.totals["percent"] * base_rate / 100
+        return total
+
+    def evaluate(self, base_rates, weights=None, container_types=None):
+        """
+        Total surcharges for a vector of shipments.
+
+        Args:
+            base_rates: array of base rates (NaN where no base matched)
+            weights: array of weights in kg (optional)
+            container_types: array of container types, empty/None for
+                non-container shipments (optional)
+
+        Returns:
+            numpy.ndarray: Total surcharges per shipment
+        """
+        base_rates = np.asarray(base_rates, dtype=float)
+        total = np.full(base_rates.shape, self.totals["flat"])
+
+        if weights is not None:
+            total += self.totals["per_kg"] * np.nan_to_num(np.asarray(weights, dtype=float))
+
+        if container_types is not None:
+            has_container = np.array([bool(c) for c in container_types], dtype=bool)
+            total += self.totals["per_cntr"] * has_container
+
+        total += self.totals["percent"] / 100 * base_rates
+        return total
+
+
+def get_surcharge_vector(contract_doc):
+    """Get the compiled surcharges of a contract (built once per contract object)"""
+    vector = getattr(contract_doc, "_surcharge_vector", None)
+    if vector is None:
+        vector = SurchargeVector(contract_doc.rate_surcharges or [])
+        contract_doc._surcharge_vector = vector
+    return vector
+
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Validity Interval Index
+
+Change points of FF Rate Contract (and pricing rule) validity windows: the
+dates on which a lane's set of valid contracts changes, found by bisection,
+so date-ranged lookups such as the rate timeline quote once per period
+instead of rescanning every contract for every day.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+
+class ChangePoints:
+    """Sorted dates on which a set of validity windows opens or closes"""
+
+    def __init__(self, intervals):
+        points = set()
+        for valid_from, valid_to in intervals:
+            if valid_from:
+                points.add(valid_from)
+            if valid_to and valid_to < date.max:
+                # Window closes at the end of valid_to
+                points.add(valid_to + timedelta(days=1))
+        self.points = sorted(points)
+
+    def between(self, from_date, to_date):
+        """
+        Return change dates in the closed range [from_date, to_date].
+
+        Args:
+            from_date: date
+            to_date: date
+
+        Returns:
+            list: Sorted dates
+        """
+        return self.points[bisect_left(self.points, from_date):bisect_right(self.points, to_date)]
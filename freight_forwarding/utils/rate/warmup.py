@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Cache Warmup
+
+After a deploy or restart every worker starts cold: the first quote on
+each one loads the rate index, pricing rules, FX series and route graph.
+The first request a web worker serves for a site starts a warmup thread
+(with its own site connection) that preloads them into worker memory, so
+the requests that follow find them ready:
+
+1. pricing rules
+2. Freight Services item group tree
+3. FF Port / FF Airport transfers
+4. rate index (active FF Rate Contracts)
+5. FX series of the contract currencies and the fuel index
+6. route graph
+
+The rate index, FX series and route graph are built in the warmup thread
+and handed to the worker in one assignment at the end, so requests served
+meanwhile never see them half loaded; what a request loaded first is kept.
+Pricing rules, item groups and transfers are assigned complete by their
+own getters.
+
+Steps stop once the worker's memory grew past the site config
+`ff_rate_warmup_memory_mb` (default 512). The budget is a soft limit: it
+is checked between steps, so the step that crosses it is still loaded and
+installed, and reported with its overshoot. Leave room for the largest
+step (usually the rate index) below the worker's hard memory limit. Each worker records what it loaded, how
+long it took and how much memory it took in a Redis hash (see
+`get_warmup_report`). Set `ff_rate_warmup` to 0 to disable.
+
+Background jobs run in forked work horses that exit after each job, so
+only web workers are warmed.
+"""
+
+import os
+import socket
+import threading
+import time
+
+import frappe
+from frappe.utils import add_days, cint, now, today
+
+# Redis hash of warmup reports, one field per worker process
+WARMUP_REPORT_KEY = "ff_rate_warmup_report"
+
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# Days of exchange rates preloaded up to today
+DEFAULT_FX_DAYS = 30
+
+# Sites warmed (or being warmed) by this process
+_warmed_sites = set()
+_lock = threading.Lock()
+
+
+def warm_up_worker():
+    """
+    before_request hook: warm this worker in the background, once per site.
+    """
+    site = frappe.local.site
+    if site in _warmed_sites:
+        return
+
+    with _lock:
+        if site in _warmed_sites:
+            return
+        _warmed_sites.add(site)
+
+    if not cint(frappe.conf.get("ff_rate_warmup", 1)):
+        return
+
+    threading.Thread(target=_warm_up_site, args=(site, frappe.local.sites_path), daemon=True).start()
+
+
+def _warm_up_site(site, sites_path):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        warm_up()
+    except Exception:
+        frappe.log_error(title="Rate cache warmup failed")
+    finally:
+        frappe.destroy()
+
+
+def warm_up():
+    """
+    Preload rate data into this worker's memory, within the memory budget.
+
+    Returns:
+        dict: Warmup report (see `get_warmup_report`)
+    """
+    from freight_forwarding.utils.item_groups import get_freight_service_groups
+    from freight_forwarding.utils.rate.adjustments import AdjustmentStore, get_company_currency, get_shared_version
+    from freight_forwarding.utils.rate.pricing_rules import get_pricing_rule_matcher
+    from freight_forwarding.utils.rate.rate_index import RateIndex
+    from freight_forwarding.utils.rate.routing import RouteGraph, get_transfers
+
+    budget_mb = cint(frappe.conf.get("ff_rate_warmup_memory_mb")) or DEFAULT_MEMORY_BUDGET_MB
+    fx_days = cint(frappe.conf.get("ff_rate_warmup_fx_days")) or DEFAULT_FX_DAYS
+
+    # Built here, handed to the worker by `install`
+    loaded = frappe._dict()
+
+    def load_rate_index():
+        loaded.rate_index = RateIndex()
+        loaded.rate_index.sync()
+
+    def load_adjustments():
+        store = AdjustmentStore(version=get_shared_version())
+        company_currency = get_company_currency()
+        if company_currency and loaded.rate_index:
+            currencies = {c.currency for c in loaded.rate_index.contracts.values()}
+            store.preload_fx(add_days(today(), -fx_days), today(), currencies, company_currency)
+        store.preload_fuel()
+        loaded.store = store
+
+    def load_route_graph():
+        if loaded.rate_index:
+            loaded.route_graph = RouteGraph(loaded.rate_index, get_transfers())
+
+    steps = (
+        ("pricing_rules", get_pricing_rule_matcher),
+        ("item_groups", get_freight_service_groups),
+        ("transfers", get_transfers),
+        ("rate_index", load_rate_index),
+        ("adjustments", load_adjustments),
+        ("route_graph", load_route_graph),
+    )
+
+    report = {
+        "site": frappe.local.site,
+        "started_at": now(),
+        "memory_budget_mb": budget_mb,
+        "steps": [],
+    }
+    started = time.perf_counter()
+    start_rss = get_rss_mb()
+
+    grown = 0
+    for name, load in steps:
+        if grown > budget_mb:
+            report["steps"].append({"step": name, "status": "Skipped"})
+            continue
+
+        step_started = time.perf_counter()
+        step_rss = get_rss_mb()
+        load()
+        rss = get_rss_mb()
+        grown = rss - start_rss
+
+        step = {
+            "step": name,
+            "status": "Loaded",
+            "seconds": round(time.perf_counter() - step_started, 3),
+            "memory_mb": round(rss - step_rss, 1),
+        }
+        if grown > budget_mb:
+            step["over_budget_mb"] = round(grown - budget_mb, 1)
+        report["steps"].append(step)
+
+    install(loaded)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["memory_mb"] = round(get_rss_mb() - start_rss, 1)
+    report["rss_mb"] = round(get_rss_mb(), 1)
+    report["within_budget"] = report["memory_mb"] <= budget_mb
+    if not report["within_budget"]:
+        report["over_budget_mb"] = round(report["memory_mb"] - budget_mb, 1)
+    if loaded.rate_index:
+        report["rate_index"] = loaded.rate_index.stats()
+
+    frappe.cache().hset(WARMUP_REPORT_KEY, worker_id(), report)
+    return report
+
+
+def install(loaded):
+    """
+    Hand what the warmup thread built to this worker, each in one assignment.
+
+    A rate index or adjustment store a request loaded meanwhile is kept; the
+    route graph is only installed with the rate index it was built from.
+    """
+    from freight_forwarding.utils.rate import adjustments, rate_index, routing
+
+    with _lock:
+        if loaded.rate_index and rate_index._rate_index is None:
+            rate_index._rate_index = loaded.rate_index
+            if loaded.route_graph:
+                routing._graph = loaded.route_graph
+
+        store = adjustments._store
+        if loaded.store and (store is None or store.version != loaded.store.version):
+            adjustments._store = loaded.store
+
+
+def get_rss_mb():
+    """Resident memory of this process in MB"""
+    import psutil
+
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_warmup_report():
+    """
+    Warmup reports of all workers since the last migrate.
+
+    Returns:
+        dict: {worker: {site, started_at, seconds, memory_mb, rss_mb,
+            memory_budget_mb, within_budget, over_budget_mb, steps}}
+    """
+    return frappe.cache().hgetall(WARMUP_REPORT_KEY) or {}
+
+
+def after_migrate():
+    """
+    after_migrate hook: drop reports of the previous deploy and rebuild the
+    rate cube, so cold workers can quote from it while they warm up.
+    """
+    from freight_forwarding.utils.rate.rate_cube import enqueue_rate_cube_build
+
+    frappe.cache().delete_value(WARMUP_REPORT_KEY)
+    enqueue_rate_cube_build(force=True)